@@ -0,0 +1,125 @@
+"""
+Micro-benchmark del framing: recepción de respuestas grandes y de notificaciones línea por línea,
+comparando los bucles anteriores (concatenar chunks) con modules.framing (recv_into sobre un buffer preasignado).
+
+    python benchmarks/bench_framing.py [--mb 8] [--repeat 3]
+
+Mide el tiempo (mejor de 'repeat') y, con tracemalloc, el pico de memoria y los bloques nuevos que siguen
+asignados al terminar (columna 'bloques').
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from modules.framing import recv_all, LineReader
+
+def old_recv_all(sock):
+    """Bucle anterior de singletonclient.py: recv de 1 KB y 'buffer += chunk'."""
+    buffer = b""
+    while True:
+        data_chunk = sock.recv(1024)
+        if not data_chunk:
+            break
+        buffer += data_chunk
+    return buffer.decode('utf-8')
+
+
+def old_lines(sock):
+    """Bucle de un lector de líneas con bytes: 'buffer += chunk' y partition por cada línea."""
+    buffer, count = b"", 0
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return count
+        buffer += chunk
+        while b"\n" in buffer:
+            line, _, buffer = buffer.partition(b"\n")
+            json.loads(line)
+            count += 1
+
+
+def new_lines(sock):
+    reader, count = LineReader(), 0
+    while reader.recv_from(sock):
+        for line in reader.lines():
+            json.loads(line)
+            count += 1
+    return count
+
+
+def feed(payload):
+    """Devuelve el extremo lector de un socketpair al que otro hilo le escribe 'payload' y cierra."""
+    reader_side, writer_side = socket.socketpair()
+
+    def run():
+        writer_side.sendall(payload)
+        writer_side.close()
+
+    threading.Thread(target=run, daemon=True).start()
+    return reader_side
+
+
+def measure(fn, payload, repeat):
+    best = None
+    for _ in range(repeat):
+        sock = feed(payload)
+        started = time.perf_counter()
+        fn(sock)
+        elapsed = time.perf_counter() - started
+        sock.close()
+        best = elapsed if best is None else min(best, elapsed)
+
+    sock = feed(payload)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn(sock)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sock.close()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return best, peak, blocks
+
+
+def report(title, payload, candidates, repeat):
+    size_mb = len(payload) / (1024 * 1024)
+    print(f"\n{title} ({size_mb:.1f} MB)")
+    print(f"{'implementación':<22}{'tiempo':>10}{'MB/s':>10}{'pico MB':>10}{'bloques':>10}")
+    for name, fn in candidates:
+        best, peak, blocks = measure(fn, payload, repeat)
+        print(f"{name:<22}{best * 1000:>8.1f}ms{size_mb / best:>10.0f}{peak / (1024 * 1024):>10.1f}{blocks:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de modules.framing")
+    parser.add_argument('--mb', type=float, default=8.0, help='Tamaño aproximado del payload en MB (default: 8)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones, se informa la mejor (default: 3)')
+    args = parser.parse_args()
+
+    row = {"id": "", "calle": "Av. Siempre Viva 742", "ciudad": "Concepción del Uruguay", "cp": "3260"}
+    count = int(args.mb * 1024 * 1024 / len(json.dumps(row)))
+    response = json.dumps([dict(row, id=str(i)) for i in range(count)], indent=4).encode('utf-8')
+    report("Respuesta de 'list' hasta EOF", response,
+           [("anterior (1 KB +=)", old_recv_all), ("framing.recv_all", recv_all)], args.repeat)
+
+    lines = b"".join(json.dumps({"EVENT": "update", "DATA": dict(row, id=str(i))}).encode('utf-8') + b"\n" for i in range(count))
+    report("Notificaciones chicas línea por línea", lines,
+           [("anterior (bytes +=)", old_lines), ("framing.LineReader", new_lines)], args.repeat)
+
+    # Items grandes (ej: un registro con muchos atributos): cada línea ocupa cientos de recv
+    big_item = dict(row, notas="x" * (1024 * 1024))
+    big_lines = b"".join(json.dumps({"EVENT": "update", "DATA": dict(big_item, id=str(i))}).encode('utf-8') + b"\n"
+                         for i in range(max(1, int(args.mb))))
+    report("Notificaciones de 1 MB", big_lines,
+           [("anterior (bytes +=)", old_lines), ("framing.LineReader", new_lines)], args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark de búsquedas por atributo sobre el backend local (tests/local_dynamo.py): 'list' + filtrado en el
+cliente (scan de la tabla entera) contra 'query' por un índice secundario, con tablas de distinto tamaño.
+
+    python benchmarks/bench_query.py [--sizes 10000 100000] [--repeat 5]
+
+Para cada tamaño informa el tiempo (mejor de 'repeat') y los items leídos (ScannedCount). Con 'query' ambos dependen
+del tamaño del resultado (una ciudad, ~50 items), no del de la tabla.
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # backend local de los tests (tests/local_dynamo.py)
+
+from modules.indexes import IndexCatalog, ensure_indexes
+from tests.local_dynamo import LocalDynamoResource
+
+def build_table(size, cities):
+    table = LocalDynamoResource(namespace=f"bench-{size}-").Table('CorporateData')
+    for n in range(size):
+        table.put_item(Item={"id": f"{n:08d}", "ciudad": f"Ciudad {n % cities}", "provincia": f"Provincia {n % 23}",
+                             "cp": f"{1000 + n % 8000}", "domicilio": f"Calle {n} 123"})
+    ensure_indexes(table, IndexCatalog())
+    return table
+
+
+def scan_and_filter(table, ciudad):
+    """Lo que hacía un cliente antes: 'list' (scan completo) y filtrar por ciudad."""
+    response = table.scan()
+    return [item for item in response["Items"] if item.get("ciudad") == ciudad], response["ScannedCount"]
+
+
+def query(table, catalog, ciudad):
+    items, scanned, cursor = [], 0, None
+    while True:
+        plan = catalog.plan({"ciudad": ciudad}, cursor=cursor)
+        response = table.query(**plan)
+        items.extend(response["Items"])
+        scanned += response["ScannedCount"]
+        cursor = catalog.encode_cursor(plan["IndexName"], response.get("LastEvaluatedKey"))
+        if cursor is None:
+            return items, scanned
+
+
+def best_of(repeat, fn):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de list + filtro contra query por índice.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='Tamaños de tabla (default: 10000 100000)')
+    parser.add_argument('--result', type=int, default=50, help='Items por ciudad buscada (default: 50)')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por medición (default: 5)')
+    args = parser.parse_args()
+
+    catalog = IndexCatalog()
+    print(f"{'items':>8}  {'método':<22}{'ms':>10}{'leídos':>10}{'devueltos':>11}")
+    for size in args.sizes:
+        table = build_table(size, max(1, size // args.result))
+        for name, fn in [("list + filtro", lambda: scan_and_filter(table, "Ciudad 7")),
+                         ("query (ciudad-index)", lambda: query(table, catalog, "Ciudad 7"))]:
+            elapsed, (items, scanned) = best_of(args.repeat, fn)
+            print(f"{size:>8}  {name:<22}{elapsed * 1000:>10.2f}{scanned:>10}{len(items):>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark de escalado del modo multi-worker (-w N): levanta run_workers con el backend local y mide
+requests por segundo con varios procesos cliente, para distintas cantidades de workers.
+
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--clients 8] [--requests 300]
+
+Cada request es un 'get' de un item de ~8 KB: el costo lo dominan el parseo, el ruteo y la codificación JSON,
+que es lo que el modo multi-worker reparte entre núcleos. El resultado depende de los núcleos de la máquina
+(ver 'núcleos' en la salida): con menos núcleos que workers no se espera escalado.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import multiprocessing
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # backend local de los tests (tests/local_dynamo.py)
+
+from singletonproxyobserver import run_workers
+from tests.local_dynamo import local_tables
+
+ITEM = {"id": "bench", "domicilio": "Av Del Oeste 123", "notas": ["x" * 80 for _ in range(100)]}
+
+def bench_tables():
+    """tables_factory de los workers: cada worker arranca con su tabla local con el item del benchmark."""
+    tables = local_tables()
+    tables[0].put_item(Item=ITEM)
+    return tables
+
+
+def request(port, data):
+    with socket.create_connection(('127.0.0.1', port), timeout=10) as sock:
+        sock.sendall(json.dumps(data).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        return sock.makefile('rb').read()
+
+
+def client(port, count, results):
+    started = time.perf_counter()
+    for _ in range(count):
+        request(port, {"ACTION": "get", "ID": "bench", "UUID": "bench"})
+    results.put(time.perf_counter() - started)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def measure(workers, clients, count):
+    port = free_port()
+    server = multiprocessing.get_context("spawn").Process(target=run_workers, args=('127.0.0.1', port, workers),
+                             kwargs={"tables_factory": bench_tables, "log_options": {"level": "ERROR"}, "slow_ms": 0})
+    server.start()
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                request(port, {"ACTION": "stats"})
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        time.sleep(2)  # el resto de los workers termina de arrancar (spawn reimporta los módulos)
+
+        context = multiprocessing.get_context("fork")  # los clientes arrancan rápido y este proceso no tiene hilos
+        results = context.Queue()
+        started = time.perf_counter()
+        procs = [context.Process(target=client, args=(port, count, results)) for _ in range(clients)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - started
+        return clients * count / elapsed
+    finally:
+        server.terminate()
+        server.join(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalado de requests/s con la cantidad de workers.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Cantidades de workers (default: 1 2 4)')
+    parser.add_argument('--clients', type=int, default=8, help='Procesos cliente (default: 8)')
+    parser.add_argument('--requests', type=int, default=300, help='Requests por cliente (default: 300)')
+    args = parser.parse_args()
+
+    print(f"núcleos: {os.cpu_count()}")
+    baseline = None
+    for workers in args.workers:
+        rate = measure(workers, args.clients, args.requests)
+        baseline = baseline or rate
+        print(f"{workers:>3} workers: {rate:>8.0f} req/s  (x{rate / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
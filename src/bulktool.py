@@ -0,0 +1,85 @@
+import sys
+import glob
+import os
+import argparse
+import logging
+
+from modules.db_singleton import DatabaseSingleton
+from modules.log_config import setup_logging
+from modules.bulk import export_table, import_files
+from modules.indexes import IndexCatalog, ensure_indexes
+
+logger = logging.getLogger(__name__) # __name__ es: bulktool
+
+def get_table(name): # devuelve la tabla pedida usando el Singleton
+    """Devuelve la tabla 'data' (CorporateData) o 'log' (CorporateLog)."""
+    db = DatabaseSingleton()
+    return db.get_corporate_data_table() if name == 'data' else db.get_corporate_log_table()
+
+def expand_inputs(inputs): # acepta archivos o directorios de un export
+    """Expande directorios (de un export) a sus archivos part-*.jsonl / part-*.jsonl.gz, en orden."""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, 'part-*.jsonl*'))))
+        else:
+            paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exportación/importación masiva de CorporateData / CorporateLog en JSONL y creación de índices."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Exporta una tabla a JSONL con un scan paralelo segmentado.')
+    export_parser.add_argument('-t', '--table', choices=['data', 'log'], required=True, help='Tabla a exportar.')
+    export_parser.add_argument('-o', '--output', required=True, help='Directorio de salida (un archivo por segmento).')
+    export_parser.add_argument('-s', '--segments', type=int, default=4, help='Segmentos del scan paralelo (default: 4)')
+    export_parser.add_argument('-z', '--gzip', action='store_true', help='Comprime la salida con gzip.')
+    export_parser.add_argument('--page-size', type=int, default=1000, help='Items por página de scan (default: 1000)')
+    export_parser.add_argument('-c', '--checkpoint', help='(Opcional) Archivo de checkpoint para retomar el trabajo.')
+
+    import_parser = subparsers.add_parser('import', help='Carga JSONL en una tabla con BatchWriteItem en paralelo.')
+    import_parser.add_argument('-t', '--table', choices=['data', 'log'], required=True, help='Tabla destino.')
+    import_parser.add_argument('-i', '--input', nargs='+', required=True, help='Archivos .jsonl / .jsonl.gz o directorios de un export.')
+    import_parser.add_argument('-w', '--workers', type=int, default=8, help='Hilos escribiendo lotes (default: 8)')
+    import_parser.add_argument('-c', '--checkpoint', help='(Opcional) Archivo de checkpoint para retomar el trabajo.')
+
+    indexes_parser = subparsers.add_parser('indexes', help='Crea en CorporateData los índices secundarios (GSI) que falten.')
+    indexes_parser.add_argument('-c', '--config', help='(Opcional) Archivo JSON con los índices (default: ciudad, provincia+cp, cp)')
+    indexes_parser.add_argument('--no-wait', action='store_true', help='Pide el primer índice que falte y sale sin esperar el backfill.')
+
+    parser.add_argument('-v', '--verbose', action='store_true', help='Activa el modo verboso.')
+    args = parser.parse_args()
+
+    setup_logging(level=logging.DEBUG if args.verbose else logging.INFO, json_format=False, stream=sys.stderr)
+
+    table = get_table(getattr(args, 'table', 'data')) # los índices son siempre de CorporateData
+    try:
+        if args.command == 'indexes':
+            catalog = IndexCatalog.from_file(args.config) if args.config else IndexCatalog()
+            created = ensure_indexes(table, catalog, wait=not args.no_wait)
+            print(f"Índices creados: {', '.join(created) if created else 'ninguno (ya existían)'}")
+            return
+        if args.command == 'export':
+            total = export_table(table, args.output, args.segments, args.gzip, args.checkpoint, args.page_size)
+        else:
+            paths = expand_inputs(args.input)
+            if not paths:
+                print("Error: No se encontraron archivos de entrada.", file=sys.stderr)
+                sys.exit(1)
+            total = import_files(table, paths, args.workers, args.checkpoint)
+    except KeyboardInterrupt:
+        print("\nInterrumpido. Se puede retomar con el mismo --checkpoint.", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        if getattr(args, 'checkpoint', None):
+            print("Se puede retomar con el mismo --checkpoint.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{total} items procesados.")
+
+if __name__ == "__main__":
+    main()
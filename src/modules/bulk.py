@@ -0,0 +1,285 @@
+# src/modules/bulk.py
+import os
+import gzip
+import json
+import time
+import queue
+import base64
+import random
+import threading
+import logging
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from modules.resilience import is_throttling_error
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.bulk'
+
+BATCH_SIZE = 25  # máximo de items por BatchWriteItem
+
+class BulkEncoder(json.JSONEncoder):
+    """
+    Encoder para exportar items de DynamoDB: los Decimal se escriben como números (sin perder precisión),
+    los sets como listas y los binarios en base64.
+    """
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            if obj == obj.to_integral_value():
+                return int(obj)
+            as_float = float(obj)
+            return as_float if Decimal(repr(as_float)) == obj else str(obj)
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj, key=str)
+        if isinstance(obj, (bytes, bytearray)):
+            return base64.b64encode(bytes(obj)).decode('ascii')
+        if hasattr(obj, 'value') and isinstance(obj.value, (bytes, bytearray)):  # boto3 Binary
+            return base64.b64encode(bytes(obj.value)).decode('ascii')
+        return super(BulkEncoder, self).default(obj)
+
+
+def _open_text(path, mode):
+    """Abre un archivo JSONL, comprimido con gzip si termina en '.gz'."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class Checkpoint:
+    """
+    Estado de un trabajo guardado en un archivo JSON. Cada escritura es atómica (archivo temporal + os.replace),
+    así un corte en el medio nunca deja el checkpoint a medio escribir.
+    """
+
+    def __init__(self, path, min_interval=1.0):
+        self.path = path
+        self.min_interval = min_interval  # segundos mínimos entre escrituras no forzadas
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f, parse_float=Decimal)
+            logger.info(f"CHECKPOINT: Retomando desde {path}")
+
+    def update(self, key, value, force=True):
+        """Actualiza una clave. Con force=False solo escribe a disco si pasó 'min_interval' desde la última vez."""
+        with self._lock:
+            self.state[key] = value
+            if force or time.monotonic() - self._last_write >= self.min_interval:
+                self._write()
+
+    def flush(self):
+        """Escribe a disco el estado actual (incluye las actualizaciones no forzadas)."""
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        if not self.path:
+            return
+        self._last_write = time.monotonic()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, cls=BulkEncoder)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.state.get(key, default)
+
+
+def export_table(table, output_dir, segments=4, compress=False, checkpoint_path=None, page_size=1000):
+    """
+    Exporta la tabla a 'output_dir' con un scan paralelo segmentado: cada segmento escribe su propio
+    'part-NNNN.jsonl[.gz]' página por página, así la memoria no depende del tamaño de la tabla.
+    Después de cada página se guarda en el checkpoint la LastEvaluatedKey y el largo del archivo;
+    al retomar se trunca el archivo a ese largo y se sigue desde esa clave (sin filas duplicadas).
+    Devuelve la cantidad total de items exportados.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(checkpoint_path)
+    if checkpoint.get("segments", segments) != segments:
+        raise ValueError(f"El checkpoint es de {checkpoint.get('segments')} segmentos, no de {segments}.")
+    checkpoint.update("segments", segments)
+    suffix = '.jsonl.gz' if compress else '.jsonl'
+
+    def export_segment(segment):
+        path = os.path.join(output_dir, f"part-{segment:04d}{suffix}")
+        state = checkpoint.get(str(segment)) or {"last_key": None, "offset": 0, "count": 0, "done": False}
+        if state["done"]:
+            return state["count"]
+
+        # Se descarta lo escrito después del último checkpoint
+        if os.path.exists(path) and os.path.getsize(path) > state["offset"]:
+            with open(path, 'r+b') as f:
+                f.truncate(state["offset"])
+
+        while True:
+            scan_kwargs = {"Segment": segment, "TotalSegments": segments, "Limit": page_size}
+            if state["last_key"]:
+                scan_kwargs["ExclusiveStartKey"] = state["last_key"]
+            response = _with_backoff(lambda: table.scan(**scan_kwargs))
+            items = response.get('Items', [])
+
+            # Cada página se escribe y se cierra (en gzip queda un 'member' completo) antes del checkpoint
+            if items:
+                with _open_text(path, 'a') as f:
+                    for item in items:
+                        f.write(json.dumps(item, cls=BulkEncoder, ensure_ascii=False))
+                        f.write('\n')
+
+            state = {
+                "last_key": response.get('LastEvaluatedKey'),
+                "offset": os.path.getsize(path) if os.path.exists(path) else 0,
+                "count": state["count"] + len(items),
+                "done": 'LastEvaluatedKey' not in response
+            }
+            checkpoint.update(str(segment), state)
+            if state["done"]:
+                logger.info(f"EXPORT: Segmento {segment} terminado ({state['count']} items).")
+                return state["count"]
+
+    with ThreadPoolExecutor(max_workers=segments, thread_name_prefix="export") as executor:
+        total = sum(executor.map(export_segment, range(segments)))
+    logger.info(f"EXPORT: {total} items exportados en {output_dir}")
+    return total
+
+
+def _with_backoff(fn, max_attempts=10, base_delay=0.05, max_delay=5.0):
+    """Reintenta fn() con backoff exponencial y jitter mientras DynamoDB responda con throttling."""
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except ClientError as e:
+            if not is_throttling_error(e) or attempt == max_attempts - 1:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(random.uniform(0, delay))
+
+
+def write_batch(client, table_name, items, max_attempts=10, base_delay=0.05, max_delay=5.0):
+    """
+    BatchWriteItem de hasta BATCH_SIZE items ya serializados (formato del cliente de bajo nivel), con reintento
+    de los UnprocessedItems y del throttling (backoff exponencial con jitter). Lo usan import_files y el
+    write-behind. Lanza RuntimeError si quedan items sin procesar después de 'max_attempts' intentos.
+    """
+    requests = [{"PutRequest": {"Item": item}} for item in items]
+    for attempt in range(max_attempts):
+        response = _with_backoff(lambda: client.batch_write_item(RequestItems={table_name: requests}))
+        requests = response.get('UnprocessedItems', {}).get(table_name, [])
+        if not requests:
+            return
+        delay = min(max_delay, base_delay * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+    raise RuntimeError(f"{len(requests)} items siguen sin procesarse después de {max_attempts} intentos.")
+
+
+class _Watermark:
+    """
+    Marca hasta qué línea de un archivo está todo escrito. Los lotes terminan en cualquier orden
+    (hay varios workers), pero solo se avanza sobre los lotes consecutivos ya confirmados.
+    """
+
+    def __init__(self, start_line):
+        self.line = start_line  # última línea confirmada
+        self._pending = {}  # secuencia del lote -> última línea del lote
+        self._next_seq = 0  # próximo lote que falta confirmar
+        self._cond = threading.Condition()
+
+    def complete(self, seq, end_line, on_advance):
+        """Confirma un lote. Si la marca avanzó llama a on_advance(linea) (con el candado tomado, en orden)."""
+        with self._cond:
+            self._pending[seq] = end_line
+            advanced = False
+            while self._next_seq in self._pending:
+                self.line = self._pending.pop(self._next_seq)
+                self._next_seq += 1
+                advanced = True
+            if advanced:
+                on_advance(self.line)
+                self._cond.notify_all()
+
+    def wait_for(self, batches, should_stop):
+        """Espera a que se confirmen los primeros 'batches' lotes (o a que should_stop() sea verdadero)."""
+        with self._cond:
+            while self._next_seq < batches and not should_stop():
+                self._cond.wait(0.1)
+
+
+def import_files(table, paths, workers=8, checkpoint_path=None, key_name='id'):
+    """
+    Carga archivos JSONL (o .jsonl.gz) en la tabla con BatchWriteItem usando un pool de 'workers' hilos.
+    El lector va por delante de los workers con una cola acotada (memoria constante) y el checkpoint guarda,
+    por archivo, la última línea cuyo lote y todos los anteriores ya se escribieron.
+    Devuelve la cantidad de items escritos.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    client = table.meta.client  # el client del resource acepta tipos de Python (serializa solo)
+    table_name = table.name
+    jobs = queue.Queue(maxsize=workers * 2)  # lotes pendientes, acotado
+    errors = []
+    written = [0]
+    written_lock = threading.Lock()
+
+    def worker():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            path, watermark, seq, end_line, items = job
+            try:
+                if not errors:  # si otro worker falló no se sigue escribiendo
+                    write_batch(client, table_name, items)
+                    with written_lock:
+                        written[0] += len(items)
+                    watermark.complete(seq, end_line, lambda line: checkpoint.update(path, {"line": line, "done": False}, force=False))
+            except Exception as e:
+                logger.error(f"IMPORT: Error escribiendo lote de {path} (hasta línea {end_line}): {e}")
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, name=f"import-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for path in paths:
+            state = checkpoint.get(path) or {"line": 0, "done": False}
+            if state["done"]:
+                logger.info(f"IMPORT: {path} ya estaba importado, se saltea.")
+                continue
+
+            watermark = _Watermark(state["line"])
+            seq, batch, line_number = 0, {}, 0
+            with _open_text(path, 'r') as f:
+                for line_number, line in enumerate(f, start=1):
+                    if errors:
+                        break
+                    if line_number <= state["line"] or not line.strip():
+                        continue
+                    item = json.loads(line, parse_float=Decimal)
+                    batch[item[key_name]] = item  # BatchWriteItem no acepta la misma clave dos veces en un lote
+                    if len(batch) == BATCH_SIZE:
+                        jobs.put((path, watermark, seq, line_number, list(batch.values())))
+                        seq, batch = seq + 1, {}
+                if batch and not errors:
+                    jobs.put((path, watermark, seq, line_number, list(batch.values())))
+                    seq += 1
+
+            # Se espera a que terminen los lotes de este archivo para marcarlo como completo
+            watermark.wait_for(seq, lambda: bool(errors))
+            if errors:
+                break
+            checkpoint.update(path, {"line": line_number, "done": True})
+            logger.info(f"IMPORT: {path} importado ({line_number} líneas).")
+    finally:
+        for _ in threads:
+            jobs.put(None)
+        for thread in threads:
+            thread.join()
+        checkpoint.flush()
+
+    if errors:
+        raise errors[0]
+    logger.info(f"IMPORT: {written[0]} items escritos en {table_name}.")
+    return written[0]
@@ -0,0 +1,311 @@
+# src/modules/bus.py
+import os
+import queue
+import socket
+import itertools
+import threading
+import logging
+from multiprocessing.connection import Listener, Client
+from modules.idempotency import IdempotencyCache
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.bus'
+
+# Mensajes del bus: tuplas (tipo, ...)
+#   worker -> hub: ("event", evento) | ("idem_begin", request_id, clave, huella) | ("idem_complete", clave, resp_data, status)
+#   hub -> worker: ("event", evento) | ("idem_result", request_id, clave, resultado)
+MAX_LINK_BACKLOG = 100000  # mensajes sin enviar a un worker antes de cortar su conexión
+
+class _WorkerLink:
+    """
+    Conexión del hub con un worker. Los envíos pasan por una cola y un hilo propio,
+    así un worker lento no frena el reenvío a los demás.
+    """
+
+    def __init__(self, conn, on_failure):
+        self.conn = conn
+        self.owned_keys = set()  # claves de idempotencia que este worker está procesando
+        self._outbox = queue.Queue(MAX_LINK_BACKLOG)
+        self._on_failure = on_failure
+        self._closed = False
+        self._close_lock = threading.Lock()  # close() lo pueden llamar a la vez el lector (_drop) y el hub (close)
+        threading.Thread(target=self._sender, name="bus-hub-sender", daemon=True).start()
+
+    def send(self, message):
+        """Encola un mensaje sin bloquear. Devuelve False si el worker acumula demasiados."""
+        try:
+            self._outbox.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def _sender(self):
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError, TypeError) as e:  # TypeError: la conexión se cerró durante el send
+                if not self._closed:
+                    logger.warning(f"BUS: Error reenviando a un worker ({e}). Eliminándolo.")
+                    self._on_failure(self)
+                return
+
+    def close(self):
+        with self._close_lock:  # cerrar dos veces el mismo fd puede cerrar otro socket que reusó el número
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self._outbox.put_nowait(None)  # despierta al hilo
+        except queue.Full:  # el hilo está enviando: falla contra la conexión cerrada y termina
+            pass
+        self.conn.close()
+
+
+class NotificationBusHub:
+    """
+    Hub del bus de notificaciones entre procesos (corre en el proceso padre).
+    Cada worker publica acá sus 'set' exitosos y el hub los reenvía a todos los workers (incluido el que publicó),
+    así todos los observadores reciben todas las actualizaciones en el mismo orden sin importar a qué worker estén conectados.
+    Si se pasa 'sequencer', cada evento pasa por él antes del reenvío (ej: para asignarle la versión del item),
+    en el mismo orden en que se reenvía.
+    Si se pasa 'idempotency' (un IdempotencyCache), el hub es el cache de idempotencia de todos los workers:
+    un reintento que el kernel reparte a otro worker recibe la misma respuesta.
+    """
+
+    def __init__(self, authkey, sequencer=None, idempotency=None):
+        # Solo escucha en loopback, el bus es local al host
+        self._listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        self.address = self._listener.address  # dirección que se pasa a los workers
+        self._workers = []  # _WorkerLink de cada worker
+        self._lock = threading.Lock()  # Candado para proteger la lista y serializar el secuenciado
+        self._sequencer = sequencer  # transforma cada evento antes de reenviarlo
+        self._idempotency = idempotency  # cache compartido (o None)
+        self._closed = False
+        logger.info(f"BUS: Hub escuchando en {self.address[0]}:{self.address[1]}")
+
+    def start(self):
+        """Arranca el hilo que acepta conexiones de los workers."""
+        threading.Thread(target=self._accept_loop, name="bus-hub-accept", daemon=True).start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if not self._closed:
+                    logger.error("BUS: Error aceptando conexión de un worker.", exc_info=True)
+                return
+            except Exception as e:  # authkey inválida u otro error de handshake
+                logger.warning(f"BUS: Conexión rechazada: {e}")
+                continue
+
+            link = _WorkerLink(conn, self._drop)
+            with self._lock:
+                self._workers.append(link)
+                logger.info(f"BUS: Worker conectado. Total: {len(self._workers)}")
+            threading.Thread(target=self._reader, args=(link,), name="bus-hub-reader", daemon=True).start()
+
+    def _reader(self, link):
+        """Lee los mensajes de un worker: eventos (se reenvían a todos) y pedidos de idempotencia."""
+        try:
+            while True:
+                message = link.conn.recv()
+                kind = message[0]
+                if kind == "event":
+                    self._broadcast(message[1])
+                elif kind == "idem_begin":
+                    self._idem_begin(link, *message[1:])
+                elif kind == "idem_complete":
+                    self._idem_complete(link, *message[1:])
+                else:
+                    logger.warning(f"BUS: Mensaje desconocido '{kind}' ignorado.")
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._drop(link)
+
+    def _broadcast(self, event):
+        with self._lock:
+            if self._sequencer is not None:
+                event = self._sequencer(event)
+            # Solo encola, el envío lo hace el hilo de cada worker
+            overflowed = [link for link in self._workers if not link.send(("event", event))]
+        for link in overflowed:
+            logger.error(f"BUS: Un worker tiene {MAX_LINK_BACKLOG} mensajes sin leer. Se corta su conexión.")
+            self._drop(link)
+
+    def _idem_begin(self, link, request_id, key, fingerprint):
+        if self._idempotency is None:
+            link.send(("idem_result", request_id, key, None))
+            return
+        result, in_flight = self._idempotency.try_begin(key, fingerprint)
+        if in_flight is None:
+            self._reply_begin(link, request_id, key, result)
+            return
+        # Hay un original en curso: se espera en otro hilo para no frenar al resto de los mensajes del worker
+        threading.Thread(target=lambda: self._reply_begin(link, request_id, key, self._idempotency.begin(key, fingerprint)),
+                         name="bus-hub-idem-wait", daemon=True).start()
+
+    def _reply_begin(self, link, request_id, key, result):
+        if result is None:  # este worker queda a cargo de la clave
+            with self._lock:
+                link.owned_keys.add(key)
+        link.send(("idem_result", request_id, key, result))
+
+    def _idem_complete(self, link, key, resp_data, status):
+        with self._lock:
+            link.owned_keys.discard(key)
+        if self._idempotency is not None:
+            self._idempotency.complete(key, resp_data, status)
+
+    def _drop(self, link):
+        with self._lock:
+            if link in self._workers:
+                self._workers.remove(link)
+                logger.info(f"BUS: Worker desconectado. Total: {len(self._workers)}")
+            owned, link.owned_keys = link.owned_keys, set()
+        # Un worker caído no va a completar sus requests: los duplicados que esperaban pueden reintentar
+        for key in owned:
+            self._idempotency.complete(key, {"error": "El worker que procesaba el request terminó."}, 500)
+        link.close()
+
+    def close(self):
+        self._closed = True
+        self._listener.close()
+        with self._lock:
+            links, self._workers = self._workers, []
+        for link in links:
+            link.close()
+
+
+class NotificationBusClient:
+    """
+    Extremo del bus en cada worker.
+    'publish' manda un evento al hub y cada evento que llega del hub se entrega a 'on_event'.
+    'request_begin' consulta el cache de idempotencia del hub (ver BusIdempotencyCache).
+    """
+
+    def __init__(self, address, authkey, on_event):
+        self._conn = Client(address, authkey=authkey)
+        self._on_event = on_event  # callback para los eventos recibidos
+        self._send_lock = threading.Lock()  # send() no es thread-safe
+        self._request_ids = itertools.count()
+        self._waiting = {}  # request_id -> [threading.Event, resultado]
+        self._waiting_lock = threading.Lock()
+        logger.info(f"BUS: Conectado al hub en {address[0]}:{address[1]}")
+
+    def start(self):
+        """Arranca el hilo que recibe los mensajes del hub."""
+        threading.Thread(target=self._reader, name="bus-client-reader", daemon=True).start()
+
+    def _send(self, message):
+        with self._send_lock:
+            self._conn.send(message)
+
+    def publish(self, event):
+        """Publica un evento en el bus. Lanza OSError si el hub no está disponible."""
+        self._send(("event", event))
+
+    def complete(self, key, resp_data, status):
+        """Informa al hub la respuesta de un request con idempotencia. Lanza OSError si el hub no está disponible."""
+        self._send(("idem_complete", key, resp_data, status))
+
+    def request_begin(self, key, fingerprint, timeout):
+        """
+        Pide al hub el inicio de un request con idempotencia. Devuelve (True, resultado) con la respuesta
+        del hub (None = este worker queda a cargo) o (False, None) si no respondió en 'timeout' segundos.
+        """
+        request_id = next(self._request_ids)
+        waiter = [threading.Event(), None]
+        with self._waiting_lock:
+            self._waiting[request_id] = waiter
+        try:
+            self._send(("idem_begin", request_id, key, fingerprint))
+            if not waiter[0].wait(timeout):
+                return False, None
+            return True, waiter[1]
+        finally:
+            with self._waiting_lock:
+                self._waiting.pop(request_id, None)
+
+    def _on_begin_result(self, request_id, key, result):
+        with self._waiting_lock:
+            waiter = self._waiting.get(request_id)
+            if waiter is not None:
+                waiter[1] = result
+                waiter[0].set()
+                return
+        if result is None:  # el request ya no espera (timeout): se libera la clave que el hub le asignó
+            self.complete(key, {"error": "Request abandonado."}, 500)
+
+    def _reader(self):
+        try:
+            while True:
+                message = self._conn.recv()
+                if message[0] == "idem_result":
+                    self._on_begin_result(*message[1:])
+                    continue
+                try:
+                    self._on_event(message[1])
+                except Exception as e:
+                    logger.error(f"BUS: Error entregando evento: {e}", exc_info=True)
+        except (EOFError, OSError):
+            logger.error("BUS: Conexión con el hub perdida.")
+
+    def close(self):
+        try:  # shutdown despierta al hilo lector (bloqueado en recv) y el hub recibe EOF enseguida
+            with socket.socket(fileno=os.dup(self._conn.fileno())) as sock:
+                sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._conn.close()
+
+
+class BusIdempotencyCache:
+    """
+    Cache de idempotencia de un worker en modo multi-worker: misma interfaz que IdempotencyCache, pero las
+    respuestas viven en el hub, así un reintento que llega a otro worker (SO_REUSEPORT) no vuelve a escribir.
+    """
+
+    def __init__(self, bus, wait_timeout=15.0):
+        self._bus = bus
+        self.wait_timeout = wait_timeout  # lo que espera el hub a un original en curso (se le suma un margen)
+        self._lock = threading.Lock()
+        self._metrics = {"hub_hits": 0, "hub_misses": 0, "hub_errors": 0}
+
+    make_key = staticmethod(IdempotencyCache.make_key)  # misma clave (UUID, idreq); la huella viaja aparte
+
+    def _count(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def begin(self, key, fingerprint=None):
+        """Igual que IdempotencyCache.begin (el hub compara la huella). Si el hub no responde, 503."""
+        if key is None:
+            return None
+        try:
+            answered, result = self._bus.request_begin(key, fingerprint, self.wait_timeout + 1.0)
+        except OSError as e:
+            logger.error(f"BUS: No se pudo consultar la idempotencia en el hub: {e}")
+            answered, result = False, None
+        if not answered:
+            self._count("hub_errors")
+            return {"error": "No se pudo verificar si el request es un duplicado, reintente más tarde.", "retry_after": 1.0}, 503
+        self._count("hub_misses" if result is None else "hub_hits")
+        return result
+
+    def complete(self, key, resp_data, status):
+        if key is None:
+            return
+        try:
+            self._bus.complete(key, resp_data, status)
+        except OSError as e:
+            logger.error(f"BUS: No se pudo informar la respuesta al hub: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["shared"] = True  # las entradas están en el hub
+        return stats
@@ -2,47 +2,75 @@ import sys
 import uuid
 import json
 import logging
+import threading
+from contextlib import nullcontext
 from datetime import datetime
 from decimal import Decimal
 from botocore.exceptions import ClientError
 from modules.db_singleton import DatabaseSingleton
+from modules.resilience import DynamoGuard, ResilienceError, DeadlineExceeded
+from modules.tracing import span
+from modules.log_config import REQUEST_LOG
+from modules.write_behind import WriteBehindBuffer, WriteBehindFullError
+from modules.indexes import IndexCatalog
 
 # Se obtiene el logger
 logger = logging.getLogger(__name__) # __name__ es: modules.data_proxy
 
+# Tiempo máximo (seg) de cada operación de DynamoDB, aunque el deadline del request sea mayor
+OPERATION_TIMEOUTS = {"get_item": 2.0, "put_item": 3.0, "query": 3.0, "scan": 8.0}
+
 class DataProxy:
     """
     Implementa el Patrón Proxy. Actúa como intermediario para el acceso a la base de datos (obtenida del Singleton) para añadir funcionalidad de auditoría a cada operación.
     """
     
-    def __init__(self): #constructor
+    def __init__(self, hedge_delay=None, write_behind_dir=None, write_behind_interval=0.2, tables=None, indexes=None): #constructor
+        # Deadlines, circuit breaker, limite de concurrencia adaptativo y 'get' hedged alrededor de cada llamada
+        self.guard = DynamoGuard(OPERATION_TIMEOUTS, hedge_delay)
+        self.write_behind = None # buffer de escrituras diferidas (solo si se configura un journal)
+        self.indexes = indexes if indexes is not None else IndexCatalog() # índices secundarios de CorporateData para 'query'
         try: # para manejar errores
-            # 1 Obtener la única instancia de la base de datos
-            db = DatabaseSingleton() # si existe la reutilza, si no crea una nueva
-            self.table_data = db.get_corporate_data_table() # obtener los punteros de la tabla data
-            self.table_log = db.get_corporate_log_table() # obtener los punteros de la tabla log
+            if tables is not None: # tablas inyectadas (ej: backend local de los tests)
+                self.table_data, self.table_log = tables
+            else:
+                # 1 Obtener la única instancia de la base de datos
+                db = DatabaseSingleton() # si existe la reutilza, si no crea una nueva
+                self.table_data = db.get_corporate_data_table() # obtener los punteros de la tabla data
+                self.table_log = db.get_corporate_log_table() # obtener los punteros de la tabla log
+            if write_behind_dir: # relee el journal y baja lo que haya quedado pendiente
+                self.write_behind = WriteBehindBuffer(self.table_data, self.table_log, write_behind_dir, write_behind_interval)
             logger.info("DataProxy inicializado y conectado a tablas.") # imprime info con logger
         except Exception as e:
             # Si el Singleton fallo, esto va a fallar
             logger.error(f"Error fatal al inicializar DataProxy: {e}", exc_info=True)
             sys.exit(1) # sale del programa
 
-    def _log_action(self, client_uuid, session_id, action, details=""): # funcion privada por el _
+    @staticmethod
+    def _audit_item(client_uuid, session_id, action, details=""):
+        """Arma la entrada de auditoría de CorporateLog."""
+        return { #lista de atributos del item
+            'id': str(uuid.uuid4()), # Clave primaria única
+            'CPUid': str(client_uuid),
+            'sessionid': str(session_id),
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'action': action,
+            'details': details
+        }
+
+    def _log_action(self, client_uuid, session_id, action, details="", deadline=None): # funcion privada por el _
         """
         Metodo privado para registrar la acción de auditoría en CorporateLog - Si el log falla, da False. Si no True.
+        Si DynamoDB no está disponible (breaker abierto, deadline vencido) lanza ResilienceError.
         """
         try:
-            item = { #lista de atributos del item
-                'id': str(uuid.uuid4()), # Clave primaria única
-                'CPUid': str(client_uuid),
-                'sessionid': str(session_id),
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'action': action,
-                'details': details
-            }
-            self.table_log.put_item(Item=item) # insertar el item en la tabla log
-            logger.info(f"AUDITORÍA: Acción '{action}' registrada para UUID {client_uuid}.") # impre info con logger
+            item = self._audit_item(client_uuid, session_id, action, details)
+            with span("audit.put_item"):
+                self.guard.call("put_item", lambda: self.table_log.put_item(Item=item), deadline) # insertar el item en la tabla log
+            logger.info("AUDITORÍA: Acción '%s' registrada para UUID %s.", action, client_uuid, extra=REQUEST_LOG) # impre info con logger
             return True # si esta bien devuelve True
+        except ResilienceError: # lo resuelve quien llamó (503/504)
+            raise
         except ClientError as e: # error de aws
             # 2 Error de auditoría
             logger.error(f"FALLO DE AUDITORÍA - No se pudo registrar la acción '{action}': {e}")
@@ -51,41 +79,96 @@ class DataProxy:
             logger.error(f"FALLO DE AUDITORÍA INESPERADO - No se pudo registrar la acción '{action}': {e}", exc_info=True)
             return False
 
-    def get_item(self, item_id, client_uuid, session_id): # funcion que recibe item: id,uuid,sessionID
-        # 2 Lógica de auditoría
-        if not self._log_action(client_uuid, session_id, "get", f"ID: {item_id}"):
-            # Si el log falla, no se sigue. Se devuelve un error de servidor.
-            return {"error": "Fallo interno de auditoría"}, 500
-        
-        # Si el log funciona, se sigue
+    def get_item(self, item_id, client_uuid, session_id, deadline=None): # funcion que recibe item: id,uuid,sessionID
         try:
-            response = self.table_data.get_item(Key={'id': item_id}) # obtiene el item de la tabla data
+            # 2 Lógica de auditoría
+            if not self._log_action(client_uuid, session_id, "get", f"ID: {item_id}", deadline):
+                # Si el log falla, no se sigue. Se devuelve un error de servidor.
+                return {"error": "Fallo interno de auditoría"}, 500
+            
+            # Una escritura diferida todavía no está en la tabla, pero ya se le confirmó al cliente
+            if self.write_behind is not None:
+                pending = self.write_behind.pending(item_id)
+                if pending is not None:
+                    return pending, 200
+            
+            # Si el log funciona, se sigue (lectura hedged si está activada)
+            with span("data.get_item"):
+                response = self.guard.call("get_item", lambda: self.table_data.get_item(Key={'id': item_id}), deadline, hedge=True) # obtiene el item de la tabla data
             
             if 'Item' in response: # si encuentra el item
                 return response['Item'], 200 # bien
             else:
                 return {"error": f"Item con ID '{item_id}' no encontrado."}, 404 # No encontro
         
+        except ResilienceError as e: # breaker abierto, deadline vencido o sin concurrencia
+            return e.to_response()
         except ClientError as e: # error de aws
             logger.error(f"Error de AWS en get_item: {e}")
             return {"error": e.response['Error']['Message']}, 500 # error de servidor
 
-    def set_item(self, item_data, client_uuid, session_id): # funcion que recibe item: data, uudid, sessionID
+    def set_item(self, item_data, client_uuid, session_id, deadline=None, write_behind=False, on_late_write=None): # funcion que recibe item: data, uudid, sessionID
+        """
+        Audita y escribe el item. Con write_behind=True (y un journal configurado) la escritura y su auditoría
+        quedan en el WriteBehindBuffer y se responde 202 enseguida; sino se escribe en DynamoDB y se responde 200.
+        Si el put_item ya se envió y vence el deadline, responde 504 con "outcome": "unknown": el put sigue en curso
+        y cuando termina se llama a on_late_write(resp_data, status) con el resultado real (200 o 500).
+        """
         # 1 Obtener el ID del item
         item_id = item_data.get('id', 'ID_NO_PROVISTO')
         
-        # 2 Lógica de auditoría
-        if not self._log_action(client_uuid, session_id, "set", f"ID: {item_id}"): # si el log falla
-            return {"error": "Fallo interno de auditoría"}, 500 # error de servidor
+        # Los atributos que son clave de un índice secundario tienen tipo fijo (DynamoDB rechazaría el item con 500)
+        try:
+            self.indexes.check_item(item_data)
+        except ValueError as e:
+            return {"error": str(e)}, 400 # bad request
+        
+        if write_behind and self.write_behind is not None: # escritura diferida
+            try:
+                with span("write_behind.journal"):
+                    self.write_behind.submit(item_data, self._audit_item(client_uuid, session_id, "set", f"ID: {item_id} (write-behind)"))
+                return item_data, 202 # aceptado, se escribe en el próximo flush
+            except WriteBehindFullError as e: # DynamoDB no da abasto con lo pendiente
+                logger.warning(f"Buffer de escrituras lleno, 'set' rechazado (ID: {item_id}): {e}")
+                return {"error": "Demasiadas escrituras pendientes, reintente más tarde.", "retry_after": 1.0}, 503
+            except (TypeError, ValueError) as e: # error de datos
+                return {"error": f"Datos JSON o formato inválido. {e}"}, 400 # bad request
+            except OSError as e: # no se pudo escribir el journal
+                logger.error(f"Error escribiendo el journal de write-behind (ID: {item_id}): {e}")
+                return {"error": "Error interno inesperado"}, 500
         
         # 3 Manejo de errores para set_item
         try:
+            # 2 Lógica de auditoría
+            if not self._log_action(client_uuid, session_id, "set", f"ID: {item_id}", deadline): # si el log falla
+                return {"error": "Fallo interno de auditoría"}, 500 # error de servidor
+            
             # Conversión de float a Decimal para DynamoDB
-            item_data_decimal = json.loads(json.dumps(item_data), parse_float=Decimal) # convierte los float a decimal
+            with span("decimal_conversion"):
+                item_data_decimal = json.loads(json.dumps(item_data), parse_float=Decimal) # convierte los float a decimal
             
-            self.table_data.put_item(Item=item_data_decimal) # inserta el item en la tabla data
+            # Un valor diferido anterior de la misma clave no debe pisar a este: se descarta y, si se está bajando,
+            # se espera a que termine ese flush (ninguno corre hasta que termina el put)
+            superseding = self.write_behind.superseding(item_id, deadline.remaining() if deadline else None) if self.write_behind else nullcontext()
+            with superseding, span("data.put_item"):
+                try:
+                    self.guard.call("put_item", lambda: self.table_data.put_item(Item=item_data_decimal), deadline) # inserta el item en la tabla data
+                except DeadlineExceeded as e:
+                    if not e.pending: # no llegó a enviarse
+                        raise
+                    self._watch_late_write(item_id, item_data, e.pending, on_late_write)
+                    resp_data, status = e.to_response()
+                    resp_data["outcome"] = "unknown" # la escritura puede aplicarse igual
+                    return resp_data, status
             return item_data, 200 # bien
         
+        except ResilienceError as e: # breaker abierto, deadline vencido o sin concurrencia
+            return e.to_response()
+        
+        except TimeoutError as e: # un flush de write-behind de la misma clave no terminó antes del deadline
+            logger.warning(f"'set' síncrono sin ejecutar (ID: {item_id}): {e}")
+            return {"error": "El servidor no pudo completar la operación a tiempo."}, 504 # no se escribió
+        
         except (json.JSONDecodeError, TypeError) as e: # error de datos
             logger.warning(f"Error de conversión de datos en set_item (ID: {item_id}): {e}") # logger warning
             return {"error": f"Datos JSON o formato inválido. {e}"}, 400 # bad request
@@ -99,35 +182,108 @@ class DataProxy:
             return {"error": "Error interno inesperado"}, 500 # error de servidor
 
 
-    def list_items(self, client_uuid, session_id): # funcion que recibe item: uuid, sessionID
-        # 2. Lógica de auditoría
-        if not self._log_action(client_uuid, session_id, "list"): # si el log falla
-            return {"error": "Fallo interno de auditoría"}, 500 # error del servidor
-        
+    @staticmethod
+    def _watch_late_write(item_id, item_data, futures, on_late_write):
+        """Espera (sin bloquear) al put_item abandonado por el deadline e informa su resultado real."""
+        lock = threading.Lock()
+        remaining = [len(futures)] # con hedging puede haber más de un put en curso, cuenta el primero que sale bien
+
+        def on_done(future):
+            with lock:
+                if remaining[0] == 0: # ya se informó
+                    return
+                error = future.exception()
+                remaining[0] = 0 if error is None else remaining[0] - 1
+                if remaining[0] != 0:
+                    return
+            if error is None:
+                logger.warning(f"El 'set' del ID {item_id} se aplicó en DynamoDB después del deadline (ya se respondió 504).")
+                result = item_data, 200
+            else:
+                logger.warning(f"El 'set' del ID {item_id} abandonado por el deadline falló: {error}")
+                result = {"error": "La escritura no se aplicó."}, 500
+            if on_late_write is not None:
+                try:
+                    on_late_write(*result)
+                except Exception as e:
+                    logger.error(f"Error informando el resultado tardío del 'set' (ID: {item_id}): {e}", exc_info=True)
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def list_items(self, client_uuid, session_id, deadline=None): # funcion que recibe item: uuid, sessionID
         try:
+            # 2. Lógica de auditoría
+            if not self._log_action(client_uuid, session_id, "list", deadline=deadline): # si el log falla
+                return {"error": "Fallo interno de auditoría"}, 500 # error del servidor
+            
             # table.scan() lee la tabla entera - costoso para tablas grandes. Se usa para cumplir el Listado database completo.
-            response = self.table_data.scan()
+            with span("data.scan"):
+                response = self.guard.call("scan", self.table_data.scan, deadline)
             
             # Devolvemos Items si existe, o sino una lista vacía
             return (response.get('Items', []), 200)
         
+        except ResilienceError as e: # breaker abierto, deadline vencido o sin concurrencia
+            return e.to_response()
         except ClientError as e: # error de aws 
             logger.error(f"Error de AWS en list_items: {e}") # logger error
             return {"error": e.response['Error']['Message']}, 500 # error del servidor
         
-    def list_logs(self, client_uuid, session_id):
-        # 1. Auditamos que alguien está pidiendo ver los logs
-        # (Sí, auditamos la auditoría)
-        if not self._log_action(client_uuid, session_id, "list_logs", "Revisando CorporateLog"):
-            return {"error": "Fallo interno de auditoría"}, 500
+    def query_items(self, where, limit, cursor, client_uuid, session_id, deadline=None):
+        """
+        Busca items por atributos con un índice secundario (igualdad sobre la clave de partición y rango opcional
+        sobre la de orden), una página por vez. Lee solo los items de la página, no la tabla entera.
+        Devuelve {"items", "count", "index", "cursor"}; 'cursor' es None en la última página.
+        """
+        try:
+            query = self.indexes.plan(where, limit, cursor) # elige el índice y arma la KeyConditionExpression
+        except ValueError as e: # WHERE sin índice, tipos, LIMIT o CURSOR inválidos
+            return {"error": str(e)}, 400 # bad request
+
+        try:
+            details = f"INDEX: {query['IndexName']} WHERE: {json.dumps(where, ensure_ascii=False, default=str)}"
+            if not self._log_action(client_uuid, session_id, "query", details, deadline): # si el log falla
+                return {"error": "Fallo interno de auditoría"}, 500 # error del servidor
+            
+            # Los GSI son eventualmente consistentes: un 'set' recién hecho (o diferido) puede tardar en aparecer
+            with span("data.query"):
+                response = self.guard.call("query", lambda: self.table_data.query(**query), deadline)
+            
+            return {
+                "items": response.get('Items', []),
+                "count": response.get('Count', 0),
+                "index": query['IndexName'],
+                "cursor": self.indexes.encode_cursor(query['IndexName'], response.get('LastEvaluatedKey'))
+            }, 200
         
+        except ResilienceError as e: # breaker abierto, deadline vencido o sin concurrencia
+            return e.to_response()
+        except ClientError as e: # error de aws (ej: el índice todavía no existe)
+            logger.error(f"Error de AWS en query_items ({query['IndexName']}): {e}") # logger error
+            return {"error": e.response['Error']['Message']}, 500 # error del servidor
+        
+    def list_logs(self, client_uuid, session_id, deadline=None):
         try:
+            # 1. Auditamos que alguien está pidiendo ver los logs
+            # (Sí, auditamos la auditoría)
+            if not self._log_action(client_uuid, session_id, "list_logs", "Revisando CorporateLog", deadline):
+                return {"error": "Fallo interno de auditoría"}, 500
+            
             # 2. Hacemos un scan() PERO a la tabla de logs
-            response = self.table_log.scan()
+            with span("log.scan"):
+                response = self.guard.call("scan", self.table_log.scan, deadline)
             
             # 3. Devolvemos los logs
             return (response.get('Items', []), 200)
         
+        except ResilienceError as e: # breaker abierto, deadline vencido o sin concurrencia
+            return e.to_response()
         except ClientError as e:
             logger.error(f"Error de AWS en list_logs: {e}")
-            return {"error": e.response['Error']['Message']}, 500
\ No newline at end of file
+            return {"error": e.response['Error']['Message']}, 500
+
+    def close(self):
+        """Baja a DynamoDB las escrituras diferidas pendientes (al cerrar el servidor)."""
+        if self.write_behind is not None:
+            self.write_behind.close()
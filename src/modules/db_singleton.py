@@ -3,19 +3,16 @@ import boto3
 import sys
 import logging
 import threading
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 
-# - Configuración del Logging
-# level=logging.INFO muestra mensajes informativos y de error.
-# format= define cómo se ve cada línea de log.
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    stream=sys.stdout  # Se envian los logs a la consola
-)
+# La configuración del logging (cola + hilo escritor, JSON) la hace el punto de entrada con modules.log_config.setup_logging
 # Se obtiene un logger específico para este archivo.
 logger = logging.getLogger(__name__) # __name__ = modules.db_singleton
 
+# Timeouts y reintentos acotados de botocore, así una llamada no supera el deadline del request (ver modules.resilience)
+BOTO_CONFIG = Config(connect_timeout=2, read_timeout=5, retries={'max_attempts': 3, 'mode': 'standard'})
+
 class DatabaseSingleton:
     """
     Implementa un Singleton thread-safe para la conexión a DynamoDB.
@@ -56,7 +53,7 @@ class DatabaseSingleton:
         
         # 3 try/except
         try:
-            self.dynamodb = boto3.resource('dynamodb')
+            self.dynamodb = boto3.resource('dynamodb', config=BOTO_CONFIG)
             
             # Cargar punteros de las tablas
             self.table_corporate_data = self.dynamodb.Table('CorporateData')
@@ -0,0 +1,222 @@
+# src/modules/framing.py
+import json
+import codecs
+from modules.tracing import span
+
+DEFAULT_MAX_MESSAGE = 16 * 1024 * 1024  # tope por defecto de un mensaje (bytes)
+MIN_RECV = 16 * 1024  # espacio libre mínimo antes de cada recv_into
+GROWTH_LIMIT = 1024 * 1024  # hasta este tamaño el buffer duplica su capacidad; después crece un 25%
+
+_CLOSING = (ord('}'), ord(']'))
+_WHITESPACE = b" \t\r\n"
+
+class MessageTooLarge(Exception):
+    """El mensaje supera el tamaño máximo permitido."""
+
+
+class RecvBuffer:
+    """
+    Buffer de recepción preasignado. Los datos se reciben con recv_into directamente en un bytearray
+    (sin crear un objeto bytes por chunk) que crece hasta 'max_size': duplica su tamaño hasta GROWTH_LIMIT
+    y después crece un 25%, así la capacidad sobrante de un mensaje grande queda acotada.
+    Lo ya consumido se descarta moviendo lo pendiente al principio, sin reasignar.
+    """
+
+    def __init__(self, initial_size=64 * 1024, max_size=DEFAULT_MAX_MESSAGE):
+        self.max_size = max_size  # bytes pendientes como máximo (lanza MessageTooLarge)
+        self._buf = bytearray(initial_size)
+        self._start = 0  # inicio de los datos sin consumir
+        self._end = 0  # fin de los datos recibidos
+
+    def __len__(self):
+        return self._end - self._start
+
+    def recv_from(self, sock, min_free=MIN_RECV):
+        """Hace un recv_into sobre el espacio libre. Devuelve los bytes recibidos (0 = el otro extremo cerró)."""
+        if len(self._buf) - self._end < min_free:
+            self._make_room(min_free)
+        view = memoryview(self._buf)
+        try:
+            with view[self._end:] as target:
+                received = sock.recv_into(target)
+        finally:
+            view.release()  # un bytearray con vistas exportadas no se puede redimensionar
+        self._end += received
+        if len(self) > self.max_size:
+            raise MessageTooLarge(f"El mensaje supera el máximo de {self.max_size} bytes.")
+        return received
+
+    def _compact(self):
+        """Mueve lo pendiente al principio del buffer."""
+        if self._start:
+            pending = len(self)
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._shift(self._start)
+            self._start, self._end = 0, pending
+
+    def _make_room(self, min_free):
+        pending = len(self)
+        self._compact()
+        free = len(self._buf) - self._end
+        if free < min_free:
+            size = len(self._buf)
+            step = size if size < GROWTH_LIMIT else size // 4
+            new_size = min(max(size + step, pending + min_free), self.max_size + min_free)
+            self._buf.extend(bytes(new_size - size))
+
+    def _shift(self, offset):
+        """Las subclases ajustan sus índices cuando se compacta el buffer."""
+
+    def last_byte(self):
+        """Último byte que no es espacio en blanco, o None."""
+        index = self._end - 1
+        while index >= self._start and self._buf[index] in _WHITESPACE:
+            index -= 1
+        return self._buf[index] if index >= self._start else None
+
+    def text(self, start=None, end=None):
+        """Decodifica como UTF-8 los datos pendientes (o una parte) con una sola copia."""
+        start = self._start if start is None else start
+        end = self._end if end is None else end
+        view = memoryview(self._buf)
+        try:
+            with view[start:end] as data:
+                return str(data, 'utf-8')
+        finally:
+            view.release()
+
+    def consume(self, count=None):
+        """Descarta 'count' bytes pendientes (todos si es None)."""
+        self._start = self._end if count is None else self._start + count
+        if self._start == self._end:
+            self._start = self._end = 0
+
+
+class LineReader(RecvBuffer):
+    """
+    Lector de mensajes separados por '\\n' (suscripciones). La búsqueda del separador sigue desde donde
+    quedó la vez anterior, así una línea que llega en muchos chunks no se vuelve a recorrer entera.
+    El buffer no crece por una línea larga: si no queda lugar y lo pendiente no tiene '\\n', se decodifica
+    (decodificador incremental, un carácter UTF-8 partido no se rompe) y se guarda aparte como texto hasta
+    que llega el final de la línea. Así el pico de memoria de una línea grande es su texto en pedazos más
+    el texto unido, sin un buffer con capacidad sobrante.
+    """
+
+    def __init__(self, initial_size=8 * 1024, max_size=DEFAULT_MAX_MESSAGE):
+        super().__init__(initial_size, max_size)
+        self._scan = 0  # hasta dónde ya se buscó el separador
+        self._partial = []  # texto ya decodificado de la línea en curso que no entró en el buffer
+        self._partial_bytes = 0  # bytes que ocupaba ese texto (para el tope de 'max_size')
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    def _shift(self, offset):
+        self._scan -= offset
+
+    def recv_from(self, sock, min_free=MIN_RECV):
+        received = super().recv_from(sock, min(min_free, len(self._buf) // 2))
+        if self._partial_bytes + len(self) > self.max_size:
+            raise MessageTooLarge(f"El mensaje supera el máximo de {self.max_size} bytes.")
+        return received
+
+    def _make_room(self, min_free):
+        self._compact()
+        if len(self._buf) - self._end >= min_free:
+            return
+        if self._buf.find(b"\n", self._start, self._end) < 0:  # todo lo pendiente es de una sola línea
+            view = memoryview(self._buf)
+            try:
+                with view[:self._end] as data:
+                    self._partial.append(self._decoder.decode(data))
+            finally:
+                view.release()
+            self._partial_bytes += self._end
+            self._start = self._end = self._scan = 0
+            return
+        super()._make_room(min_free)  # hay líneas sin leer (no se llamó a lines()): se agranda
+
+    def lines(self):
+        """
+        Devuelve (y consume) las líneas completas recibidas como texto, sin el '\\n'. Todas las líneas de
+        un recv se decodifican juntas (el '\\n' nunca es parte de un carácter UTF-8) y se separan después.
+        Los bytes que no son UTF-8 válido se reemplazan por U+FFFD (el JSON de esa línea falla o queda con el reemplazo).
+        """
+        buf, start, end = self._buf, self._start, self._end
+        last = buf.rfind(b"\n", max(self._scan, start), end)
+        if last < 0:
+            self._scan = end
+            return []
+        lines = []
+        view = memoryview(buf)
+        try:
+            if self._partial:  # el principio de la primera línea ya está decodificado
+                first = buf.find(b"\n", start, end)
+                with view[start:first] as data:
+                    self._partial.append(self._decoder.decode(data, final=True))
+                lines.append("".join(self._partial))
+                self._partial, self._partial_bytes = [], 0
+                self._decoder.reset()
+                start = first + 1
+            if start <= last:
+                with view[start:last] as data:
+                    lines.extend(str(data, 'utf-8', 'replace').split("\n"))
+        finally:
+            view.release()  # un bytearray con vistas exportadas no se puede redimensionar
+        self._start, self._scan = last + 1, end
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+        return lines
+
+
+def _incomplete(error, text):
+    """Distingue un JSON cortado (faltan datos) de uno inválido."""
+    return error.pos >= len(text.rstrip()) or error.msg.startswith("Unterminated string")
+
+
+def recv_json(sock, max_size=DEFAULT_MAX_MESSAGE, initial_size=4096):
+    """
+    Lee un mensaje JSON sin delimitador (el protocolo de los requests): recibe hasta que los datos terminan
+    en '}' o ']' y forman un JSON completo, sin esperar a que el cliente cierre.
+    Devuelve el objeto, o None si el cliente cerró sin enviar nada. Lanza json.JSONDecodeError si el JSON es
+    inválido y MessageTooLarge si supera 'max_size'.
+    """
+    buffer = RecvBuffer(initial_size, max_size)
+    while True:
+        with span("recv"):
+            received = buffer.recv_from(sock)
+        if received == 0:  # el cliente cerró: lo que haya es el mensaje entero
+            if not len(buffer):
+                return None
+            with span("parse"):
+                return json.loads(buffer.text())
+        if buffer.last_byte() in _CLOSING:
+            text = buffer.text()
+            with span("parse"):
+                try:
+                    return json.loads(text)
+                except json.JSONDecodeError as e:
+                    if not _incomplete(e, text):
+                        raise
+
+
+def recv_all(sock, max_size=DEFAULT_MAX_MESSAGE, chunk_size=MIN_RECV):
+    """
+    Recibe hasta que el otro extremo cierra (las respuestas del servidor) y devuelve el texto decodificado.
+    Cada chunk se recibe con recv_into en un buffer fijo y se decodifica apenas llega (decodificador incremental:
+    un carácter UTF-8 partido entre dos recv no se rompe). No hay buffer que crezca: el pico de memoria es
+    el texto en pedazos más el texto unido, como decodificar una sola vez los bytes completos.
+    """
+    buffer = bytearray(chunk_size)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pieces, total = [], 0
+    with memoryview(buffer) as view:
+        while True:
+            received = sock.recv_into(view)
+            if not received:
+                break
+            total += received
+            if total > max_size:
+                raise MessageTooLarge(f"El mensaje supera el máximo de {max_size} bytes.")
+            with view[:received] as data:
+                pieces.append(decoder.decode(data))
+    pieces.append(decoder.decode(b"", final=True))
+    return "".join(pieces)
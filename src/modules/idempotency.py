@@ -0,0 +1,152 @@
+# src/modules/idempotency.py
+import time
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.idempotency'
+
+# Campos del request que no son parte de la operación: no cambian la huella
+FINGERPRINT_EXCLUDED = ("ACTION", "UUID", "DEADLINE_MS")
+
+
+def request_fingerprint(data):
+    """
+    Huella del contenido de un request: sha256 del JSON canónico sin ACTION/UUID/DEADLINE_MS.
+    Dos requests con el mismo idreq y distinta huella son operaciones distintas, no un reintento.
+    """
+    body = {k: v for k, v in data.items() if k not in FINGERPRINT_EXCLUDED}
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _fingerprint_conflict(stored, fingerprint):
+    """True si el idreq ya se usó con otro contenido (None = sin huella, no se compara)."""
+    return stored is not None and fingerprint is not None and stored != fingerprint
+
+class IdempotencyCache:
+    """
+    Almacén de idempotencia acotado y con expiración (TTL).
+    Guarda la respuesta de cada escritura indexada por (UUID del cliente, idreq), así un cliente que reintenta
+    después de un timeout recibe la misma respuesta sin volver a auditar, escribir ni notificar.
+    Junto a cada clave se guarda la huella del request: el mismo idreq con otro contenido responde 422.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=300.0, wait_timeout=15.0):
+        self.max_entries = max_entries  # cantidad máxima de respuestas guardadas
+        self.ttl_seconds = ttl_seconds  # tiempo de vida de cada respuesta
+        self.wait_timeout = wait_timeout  # cuánto espera un duplicado a que termine el original
+        self._entries = OrderedDict()  # clave -> (expira_en, resp_data, status, huella), en orden de inserción
+        self._pending = {}  # clave -> (threading.Event, huella) de los requests que se están procesando
+        self._lock = threading.Lock()  # Candado para proteger el diccionario y las métricas
+        self._metrics = {
+            "hits": 0,  # duplicados respondidos desde el cache
+            "in_flight_hits": 0,  # duplicados que esperaron al request original
+            "misses": 0,  # requests nuevos
+            "evictions": 0,  # entradas sacadas por límite de tamaño
+            "expirations": 0,  # entradas sacadas por TTL
+            "conflicts": 0,  # mismo idreq con otro contenido (422)
+        }
+        logger.info(f"IdempotencyCache inicializado (max: {max_entries}, TTL: {ttl_seconds}s).")
+
+    @staticmethod
+    def make_key(client_uuid, idreq):
+        """Arma la clave (UUID, idreq). Si el request no trae 'idreq' devuelve None (no se cachea)."""
+        if idreq is None or idreq == "":
+            return None
+        return (str(client_uuid), str(idreq))
+
+    def _purge_expired(self, now):
+        """Saca las entradas vencidas. Como el orden es de inserción y el TTL es fijo, las vencidas están al principio."""
+        while self._entries:
+            key, (expires_at, _, _, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            self._metrics["expirations"] += 1
+
+    def begin(self, key, fingerprint=None):
+        """
+        Marca el inicio de un request. Devuelve (resp_data, status) si es un duplicado ya respondido
+        (o 422 si el idreq ya se usó con otra huella), o None si el llamador debe procesarlo
+        (y después llamar a complete()).
+        """
+        if key is None:
+            return None
+
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            result, event = self._try_begin(key, fingerprint, waited)
+            if event is None:
+                return result
+
+            # Hay un request original en curso con la misma clave, esperamos a que termine
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not event.wait(remaining):
+                return {"error": "Request duplicado todavía en proceso, reintente más tarde."}, 409
+            waited = True
+
+    def try_begin(self, key, fingerprint=None):
+        """
+        Como begin() pero sin esperar (lo usa el hub del bus): devuelve (respuesta o None, None),
+        o (None, event) si hay un request original en curso con la misma clave.
+        """
+        if key is None:
+            return None, None
+        return self._try_begin(key, fingerprint, False)
+
+    def _try_begin(self, key, fingerprint, waited):
+        with self._lock:
+            self._purge_expired(time.monotonic())
+
+            entry = self._entries.get(key)
+            if entry is not None:  # duplicado ya respondido
+                if _fingerprint_conflict(entry[3], fingerprint):
+                    return self._conflict(key), None
+                self._metrics["in_flight_hits" if waited else "hits"] += 1
+                return (entry[1], entry[2]), None
+
+            pending = self._pending.get(key)
+            if pending is None:  # request nuevo, el llamador queda a cargo
+                self._pending[key] = (threading.Event(), fingerprint)
+                self._metrics["misses"] += 1
+                return None, None
+            if _fingerprint_conflict(pending[1], fingerprint):  # no tiene sentido esperar al original
+                return self._conflict(key), None
+            return None, pending[0]
+
+    def _conflict(self, key):
+        """Respuesta para un idreq reutilizado con otro contenido (se llama con el lock tomado)."""
+        self._metrics["conflicts"] += 1
+        logger.warning(f"Idempotencia: idreq {key[1]} del cliente {key[0]} reutilizado con otro contenido.")
+        return {"error": "El idreq ya se usó con otro contenido. Use un idreq nuevo para otra operación."}, 422
+
+    def complete(self, key, resp_data, status):
+        """
+        Registra la respuesta del request original y despierta a los duplicados que esperaban.
+        Los errores de servidor (5xx) no se guardan para que el reintento pueda funcionar.
+        """
+        if key is None:
+            return
+
+        with self._lock:
+            event, fingerprint = self._pending.pop(key, (None, None))
+            if status < 500:
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, resp_data, status, fingerprint)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._metrics["evictions"] += 1
+
+        if event is not None:
+            event.set()
+
+    def stats(self):
+        """Devuelve una copia de las métricas del cache."""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["entries"] = len(self._entries)
+            stats["pending"] = len(self._pending)
+        return stats
@@ -0,0 +1,225 @@
+# src/modules/indexes.py
+import json
+import time
+import base64
+import binascii
+import logging
+from decimal import Decimal, InvalidOperation
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.indexes'
+
+TABLE_KEY = "id"  # clave de partición de CorporateData
+
+# Índices secundarios de CorporateData (GSI en DynamoDB). 'cp' es string en los datos (ej: "3260").
+# Con 'provincia-cp-index' se busca por provincia sola o por provincia y un rango de códigos postales.
+DEFAULT_INDEXES = [
+    {"name": "ciudad-index", "partition_key": "ciudad"},
+    {"name": "provincia-cp-index", "partition_key": "provincia", "sort_key": "cp"},
+    {"name": "cp-index", "partition_key": "cp"},
+]
+
+DEFAULT_QUERY_LIMIT = 100  # items por página si el request no trae LIMIT
+MAX_QUERY_LIMIT = 1000
+
+# Condiciones sobre la clave de orden (mismos nombres que los métodos de boto3.dynamodb.conditions.Key)
+RANGE_OPERATORS = ("eq", "lt", "lte", "gt", "gte", "between", "begins_with")
+
+
+def _matches_type(value, attribute_type):
+    """True si 'value' se guarda en DynamoDB con el tipo 'S' o 'N' del índice."""
+    if attribute_type == "S":
+        return isinstance(value, str)
+    return isinstance(value, (int, Decimal)) and not isinstance(value, bool)
+
+
+class IndexSpec:
+    """Un índice secundario: clave de partición (igualdad) y, opcional, clave de orden (rango). Tipos 'S' o 'N'."""
+
+    def __init__(self, name, partition_key, sort_key=None, types=None):
+        self.name = name
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.types = {attribute: "S" for attribute in self.attributes}
+        self.types.update(types or {})  # ej: {"cp": "N"}
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec["name"], spec["partition_key"], spec.get("sort_key"), spec.get("types"))
+
+    @property
+    def attributes(self):
+        return [self.partition_key] + ([self.sort_key] if self.sort_key else [])
+
+    def key_schema(self):
+        schema = [{"AttributeName": self.partition_key, "KeyType": "HASH"}]
+        if self.sort_key:
+            schema.append({"AttributeName": self.sort_key, "KeyType": "RANGE"})
+        return schema
+
+    def attribute_definitions(self):
+        return [{"AttributeName": attribute, "AttributeType": self.types[attribute]} for attribute in self.attributes]
+
+    def serves(self, where):
+        """True si el índice resuelve el WHERE: igualdad sobre la clave de partición y, a lo sumo, la de orden."""
+        value = where.get(self.partition_key)
+        return value is not None and not isinstance(value, dict) and set(where) <= set(self.attributes)
+
+
+class IndexCatalog:
+    """
+    Índices declarados para CorporateData. Traduce el WHERE de un request 'query' a los parámetros de
+    Table.query (índice, KeyConditionExpression, Limit, ExclusiveStartKey) y arma/lee el cursor de paginación.
+    """
+
+    def __init__(self, specs=None):
+        specs = DEFAULT_INDEXES if specs is None else specs
+        self.specs = [spec if isinstance(spec, IndexSpec) else IndexSpec.from_dict(spec) for spec in specs]
+        self._by_name = {spec.name: spec for spec in self.specs}
+
+    @classmethod
+    def from_file(cls, path):
+        """Crea el catálogo leyendo una lista de índices de un archivo JSON (ver config/indexes.json)."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def names(self):
+        return [spec.name for spec in self.specs]
+
+    def check_item(self, item):
+        """
+        Valida los atributos de índice de un item antes de escribirlo ('set'). DynamoDB rechaza (ValidationException)
+        un item cuyo atributo de índice es de otro tipo, null o un string vacío; acá se lanza ValueError (400)
+        nombrando el índice. Un item sin el atributo es válido: simplemente no aparece en ese índice.
+        """
+        for spec in self.specs:
+            for attribute in spec.attributes:
+                if attribute not in item:
+                    continue
+                value = item[attribute]
+                if isinstance(value, float):  # json.loads devuelve float, DynamoDB usa Decimal
+                    value = Decimal(str(value))
+                if not _matches_type(value, spec.types[attribute]) or value == "":
+                    expected = "un string no vacío" if spec.types[attribute] == "S" else "un número"
+                    raise ValueError(f"'{attribute}' debe ser {expected} porque es clave del índice '{spec.name}' "
+                                     f"(se recibió {json.dumps(item[attribute], default=str)}).")
+
+    def plan(self, where, limit=None, cursor=None):
+        """
+        Devuelve los kwargs de Table.query para 'where' ({"provincia": "Entre Rios", "cp": {"between": ["3200", "3299"]}}).
+        Lanza ValueError (400) si ningún índice lo resuelve o si los valores, el LIMIT o el CURSOR son inválidos.
+        """
+        if not isinstance(where, dict) or not where:
+            raise ValueError("'query' requiere un 'WHERE' con los atributos a buscar.")
+        spec = next((spec for spec in self.specs if spec.serves(where)), None)
+        if spec is None:
+            raise ValueError(f"Ningún índice resuelve el WHERE {sorted(where)}. "
+                             f"Índices: {[spec.attributes for spec in self.specs]}")
+
+        condition = Key(spec.partition_key).eq(self._value(spec, spec.partition_key, where[spec.partition_key]))
+        if spec.sort_key in where:
+            condition &= self._range(spec, where[spec.sort_key])
+
+        query = {"IndexName": spec.name, "KeyConditionExpression": condition, "Limit": self._limit(limit)}
+        if cursor is not None:
+            query["ExclusiveStartKey"] = self.decode_cursor(spec, cursor)
+        return query
+
+    @staticmethod
+    def _value(spec, attribute, value):
+        if isinstance(value, float):  # json.loads devuelve float, DynamoDB usa Decimal
+            value = Decimal(str(value))
+        if not _matches_type(value, spec.types[attribute]):
+            expected = "string" if spec.types[attribute] == "S" else "número"
+            raise ValueError(f"'{attribute}' debe ser {expected} en el índice '{spec.name}'.")
+        return value
+
+    def _range(self, spec, condition):
+        """Condición sobre la clave de orden: un valor (igualdad) o {"operador": valor}."""
+        key = Key(spec.sort_key)
+        if not isinstance(condition, dict):
+            return key.eq(self._value(spec, spec.sort_key, condition))
+        if len(condition) != 1 or next(iter(condition)) not in RANGE_OPERATORS:
+            raise ValueError(f"La condición de '{spec.sort_key}' debe ser un único operador de {list(RANGE_OPERATORS)}.")
+        operator, operand = next(iter(condition.items()))
+        if operator == "between":
+            if not isinstance(operand, list) or len(operand) != 2:
+                raise ValueError("'between' requiere una lista [desde, hasta].")
+            return key.between(*(self._value(spec, spec.sort_key, bound) for bound in operand))
+        if operator == "begins_with" and spec.types[spec.sort_key] != "S":
+            raise ValueError("'begins_with' solo se aplica a atributos string.")
+        return getattr(key, operator)(self._value(spec, spec.sort_key, operand))
+
+    @staticmethod
+    def _limit(limit):
+        if limit is None:
+            return DEFAULT_QUERY_LIMIT
+        if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= MAX_QUERY_LIMIT:
+            raise ValueError(f"'LIMIT' debe ser un entero entre 1 y {MAX_QUERY_LIMIT}.")
+        return limit
+
+    @staticmethod
+    def encode_cursor(index_name, last_key):
+        """Cursor opaco de la próxima página (el LastEvaluatedKey del índice), o None si no hay más."""
+        if not last_key:
+            return None
+        payload = json.dumps({"index": index_name, "key": last_key}, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, spec, cursor):
+        """Devuelve el ExclusiveStartKey de un cursor emitido para el mismo índice."""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            key = payload["key"]
+            valid = payload["index"] == spec.name and set(key) == {TABLE_KEY, *spec.attributes}
+        except (AttributeError, TypeError, KeyError, ValueError, binascii.Error):
+            valid = False
+        if not valid:
+            raise ValueError("'CURSOR' inválido para este WHERE.")
+        try:
+            return {attribute: Decimal(value) if spec.types.get(attribute) == "N" else value
+                    for attribute, value in key.items()}
+        except InvalidOperation:
+            raise ValueError("'CURSOR' inválido para este WHERE.")
+
+
+def ensure_indexes(table, catalog, wait=True, poll_interval=10.0):
+    """
+    Crea en 'table' los GSI del catálogo que todavía no existen (proyección ALL) y devuelve sus nombres.
+    DynamoDB crea un índice por UpdateTable y hace el backfill en segundo plano: con wait=True se espera a
+    que cada uno quede ACTIVE antes de pedir el siguiente; con wait=False se pide solo el primero que falte.
+    """
+    table.reload()
+    existing = {index["IndexName"] for index in (table.global_secondary_indexes or [])}
+    created = []
+    for spec in catalog.specs:
+        if spec.name in existing:
+            continue
+        if created and not wait:
+            logger.info(f"Quedan índices por crear (ej: '{spec.name}'). Volver a correr cuando '{created[-1]}' esté ACTIVE.")
+            break
+        create = {"IndexName": spec.name, "KeySchema": spec.key_schema(), "Projection": {"ProjectionType": "ALL"}}
+        if (table.billing_mode_summary or {}).get("BillingMode", "PROVISIONED") == "PROVISIONED":
+            throughput = table.provisioned_throughput
+            create["ProvisionedThroughput"] = {"ReadCapacityUnits": throughput["ReadCapacityUnits"],
+                                               "WriteCapacityUnits": throughput["WriteCapacityUnits"]}
+        logger.info(f"Creando el índice '{spec.name}' ({', '.join(spec.attributes)}) en {table.name}...")
+        table.meta.client.update_table(TableName=table.name, AttributeDefinitions=spec.attribute_definitions(),
+                                       GlobalSecondaryIndexUpdates=[{"Create": create}])
+        created.append(spec.name)
+        if wait:
+            _wait_active(table, spec.name, poll_interval)
+    return created
+
+
+def _wait_active(table, index_name, poll_interval):
+    """Espera a que el índice (y la tabla) terminen de crearse y del backfill."""
+    while True:
+        table.reload()
+        status = next((index.get("IndexStatus") for index in (table.global_secondary_indexes or [])
+                       if index["IndexName"] == index_name), None)
+        if status == "ACTIVE" and table.table_status == "ACTIVE":
+            logger.info(f"Índice '{index_name}' ACTIVE.")
+            return
+        logger.info(f"Índice '{index_name}': {status} (backfill en curso)...")
+        time.sleep(poll_interval)
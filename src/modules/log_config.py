@@ -0,0 +1,78 @@
+# src/modules/log_config.py
+import sys
+import atexit
+import random
+import logging
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+    from pythonjsonlogger import jsonlogger
+except ImportError:  # python-json-logger es opcional, sin él se usa el formato de texto
+    jsonlogger = None
+
+# 'extra' para las líneas INFO que se escriben en cada request (conexión, acción, auditoría).
+# Son las que se muestrean con 'request_sample_rate'.
+REQUEST_LOG = {"per_request": True}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+JSON_FORMAT = '%(asctime)s %(name)s %(levelname)s %(threadName)s %(message)s'
+
+class RequestLogSampler(logging.Filter):
+    """
+    Deja pasar solo una fracción 'rate' de los logs INFO (o DEBUG) marcados como por-request.
+    El resto pasa siempre, incluidos WARNING y ERROR aunque estén marcados.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1.0 or record.levelno >= logging.WARNING or not getattr(record, "per_request", False):
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que loguea: el mensaje y el JSON los arma el hilo escritor.
+    Solo el traceback se resuelve acá, porque referencia frames que pueden cambiar.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=logging.INFO, json_format=True, request_sample_rate=1.0, stream=None):
+    """
+    Configura el logging de la aplicación: los hilos solo encolan el record y un QueueListener en segundo plano
+    lo formatea (JSON o texto) y lo escribe en stdout. Se llama desde el punto de entrada (no al importar módulos).
+    Devuelve el listener, que se detiene solo al salir.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if json_format and jsonlogger is not None:
+        handler.setFormatter(jsonlogger.JsonFormatter(JSON_FORMAT))
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue = SimpleQueue()
+    queue_handler = DeferredQueueHandler(queue)
+    queue_handler.addFilter(RequestLogSampler(request_sample_rate))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):  # ej: handlers heredados del proceso padre
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(queue, handler)
+    listener.start()
+    atexit.register(listener.stop)  # vacía la cola antes de terminar
+
+    if json_format and jsonlogger is None:
+        logging.getLogger(__name__).warning("python-json-logger no está instalado, se usa formato de texto.")
+    return listener
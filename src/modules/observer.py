@@ -1,68 +1,389 @@
 # src/modules/observer.py
-import threading
+import time
 import json
 import socket
+import selectors
+import threading
 import logging
+from queue import SimpleQueue, Empty
+from modules.tracing import span
+from modules.log_config import REQUEST_LOG
+from modules.versions import ItemVersions
+from modules.framing import LineReader, MessageTooLarge
 
 logger = logging.getLogger(__name__)  # __name__ = 'modules.observer'
 
+HEARTBEAT_MESSAGE = b'{"EVENT": "heartbeat"}\n'
+SUBSCRIPTION_MODES = ("full", "delta")
+MAX_CLIENT_LINE = 64 * 1024  # un suscriptor solo manda mensajes cortos (pong, snapshot)
+
+class _Subscriber:
+    """Estado de un suscriptor dentro del loop de I/O."""
+    __slots__ = ("sock", "uuid", "mode", "outbox", "inbox", "last_seen", "answers_heartbeat")
+
+    def __init__(self, sock, client_uuid, mode="full"):
+        self.sock = sock
+        self.uuid = client_uuid
+        self.mode = mode  # 'full' recibe el item completo, 'delta' solo los atributos que cambiaron
+        self.outbox = bytearray()  # bytes pendientes de enviar (el socket no aceptó todo)
+        self.inbox = LineReader(4096, MAX_CLIENT_LINE)  # bytes recibidos que todavía no forman una línea completa
+        self.last_seen = time.monotonic()  # última vez que el cliente mandó algo
+        self.answers_heartbeat = False  # el cliente respondió algún heartbeat con 'pong'
+
+
 class NotificationManager:
     """
     Implementa el Patrón Observer.
     Gestiona una lista de suscriptores (observers) y les notifica cuando ocurre un evento (ej: un 'set' en la DB).
+    Todos los sockets suscriptos los atiende un único hilo con 'selectors' (no un hilo bloqueado por observador):
+    detecta desconexiones, manda heartbeats para descartar peers muertos y hace los envíos sin bloquear.
+    Cada mensaje enviado es una línea JSON terminada en '\\n'.
+    Cada 'set' lleva la versión del item (monotónica por 'id'). Los suscriptores en modo 'delta' reciben solo
+    los atributos que cambiaron y pueden pedir el item completo ('snapshot') si detectan un salto de versión.
     """
 
-    def __init__(self):
-        self._observers = []  # Lista de sockets de clientes
-        self._lock = threading.Lock()  # Candado para proteger la lista
+    def __init__(self, encoder_class=None, heartbeat_interval=30.0, heartbeat_timeout=90.0, max_pending_bytes=4 * 1024 * 1024,
+                 snapshot_loader=None, max_versioned_items=10000, max_silent_heartbeats=3):
+        self._encoder_class = encoder_class  # encoder JSON por defecto (ej: DecimalEncoder)
+        self._bus = None  # bus entre procesos (modo multi-worker)
+        self._versions = ItemVersions(max_versioned_items)  # versión y último valor de cada item
+        self._sequence_lock = threading.Lock()  # versionar y encolar en el mismo orden
+        self._snapshot_loader = snapshot_loader  # (id, uuid) -> Future con (item, status), si el item no está en memoria
+        self._delta_subscribers = 0  # para no codificar el diff si nadie lo pide
+        self.heartbeat_interval = heartbeat_interval  # segundos entre heartbeats
+        self.heartbeat_timeout = heartbeat_timeout  # sin respuesta en este tiempo se descarta (solo clientes que responden)
+        self.max_silent_heartbeats = max_silent_heartbeats  # heartbeats sin que un cliente que nunca respondió mande nada
+        self.max_pending_bytes = max_pending_bytes  # un suscriptor más lento que esto se descarta
+
+        self._selector = selectors.DefaultSelector()
+        self._subscribers = {}  # socket -> _Subscriber (solo lo toca el hilo de I/O)
+        self._commands = SimpleQueue()  # funciones a ejecutar dentro del hilo de I/O
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()  # para despertar al select()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+        self._closed = False
+        self._metrics = {"notifications": 0, "heartbeats": 0, "dropped_dead": 0, "dropped_slow": 0, "snapshots": 0}
+
+        self._thread = threading.Thread(target=self._loop, name="observer-io", daemon=True)
+        self._thread.start()
         logger.info("NotificationManager (Observer) inicializado.")
 
-    def subscribe(self, client_socket, client_uuid):
-        """Añade un nuevo suscriptor (socket) a la lista."""
-        with self._lock:
-            if client_socket not in self._observers:
-                self._observers.append(client_socket)
-                logger.info(f"OBSERVER: Nuevo suscriptor (UUID: {client_uuid}). Total: {len(self._observers)}")
-            else:
-                logger.warning(f"OBSERVER: Intento de suscribir a un cliente ya suscrito (UUID: {client_uuid}).")
+    def attach_bus(self, bus):
+        """
+        Conecta el manager a un bus entre procesos. A partir de ahí 'notify' publica en el bus
+        y la entrega a los suscriptores locales la hace 'deliver' cuando el evento vuelve del hub (ya versionado).
+        """
+        self._bus = bus
+
+    # --- API pública (se llama desde cualquier hilo) ---
+
+    def subscribe(self, client_socket, client_uuid, mode="full", ack=None):
+        """
+        Añade un nuevo suscriptor. El manager pasa a ser dueño del socket: lo cierra cuando el cliente se desconecta.
+        'ack' (bytes, la confirmación de 'subscribe') se envía recién cuando el suscriptor quedó registrado:
+        todo 'set' posterior a la confirmación le llega. El hilo que atendió el request puede terminar enseguida.
+        """
+        if mode not in SUBSCRIPTION_MODES:
+            raise ValueError(f"Modo de suscripción inválido: {mode}")
+        self._call_soon(self._register, client_socket, client_uuid, mode, ack)
 
     def unsubscribe(self, client_socket):
-        """Elimina un suscriptor (socket) de la lista."""
-        with self._lock:
-            if client_socket in self._observers:
-                self._observers.remove(client_socket)
-                logger.info(f"OBSERVER: Suscriptor desconectado. Total: {len(self._observers)}")
+        """Elimina un suscriptor y cierra su socket."""
+        self._call_soon(self._drop_socket, client_socket, "desuscripto")
 
-    def _send_notification(self, message_bytes):
+    def notify(self, data, encoder_class=None):
         """
-        Envía datos a todos los suscriptores.
-        Se ejecuta en un hilo separado para no bloquear el flujo principal.
+        Notifica un cambio. Con bus lo publica para todos los workers (el hub le asigna la versión),
+        sino lo versiona acá y lo entrega directo a los suscriptores locales.
         """
-        with self._lock:
-            if not self._observers:
+        if self._bus is not None:
+            try:
+                with span("notify.publish"):
+                    self._bus.publish(data)
                 return
+            except (OSError, ValueError) as e:
+                # Si el hub no está, al menos se notifica a los suscriptores de este proceso
+                logger.warning(f"OBSERVER: Bus no disponible ({e}). Notificando solo localmente.")
 
-            logger.info(f"OBSERVER: Notificando a {len(self._observers)} suscriptor(es)...")
-            for obs_socket in list(self._observers):
-                try:
-                    obs_socket.sendall(message_bytes)
-                except socket.error as e:
-                    logger.warning(f"OBSERVER: Error enviando a suscriptor ({e}). Eliminándolo.")
-                    self._observers.remove(obs_socket)
+        with self._sequence_lock:
+            self._enqueue(self._versions.apply(data), encoder_class)
 
-    def notify(self, data, encoder_class):
+    def deliver(self, event, encoder_class=None):
+        """Entrega a los suscriptores locales un evento ya versionado (lo llama el bus con los eventos del hub)."""
+        with self._sequence_lock:
+            self._versions.remember(event)
+            self._enqueue(event, encoder_class)
+
+    def _enqueue(self, event, encoder_class=None):
         """
-        Envía datos (notificación) a todos los suscriptores en un hilo separado.
-        Si un envío falla, elimina al suscriptor de la lista.
+        Codifica el evento una sola vez por modo (completo y, si hay suscriptores 'delta', el diff)
+        y lo encola para que el hilo de I/O lo envíe. Si un envío falla, elimina al suscriptor.
         """
+        encoder_class = encoder_class or self._encoder_class
         try:
-            message_bytes = json.dumps(
-                {"EVENT": "update", "DATA": data}, cls=encoder_class
-            ).encode("utf-8")
+            with span("notify.encode"):
+                full_bytes = json.dumps(
+                    {"EVENT": "update", "ID": event["id"], "VERSION": event["version"], "DATA": event["item"]}, cls=encoder_class
+                ).encode("utf-8") + b"\n"
+                delta_bytes = None
+                if self._delta_subscribers and "changes" in event:  # sin valor anterior el diff no existe, va completo
+                    delta_bytes = json.dumps(
+                        {"EVENT": "delta", "ID": event["id"], "VERSION": event["version"],
+                         "CHANGES": event["changes"], "REMOVED": event["removed"]}, cls=encoder_class
+                    ).encode("utf-8") + b"\n"
         except Exception as e:
             logger.error(f"OBSERVER: No se pudo codificar el mensaje de notificación: {e}", exc_info=True)
             return
 
-        # Notificación asíncrona (no bloquea al servidor principal)
-        notify_thread = threading.Thread(target=self._send_notification, args=(message_bytes,), daemon=True)
-        notify_thread.start()
\ No newline at end of file
+        self._call_soon(self._broadcast, full_bytes, delta_bytes)
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats["subscribers"] = len(self._subscribers)
+        stats["delta_subscribers"] = self._delta_subscribers
+        return stats
+
+    def close(self):
+        """Detiene el hilo de I/O y cierra todos los sockets suscriptos."""
+        self._closed = True
+        self._wakeup()
+        self._thread.join(5)
+
+    # --- Hilo de I/O ---
+
+    def _call_soon(self, fn, *args):
+        self._commands.put((fn, args))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b"\0")
+        except (BlockingIOError, OSError):  # ya hay un despertar pendiente
+            pass
+
+    def _loop(self):
+        next_heartbeat = time.monotonic() + self.heartbeat_interval
+        while not self._closed:
+            timeout = max(0.0, next_heartbeat - time.monotonic())
+            for key, mask in self._selector.select(timeout):
+                if key.data is None:  # socket de despertar
+                    self._drain_wakeup()
+                    continue
+                subscriber = key.data
+                if mask & selectors.EVENT_READ:
+                    self._on_readable(subscriber)
+                if mask & selectors.EVENT_WRITE and subscriber.sock in self._subscribers:
+                    self._flush(subscriber)
+
+            self._run_commands()
+
+            if time.monotonic() >= next_heartbeat:
+                self._heartbeat()
+                next_heartbeat = time.monotonic() + self.heartbeat_interval
+
+        for client_socket in list(self._subscribers):
+            self._drop_socket(client_socket, "servidor cerrando")
+        self._selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_commands(self):
+        while True:
+            try:
+                fn, args = self._commands.get_nowait()
+            except Empty:
+                return
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"OBSERVER: Error en el loop de notificaciones: {e}", exc_info=True)
+
+    def _register(self, client_socket, client_uuid, mode, ack=None):
+        if client_socket in self._subscribers:
+            logger.warning(f"OBSERVER: Intento de suscribir a un cliente ya suscrito (UUID: {client_uuid}).")
+            return
+        try:
+            client_socket.setblocking(False)
+            subscriber = _Subscriber(client_socket, client_uuid, mode)
+            self._selector.register(client_socket, selectors.EVENT_READ, subscriber)
+        except (OSError, ValueError) as e:  # el cliente ya se fue
+            logger.warning(f"OBSERVER: No se pudo registrar al suscriptor (UUID: {client_uuid}): {e}")
+            client_socket.close()
+            return
+        self._subscribers[client_socket] = subscriber
+        if mode == "delta":
+            self._delta_subscribers += 1
+        logger.info(f"OBSERVER: Nuevo suscriptor (UUID: {client_uuid}, modo: {mode}). Total: {len(self._subscribers)}")
+        if ack:  # primero en el outbox, antes que cualquier notificación
+            self._send(subscriber, ack)
+
+    def _drop_socket(self, client_socket, reason):
+        subscriber = self._subscribers.pop(client_socket, None)
+        if subscriber is None:
+            return
+        if subscriber.mode == "delta":
+            self._delta_subscribers -= 1
+        try:
+            self._selector.unregister(client_socket)
+        except (KeyError, ValueError):
+            pass
+        client_socket.close()
+        logger.info(f"OBSERVER: Suscriptor desconectado ({reason}, UUID: {subscriber.uuid}). Total: {len(self._subscribers)}")
+
+    def _on_readable(self, subscriber):
+        try:
+            received = subscriber.inbox.recv_from(subscriber.sock, min_free=4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except MessageTooLarge:  # un cliente no debería mandar líneas tan largas
+            self._drop_socket(subscriber.sock, "mensaje demasiado largo")
+            return
+        except OSError as e:
+            self._metrics["dropped_dead"] += 1
+            self._drop_socket(subscriber.sock, f"error de socket: {e}")
+            return
+        if not received:  # el cliente cerró la conexión
+            self._drop_socket(subscriber.sock, "cerró la conexión")
+            return
+
+        subscriber.last_seen = time.monotonic()
+        for line in subscriber.inbox.lines():
+            self._on_client_message(subscriber, line)
+            if subscriber.sock not in self._subscribers:  # se descartó al procesar el mensaje
+                return
+
+    def _on_client_message(self, subscriber, line):
+        """Mensajes que el suscriptor manda por la conexión abierta: respuestas a heartbeats y pedidos de 'snapshot'."""
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get("ACTION") == "pong":
+            subscriber.answers_heartbeat = True
+        elif message.get("ACTION") == "snapshot":
+            self._snapshot(subscriber, message.get("ID"))
+
+    def _snapshot(self, subscriber, item_id):
+        """
+        Envía el item completo con su versión. Si no está en memoria lo pide a 'snapshot_loader' (DynamoDB)
+        sin bloquear el loop: la respuesta se envía cuando termina la lectura.
+        """
+        self._metrics["snapshots"] += 1
+        version, item = self._versions.latest(item_id)
+        if item is not None:
+            self._send_snapshot(subscriber, item_id, version, item)
+            return
+        if self._snapshot_loader is None:
+            self._send_snapshot(subscriber, item_id, version, None, "Item no disponible en memoria.")
+            return
+        try:
+            future = self._snapshot_loader(item_id, subscriber.uuid)
+        except Exception as e:  # ej: scheduler saturado
+            self._send_snapshot(subscriber, item_id, version, None, f"No se pudo leer el item: {e}")
+            return
+        future.add_done_callback(lambda done: self._call_soon(self._on_snapshot_loaded, subscriber, item_id, done))
+
+    def _on_snapshot_loaded(self, subscriber, item_id, future):
+        if subscriber.sock not in self._subscribers:  # se desconectó mientras se leía
+            return
+        version, item = self._versions.latest(item_id)
+        if item is not None:  # llegó un 'set' mientras se leía, es más nuevo que lo leído
+            self._send_snapshot(subscriber, item_id, version, item)
+            return
+        try:
+            resp_data, status = future.result()
+        except Exception as e:
+            resp_data, status = {"error": str(e)}, 500
+        if status == 200:
+            self._send_snapshot(subscriber, item_id, version, resp_data)
+        else:
+            self._send_snapshot(subscriber, item_id, version, None, resp_data.get("error", f"Status {status}"))
+
+    def _send_snapshot(self, subscriber, item_id, version, item, error=None):
+        message = {"EVENT": "snapshot", "ID": item_id, "VERSION": version}
+        if error is None:
+            message["DATA"] = item
+        else:
+            message["ERROR"] = error
+        try:
+            message_bytes = json.dumps(message, cls=self._encoder_class).encode("utf-8") + b"\n"
+        except Exception as e:
+            logger.error(f"OBSERVER: No se pudo codificar el snapshot de '{item_id}': {e}", exc_info=True)
+            return
+        self._send(subscriber, message_bytes)
+
+    def _send(self, subscriber, message_bytes):
+        """Envía sin bloquear. Lo que no entra queda en el outbox y se manda cuando el socket sea escribible."""
+        if not subscriber.outbox:
+            try:
+                sent = subscriber.sock.send(message_bytes)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as e:
+                logger.warning(f"OBSERVER: Error enviando a suscriptor ({e}). Eliminándolo.")
+                self._metrics["dropped_dead"] += 1
+                self._drop_socket(subscriber.sock, "error de envío")
+                return
+            if sent == len(message_bytes):
+                return
+            message_bytes = memoryview(message_bytes)[sent:]
+            self._selector.modify(subscriber.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, subscriber)
+
+        subscriber.outbox += message_bytes
+        if len(subscriber.outbox) > self.max_pending_bytes:
+            self._metrics["dropped_slow"] += 1
+            self._drop_socket(subscriber.sock, "demasiados datos pendientes")
+
+    def _flush(self, subscriber):
+        try:
+            sent = subscriber.sock.send(subscriber.outbox)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._metrics["dropped_dead"] += 1
+            self._drop_socket(subscriber.sock, f"error de envío: {e}")
+            return
+        del subscriber.outbox[:sent]
+        if not subscriber.outbox:
+            self._selector.modify(subscriber.sock, selectors.EVENT_READ, subscriber)
+
+    def _broadcast(self, full_bytes, delta_bytes=None):
+        if not self._subscribers:
+            return
+        logger.info("OBSERVER: Notificando a %d suscriptor(es)...", len(self._subscribers), extra=REQUEST_LOG)
+        self._metrics["notifications"] += 1
+        for subscriber in list(self._subscribers.values()):
+            if subscriber.mode == "delta" and delta_bytes is not None:
+                self._send(subscriber, delta_bytes)
+            else:
+                self._send(subscriber, full_bytes)
+
+    def _heartbeat(self):
+        """
+        Manda un heartbeat a todos y descarta a los que dejaron de responder.
+        Un cliente que nunca respondió un heartbeat se descarta si no mandó nada en 'max_silent_heartbeats' intervalos
+        (ej: peer medio abierto, el host se apagó sin cerrar la conexión y los envíos no fallan).
+        """
+        now = time.monotonic()
+        for subscriber in list(self._subscribers.values()):
+            silent = now - subscriber.last_seen
+            if subscriber.answers_heartbeat and silent > self.heartbeat_timeout:
+                self._metrics["dropped_dead"] += 1
+                self._drop_socket(subscriber.sock, "no respondió heartbeats")
+                continue
+            if not subscriber.answers_heartbeat and silent > self.heartbeat_interval * self.max_silent_heartbeats:
+                self._metrics["dropped_dead"] += 1
+                self._drop_socket(subscriber.sock, f"sin actividad en {self.max_silent_heartbeats} heartbeats")
+                continue
+            self._send(subscriber, HEARTBEAT_MESSAGE)
+        self._metrics["heartbeats"] += 1
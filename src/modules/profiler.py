@@ -0,0 +1,109 @@
+# src/modules/profiler.py
+import os
+import sys
+import threading
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.profiler'
+
+class SamplingProfiler:
+    """
+    Profiler por muestreo que se puede prender y apagar en producción sin reiniciar.
+    Cada 'interval' segundos toma la pila de todos los hilos (sys._current_frames) y cuenta cuántas veces aparece
+    cada una. Al apagarse escribe las pilas agregadas en formato 'folded' (una línea 'f1;f2;f3 cantidad'),
+    que se puede abrir con flamegraph.pl o speedscope.
+    """
+
+    def __init__(self, output_path=None, interval=0.005):
+        self.output_path = output_path or f"profile-{os.getpid()}.folded"  # archivo de salida
+        self.interval = interval  # segundos entre muestras
+        self._stacks = Counter()  # pila 'folded' -> cantidad de muestras
+        self._samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # protege start/stop
+        self._toggle_requested = threading.Event()  # lo marca request_toggle(), lo atiende el hilo de control
+        self._control = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._stacks.clear()
+            self._samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"PROFILER: muestreo iniciado (cada {self.interval * 1000:.1f}ms).")
+        return True
+
+    def stop(self):
+        """Detiene el muestreo y escribe el archivo. Devuelve la ruta escrita o None si no estaba corriendo."""
+        with self._lock:
+            if self._thread is None:
+                return None
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._dump()
+        logger.info(f"PROFILER: {self._samples} muestras escritas en {self.output_path}")
+        return self.output_path
+
+    def toggle(self):
+        """Prende el profiler si está apagado, o lo apaga (y escribe el archivo) si está prendido."""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def request_toggle(self):
+        """
+        Pide un toggle() al hilo de control. Solo marca un evento, así se puede llamar desde un signal handler:
+        start/stop toman un lock, crean o esperan hilos y escriben el archivo, nada de eso es seguro en un handler.
+        """
+        self._toggle_requested.set()
+
+    def start_control_thread(self):
+        """Arranca (una sola vez) el hilo que ejecuta los toggle() pedidos con request_toggle()."""
+        with self._lock:
+            if self._control is None:
+                self._control = threading.Thread(target=self._control_loop, name="profiler-control", daemon=True)
+                self._control.start()
+
+    def _control_loop(self):
+        while True:
+            self._toggle_requested.wait()
+            self._toggle_requested.clear()
+            try:
+                self.toggle()
+            except Exception as e:  # ej: no se pudo escribir el archivo
+                logger.error(f"PROFILER: Error al prender/apagar: {e}", exc_info=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def _dump(self):
+        try:
+            with open(self.output_path, 'w', encoding='utf-8') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except IOError as e:
+            logger.error(f"PROFILER: No se pudo escribir '{self.output_path}': {e}")
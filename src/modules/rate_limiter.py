@@ -0,0 +1,103 @@
+# src/modules/rate_limiter.py
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.rate_limiter'
+
+class TokenBucket:
+    """
+    Token bucket clásico: se recargan 'rate' tokens por segundo hasta un máximo de 'burst'.
+    Cada request consume un token; si no hay, se informa cuánto falta para que haya uno.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)  # tokens por segundo
+        self.burst = float(burst)  # capacidad máxima
+        self.tokens = float(burst)  # arranca lleno
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now):
+        """Devuelve (True, 0) si se pudo consumir un token, o (False, segundos_a_esperar)."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True, 0.0
+        if self.rate <= 0:  # acción bloqueada para este cliente
+            return False, 60.0
+        return False, round((1.0 - self.tokens) / self.rate, 3)
+
+
+class RateLimiter:
+    """
+    Límites por UUID de cliente y por acción, configurados desde un archivo JSON:
+
+        {
+            "default": {"list": {"rate": 1, "burst": 3}},
+            "clients": {"<UUID>": {"list": {"rate": 5, "burst": 10}}},
+            "max_buckets": 100000
+        }
+
+    El UUID es el que manda el cliente: singletonclient.py y observerclient.py usan str(uuid.getnode()),
+    la MAC de la máquina como entero decimal (ej: 02:42:ac:11:00:02 -> "2485377892354").
+    Las acciones sin límite configurado no se limitan.
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self._default = config.get("default", {})  # limites para todos los clientes
+        self._clients = config.get("clients", {})  # limites especificos por UUID
+        self._max_buckets = config.get("max_buckets", 100000)  # cota de memoria
+        self._buckets = OrderedDict()  # (UUID, accion) -> TokenBucket, en orden de uso
+        self._lock = threading.Lock()  # Candado para proteger los buckets y las métricas
+        self._metrics = {"allowed": 0, "throttled": 0}
+        self._throttled_by_action = {}  # accion -> cantidad de requests rechazados
+        logger.info(f"RateLimiter inicializado ({len(self._default)} límite(s) por defecto, {len(self._clients)} cliente(s) específicos).")
+
+    @classmethod
+    def from_file(cls, path):
+        """Crea el limitador leyendo la configuración de un archivo JSON."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _limit_for(self, client_uuid, action):
+        client_limits = self._clients.get(str(client_uuid), {})
+        return client_limits.get(action) or self._default.get(action)
+
+    def check(self, client_uuid, action):
+        """Devuelve (permitido, retry_after_segundos) para un request de 'client_uuid' con la acción 'action'."""
+        limit = self._limit_for(client_uuid, action)
+        if limit is None:  # sin límite configurado
+            return True, 0.0
+
+        key = (str(client_uuid), action)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(limit["rate"], limit.get("burst", limit["rate"]))
+                self._buckets[key] = bucket
+                # Si hay demasiados buckets se descarta el menos usado (vuelve a empezar lleno)
+                while len(self._buckets) > self._max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+
+            allowed, retry_after = bucket.try_acquire(now)
+            if allowed:
+                self._metrics["allowed"] += 1
+            else:
+                self._metrics["throttled"] += 1
+                self._throttled_by_action[action] = self._throttled_by_action.get(action, 0) + 1
+        return allowed, retry_after
+
+    def stats(self):
+        """Devuelve una copia de las métricas del limitador."""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["buckets"] = len(self._buckets)
+            stats["throttled_by_action"] = dict(self._throttled_by_action)
+        return stats
@@ -0,0 +1,297 @@
+# src/modules/resilience.py
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from botocore.exceptions import ClientError, BotoCoreError
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.resilience'
+
+# Códigos de error de DynamoDB que indican que nos están limitando
+THROTTLING_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+
+class ResilienceError(Exception):
+    """Error base: la operación no se ejecutó (o se abandonó) para proteger al servidor."""
+    status = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_response(self):
+        """Devuelve (resp_data, status) para enviar al cliente."""
+        resp_data = {"error": str(self)}
+        if self.retry_after is not None:
+            resp_data["retry_after"] = round(self.retry_after, 3)
+        return resp_data, self.status
+
+
+class DeadlineExceeded(ResilienceError):
+    """
+    Se terminó el tiempo disponible para el request.
+    'pending' son las llamadas abandonadas que siguen corriendo en el pool (su resultado llega igual, más tarde).
+    """
+    status = 504
+
+    def __init__(self, message, retry_after=None, pending=()):
+        super().__init__(message, retry_after)
+        self.pending = list(pending)
+
+
+class CircuitOpenError(ResilienceError):
+    """El circuit breaker está abierto, se falla rápido sin llamar a DynamoDB."""
+
+
+class ConcurrencyLimitError(ResilienceError):
+    """No hay lugar en el límite de concurrencia adaptativo antes del deadline."""
+
+
+class Deadline:
+    """Momento límite (reloj monotónico) de un request. Viaja desde el router hasta cada llamada a DynamoDB."""
+
+    def __init__(self, timeout):
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_request(cls, data, default_timeout):
+        """Usa 'DEADLINE_MS' del request si viene (acotado al default del servidor), sino el default."""
+        timeout = default_timeout
+        try:
+            requested = float(data.get("DEADLINE_MS")) / 1000.0
+            if requested > 0:
+                timeout = min(requested, default_timeout)
+        except (TypeError, ValueError):
+            pass
+        return cls(timeout)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de error sobre las últimas 'window' llamadas.
+    closed -> open cuando la tasa de error supera 'failure_rate' (con al menos 'min_calls' llamadas),
+    open -> half_open después de 'open_seconds', y half_open deja pasar una sola llamada de prueba.
+    """
+
+    def __init__(self, window=50, min_calls=10, failure_rate=0.5, open_seconds=5.0):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)  # True = éxito, False = fallo
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probing = False  # hay una llamada de prueba en curso (half_open)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Lanza CircuitOpenError si no se debe llamar a DynamoDB."""
+        with self._lock:
+            if self._state == "open":
+                elapsed = time.monotonic() - self._opened_at
+                if elapsed < self.open_seconds:
+                    raise CircuitOpenError("DynamoDB no disponible (circuit breaker abierto).", self.open_seconds - elapsed)
+                self._state = "half_open"
+                logger.info("CIRCUIT BREAKER: half_open, probando DynamoDB...")
+            if self._state == "half_open":
+                if self._probing:
+                    raise CircuitOpenError("DynamoDB no disponible (circuit breaker en prueba).", self.open_seconds)
+                self._probing = True
+
+    def cancel(self):
+        """La llamada permitida no llegó a ejecutarse: libera la prueba de half_open sin registrar resultado."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, success):
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = False
+                if success:
+                    self._state = "closed"
+                    self._outcomes.clear()
+                    logger.info("CIRCUIT BREAKER: closed, DynamoDB respondió bien.")
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            if self._state == "closed" and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def _open(self):
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        logger.warning(f"CIRCUIT BREAKER: open durante {self.open_seconds}s por tasa de error alta.")
+
+    @property
+    def state(self):
+        return self._state
+
+
+class AdaptiveLimiter:
+    """
+    Límite de concurrencia AIMD: sube de a poco con cada éxito y se reduce a la mitad con cada error de throttling
+    ('ProvisionedThroughputExceededException'), así el servidor deja de insistir cuando DynamoDB pide que bajemos el ritmo.
+    """
+
+    def __init__(self, initial=32, minimum=2, maximum=128):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        """Reserva un lugar esperando como máximo 'timeout' segundos. Devuelve False si no lo consiguió."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._in_flight += 1
+            return True
+
+    def try_acquire(self):
+        """Reserva un lugar solo si hay disponible (sin esperar)."""
+        return self.acquire(0)
+
+    def release(self, throttled=False):
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self._limit = max(self.minimum, self._limit / 2)
+                logger.warning(f"LIMITADOR: throttling de DynamoDB, concurrencia reducida a {int(self._limit)}.")
+            else:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"limit": int(self._limit), "in_flight": self._in_flight}
+
+
+def is_throttling_error(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_CODES
+
+
+def is_server_failure(error):
+    """
+    Los errores que cuentan para el circuit breaker: throttling, 5xx y errores de red/timeouts de botocore.
+    DeadlineExceeded no: si venció el tope de la operación, DynamoGuard.call ya lo registró.
+    """
+    if isinstance(error, ClientError):
+        http_status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return is_throttling_error(error) or http_status >= 500
+    return isinstance(error, BotoCoreError)
+
+
+class DynamoGuard:
+    """
+    Envuelve cada llamada a DynamoDB con: deadline del request (acotado por operación), circuit breaker,
+    límite de concurrencia adaptativo y, opcionalmente, lecturas 'hedged' (se lanza una segunda lectura
+    si la primera tarda más de 'hedge_delay' y gana la que responda primero).
+    """
+
+    def __init__(self, operation_timeouts=None, hedge_delay=None, breaker=None, limiter=None):
+        self.operation_timeouts = operation_timeouts or {}  # operacion -> timeout máximo en segundos
+        self.hedge_delay = hedge_delay  # segundos antes de lanzar la lectura duplicada (None = desactivado)
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter()
+        # Las llamadas abandonadas por deadline siguen ocupando un hilo hasta que botocore corte,
+        # por eso el pool tiene lugar para el máximo del limitador más las lecturas hedged.
+        self._executor = ThreadPoolExecutor(max_workers=self.limiter.maximum * 2, thread_name_prefix="dynamodb")
+        self._metrics = {"calls": 0, "timeouts": 0, "throttled": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0}
+        self._metrics_lock = threading.Lock()
+
+    def _count(self, metric):
+        with self._metrics_lock:
+            self._metrics[metric] += 1
+
+    def _submit(self, fn):
+        """Lanza fn en el pool. El lugar del limitador se libera cuando la llamada realmente termina."""
+        # Cada llamada corre con su propia copia del contexto (la traza del request sigue activa)
+        future = self._executor.submit(contextvars.copy_context().run, fn)
+
+        def on_done(f):
+            error = f.exception()
+            self.limiter.release(throttled=error is not None and is_throttling_error(error))
+
+        future.add_done_callback(on_done)
+        return future
+
+    def call(self, operation, fn, deadline=None, hedge=False):
+        """Ejecuta fn() (una llamada de boto3) respetando el deadline. Lanza ResilienceError o el error original."""
+        timeout = self.operation_timeouts.get(operation, 10.0)
+        # Si el deadline del cliente es más corto que el tope de la operación, un timeout es culpa del cliente
+        # (ej: DEADLINE_MS=10) y no debe abrir el breaker de todos
+        client_bound = deadline is not None and deadline.remaining() < timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        if timeout <= 0:
+            raise DeadlineExceeded(f"Deadline vencido antes de '{operation}'.")
+
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+
+        started = time.monotonic()
+        if not self.limiter.acquire(timeout):
+            self.breaker.cancel()  # no es culpa de DynamoDB, no cuenta como fallo
+            self._count("rejected")
+            raise ConcurrencyLimitError("Demasiadas operaciones en curso contra DynamoDB.", 0.5)
+        self._count("calls")
+        futures = [self._submit(fn)]
+        timeout -= time.monotonic() - started
+
+        try:
+            if hedge and self.hedge_delay is not None and timeout > self.hedge_delay:
+                done, _ = wait(futures, timeout=self.hedge_delay)
+                if not done and self.limiter.try_acquire():
+                    self._count("hedges")
+                    futures.append(self._submit(fn))
+                    timeout -= self.hedge_delay
+
+            done, _ = wait(futures, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+            if not done:
+                raise FutureTimeoutError()
+            winner = next(iter(done))
+            if len(futures) > 1 and winner is futures[1]:
+                self._count("hedge_wins")
+            result = winner.result()
+
+        except FutureTimeoutError:
+            self._count("timeouts")
+            if client_bound:
+                self.breaker.cancel()  # no dice nada de DynamoDB, no cuenta (libera la prueba de half_open)
+            else:
+                self.breaker.record(False)  # venció el tope de la operación (OPERATION_TIMEOUTS)
+            logger.warning(f"DEADLINE: '{operation}' abandonado por timeout.")
+            raise DeadlineExceeded(f"DynamoDB no respondió a tiempo ('{operation}').", pending=futures)
+        except Exception as e:
+            if is_throttling_error(e):
+                self._count("throttled")
+            self.breaker.record(not is_server_failure(e))
+            raise
+
+        self.breaker.record(True)
+        return result
+
+    def stats(self):
+        with self._metrics_lock:
+            stats = dict(self._metrics)
+        stats["circuit"] = self.breaker.state
+        stats["concurrency"] = self.limiter.stats()
+        return stats
@@ -0,0 +1,100 @@
+# src/modules/scheduler.py
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+import logging
+from concurrent.futures import Future
+from modules.tracing import current_trace
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.scheduler'
+
+class SchedulerFullError(Exception):
+    """La cola del scheduler está llena. 'retry_after' sugiere cuántos segundos esperar."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Cola del scheduler llena, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PriorityScheduler:
+    """
+    Pool fijo de hilos que ejecuta los trabajos por prioridad (menor número = más prioritario).
+    Así las lecturas puntuales ('get') pasan delante de los scans completos que estén en cola,
+    y la concurrencia contra DynamoDB queda acotada a 'workers'. Dentro de una misma prioridad se respeta el orden de llegada.
+    """
+
+    def __init__(self, workers=16, max_queue=1000, retry_after=1.0):
+        self.max_queue = max_queue  # trabajos en espera como máximo
+        self.retry_after = retry_after  # sugerencia de espera cuando la cola está llena
+        self._queue = []  # heap de (prioridad, secuencia, encolado_en, contexto, future, fn, args)
+        self._sequence = itertools.count()  # desempate FIFO dentro de la misma prioridad
+        self._cond = threading.Condition()  # protege la cola y despierta a los workers
+        self._closed = False
+        self._metrics = {"executed": 0, "rejected": 0}
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"PriorityScheduler inicializado ({workers} hilos, cola máx. {max_queue}).")
+
+    def submit(self, priority, fn, *args):
+        """Encola fn(*args) con la prioridad dada y devuelve un Future. Lanza SchedulerFullError si la cola está llena."""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("El scheduler está cerrado.")
+            if len(self._queue) >= self.max_queue:
+                self._metrics["rejected"] += 1
+                raise SchedulerFullError(self.retry_after)
+            # Se copia el contexto para que la traza del request siga activa en el hilo del scheduler
+            job = (priority, next(self._sequence), time.perf_counter(), contextvars.copy_context(), future, fn, args)
+            heapq.heappush(self._queue, job)
+            self._cond.notify()
+        return future
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:  # cerrado y sin trabajos pendientes
+                    return
+                _, _, queued_at, context, future, fn, args = heapq.heappop(self._queue)
+
+            if not future.set_running_or_notify_cancel():  # cancelado mientras esperaba
+                continue
+            try:
+                result = context.run(self._run_job, queued_at, fn, args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self._cond:
+                self._metrics["executed"] += 1
+
+    @staticmethod
+    def _run_job(queued_at, fn, args):
+        trace = current_trace()
+        if trace is not None:
+            trace.add("queue_wait", time.perf_counter() - queued_at)
+        return fn(*args)
+
+    def shutdown(self, wait=True):
+        """Deja de aceptar trabajos. Los que ya estaban en cola se ejecutan igual."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self):
+        """Devuelve una copia de las métricas del scheduler."""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats["queued"] = len(self._queue)
+        return stats
@@ -0,0 +1,105 @@
+# src/modules/tracing.py
+import time
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.tracing'
+
+# Traza del request en curso. Se propaga a otros hilos copiando el contexto (ver PriorityScheduler y DynamoGuard).
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    """Guarda los spans (nombre, duración) de un request. Varios hilos pueden agregar spans a la misma traza."""
+
+    def __init__(self, name, attributes=None):
+        self.name = name  # ej: la acción del request
+        self.attributes = attributes or {}  # datos extra para el log (cliente, UUID, ...)
+        self.started = time.perf_counter()
+        self.spans = []  # lista de (nombre, duración en segundos)
+        self.finished = False
+        self._token = None  # token del ContextVar para restaurar el contexto al terminar
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            self.spans.append((name, duration))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def breakdown(self):
+        """Suma las duraciones por nombre de span (en ms), en el orden en que aparecieron."""
+        totals = {}
+        with self._lock:
+            for name, duration in self.spans:
+                totals[name] = totals.get(name, 0.0) + duration * 1000.0
+        return totals
+
+
+def current_trace():
+    """Devuelve la traza del request en curso o None."""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    """Mide el bloque y lo agrega a la traza actual. Sin traza activa no hace nada."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+class Tracer:
+    """
+    Crea una traza por request y, al terminar, escribe un log 'SLOW REQUEST' con el desglose de tiempos
+    si el request tardó más que 'slow_threshold' segundos.
+    """
+
+    def __init__(self, slow_threshold=0.5):
+        self.slow_threshold = slow_threshold
+        self._metrics = {"requests": 0, "slow_requests": 0}
+        self._lock = threading.Lock()
+
+    def begin(self, name, **attributes):
+        """Crea la traza y la deja activa en el contexto actual. Se cierra con end()."""
+        trace = Trace(name, attributes)
+        trace._token = _current_trace.set(trace)
+        return trace
+
+    def end(self, trace):
+        """Cierra la traza (solo la primera vez) y loguea el desglose si fue lenta."""
+        if trace.finished:
+            return
+        trace.finished = True
+        _current_trace.reset(trace._token)
+
+        elapsed = trace.elapsed()
+        slow = self.slow_threshold is not None and elapsed >= self.slow_threshold
+        with self._lock:
+            self._metrics["requests"] += 1
+            if slow:
+                self._metrics["slow_requests"] += 1
+        if slow:
+            detail = ", ".join(f"{name}={ms:.1f}ms" for name, ms in trace.breakdown().items())
+            extra = " ".join(f"{key}={value}" for key, value in trace.attributes.items())
+            logger.warning(f"SLOW REQUEST: '{trace.name}' tardó {elapsed * 1000.0:.1f}ms ({extra}) -> {detail}")
+
+    @contextmanager
+    def request(self, name, **attributes):
+        trace = self.begin(name, **attributes)
+        try:
+            yield trace
+        finally:
+            self.end(trace)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
@@ -0,0 +1,73 @@
+# src/modules/versions.py
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.versions'
+
+class ItemVersions:
+    """
+    Lleva una versión monotónica por 'id' y el último valor conocido de cada item,
+    para publicar solo los atributos que cambiaron en cada 'set'.
+    Los items se guardan en un LRU acotado y si el anterior ya no está, el evento sale sin diff (los suscriptores
+    reciben el item completo). Las versiones también están acotadas ('max_versions', LRU): un id olvidado vuelve con
+    una versión mayor que todas las olvidadas, así cada id sigue siendo monotónico y el salto hace que un cliente
+    'delta' pida el snapshot. Las versiones viven en memoria: al reiniciar el proceso vuelven a empezar en 1.
+    """
+
+    def __init__(self, max_items=10000, max_versions=100000):
+        self.max_items = max_items  # items completos guardados como máximo
+        self.max_versions = max(max_versions, max_items)  # contadores por id guardados como máximo
+        self._versions = OrderedDict()  # id -> última versión (orden LRU)
+        self._floor = 0  # la mayor versión olvidada: un id que no está arranca por encima
+        self._items = OrderedDict()  # id -> último item (orden LRU)
+        self._lock = threading.Lock()
+
+    def apply(self, item):
+        """
+        Registra un 'set' y devuelve el evento a publicar:
+        {"id", "version", "item"} y, si se conocía el valor anterior, "changes" (atributos nuevos o distintos)
+        y "removed" (atributos que ya no están).
+        """
+        item_id = item.get("id")
+        with self._lock:
+            version = self._versions.pop(item_id, self._floor) + 1
+            self._set_version(item_id, version)
+            previous = self._items.pop(item_id, None)
+            self._store(item_id, item)
+
+        event = {"id": item_id, "version": version, "item": item}
+        if previous is not None:
+            event["changes"] = {key: value for key, value in item.items() if key not in previous or previous[key] != value}
+            event["removed"] = [key for key in previous if key not in item]
+        return event
+
+    def remember(self, event):
+        """Guarda la versión y el item de un evento ya versionado en otro proceso (ej: el hub del bus)."""
+        item_id = event["id"]
+        with self._lock:
+            if event["version"] < self._versions.get(item_id, 0):  # un evento viejo no pisa uno más nuevo
+                return
+            self._versions.pop(item_id, None)
+            self._set_version(item_id, event["version"])
+            self._items.pop(item_id, None)
+            self._store(item_id, event["item"])
+
+    def latest(self, item_id):
+        """Devuelve (versión, item) del último 'set' conocido. El item es None si no está en memoria; la versión 0 si nunca se vio."""
+        with self._lock:
+            item = self._items.get(item_id)
+            if item is not None:
+                self._items.move_to_end(item_id)
+            return self._versions.get(item_id, 0), item
+
+    def _set_version(self, item_id, version):
+        self._versions[item_id] = version
+        while len(self._versions) > self.max_versions:
+            _, forgotten = self._versions.popitem(last=False)
+            self._floor = max(self._floor, forgotten)
+
+    def _store(self, item_id, item):
+        self._items[item_id] = item
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
@@ -0,0 +1,308 @@
+# src/modules/write_behind.py
+import os
+import re
+import json
+import threading
+import logging
+from contextlib import contextmanager
+from decimal import Decimal
+from botocore.exceptions import ClientError, ParamValidationError
+from modules.bulk import BATCH_SIZE, BulkEncoder, write_batch
+
+logger = logging.getLogger(__name__)  # __name__ = 'modules.write_behind'
+
+SEGMENT_PATTERN = re.compile(r"^wal-(\d{8})\.jsonl$")
+DEAD_LETTER_FILE = "dead-letter.jsonl"  # items que DynamoDB rechazó (no se reintentan)
+REJECTION_CODES = {"ValidationException", "SerializationException"}  # errores de DynamoDB por datos inválidos
+
+def is_rejection(error):
+    """
+    Errores que no se arreglan reintentando porque el problema es el item (tipo inválido, atributo vacío, etc).
+    Todo lo demás (throttling, 5xx, red, permisos, tabla inexistente) se reintenta: el journal conserva las escrituras.
+    """
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in REJECTION_CODES
+    return isinstance(error, (ParamValidationError, TypeError, ValueError))
+
+
+class WriteBehindFullError(Exception):
+    """Hay demasiadas escrituras pendientes de bajar a DynamoDB."""
+
+
+class WriteBehindBuffer:
+    """
+    Buffer de escrituras diferidas para claves que se escriben muchas veces por segundo.
+    'submit' guarda la escritura en un journal local (fsync) y vuelve enseguida; cada 'flush_interval'
+    segundos un hilo baja a DynamoDB con BatchWriteItem solo el último valor de cada 'id'
+    y todas las entradas de auditoría (una por request).
+
+    El journal está dividido en segmentos 'wal-NNNNNNNN.jsonl'. En cada flush se empieza un segmento nuevo
+    y los anteriores se borran recién cuando sus escrituras están en DynamoDB. Al arrancar se releen
+    los segmentos que hayan quedado, así una escritura confirmada al cliente no se pierde aunque el proceso se caiga.
+
+    Un flush que falla por throttling o un error transitorio se reintenta entero en el próximo. Si DynamoDB rechaza
+    un lote por datos inválidos, el lote se escribe de a un item: los rechazados van a 'dead-letter.jsonl'
+    (uno por línea, con el error) y el resto se baja normalmente.
+    """
+
+    def __init__(self, table_data, table_log, journal_dir, flush_interval=0.2, max_pending=10000):
+        self.table_data = table_data
+        self.table_log = table_log
+        self.journal_dir = journal_dir  # directorio propio de este proceso
+        self.flush_interval = flush_interval  # segundos entre flushes
+        self.max_pending = max_pending  # escrituras en espera como máximo (después se rechaza con 503)
+
+        self._lock = threading.Lock()  # protege los pendientes y el segmento activo
+        self._flush_lock = threading.Lock()  # un solo flush a la vez (el hilo de fondo o 'close')
+        self._pending_data = {}  # id -> último item (ya con Decimal)
+        self._pending_audit = []  # entradas de auditoría en orden
+        self._inflight_data = {}  # items que el flusher está escribiendo (para lecturas y 'discard')
+        self._superseded = set()  # ids descartados mientras se escribían (si el flush falla no se reintentan)
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._metrics = {"submitted": 0, "coalesced": 0, "flushed_items": 0, "flushed_audits": 0, "flush_errors": 0, "replayed": 0,
+                         "dead_lettered": 0}
+
+        os.makedirs(journal_dir, exist_ok=True)
+        self._segments = self._existing_segments()  # segmentos con escrituras todavía no confirmadas por DynamoDB
+        self._replay()
+        self._segment_index = (self._segments[-1] if self._segments else 0) + 1
+        self._journal = self._open_segment(self._segment_index)
+
+        self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+        self._thread.start()
+        logger.info(f"WriteBehindBuffer inicializado (journal: {journal_dir}, flush cada {flush_interval}s).")
+
+    # --- API pública ---
+
+    def submit(self, item, audit_item):
+        """
+        Registra una escritura y su auditoría. Cuando vuelve, la escritura ya está en el journal (fsync).
+        Lanza WriteBehindFullError si hay demasiadas escrituras pendientes y ValueError si el item no tiene 'id'
+        (antes de tocar el journal: un registro sin clave no se podría bajar ni releer).
+        """
+        if not isinstance(item, dict) or item.get("id") is None:
+            raise ValueError("El item necesita un 'id'.")
+        record = json.dumps({"item": item, "audit": audit_item}, ensure_ascii=False)
+        item_decimal = json.loads(json.dumps(item), parse_float=Decimal)  # DynamoDB no acepta float
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("El buffer de escrituras está cerrado.")
+            if len(self._pending_audit) >= self.max_pending:
+                raise WriteBehindFullError(f"{len(self._pending_audit)} escrituras pendientes")
+            self._journal.write(record + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if item_decimal["id"] in self._pending_data:
+                self._metrics["coalesced"] += 1
+            self._pending_data[item_decimal["id"]] = item_decimal
+            self._pending_audit.append(audit_item)
+            self._metrics["submitted"] += 1
+
+    def pending(self, item_id):
+        """Devuelve el último valor aceptado y todavía no confirmado por DynamoDB, o None."""
+        with self._lock:
+            if item_id in self._pending_data:
+                return self._pending_data[item_id]
+            if item_id in self._superseded:  # un 'set' síncrono lo reemplazó mientras se escribía
+                return None
+            return self._inflight_data.get(item_id)
+
+    def discard(self, item_id):
+        """
+        Descarta el valor pendiente de 'item_id' (lo llama un 'set' síncrono de la misma clave, que es más nuevo).
+        Queda registrado en el journal para que no reaparezca al releerlo. Un lote que ya se está escribiendo no se puede cancelar.
+        """
+        with self._lock:
+            if item_id not in self._pending_data and item_id not in self._inflight_data:
+                return
+            self._journal.write(json.dumps({"discard": item_id}, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending_data.pop(item_id, None)
+            if item_id in self._inflight_data:
+                self._superseded.add(item_id)
+
+    @contextmanager
+    def superseding(self, item_id, timeout=None):
+        """
+        Para un 'set' síncrono de 'item_id': descarta el valor diferido y, si había uno pendiente o en vuelo,
+        no deja correr ningún flush hasta salir del bloque (el put síncrono). Así un valor viejo que se estaba bajando
+        termina antes del put y uno pendiente ya no se baja: el valor síncrono queda último.
+        Lanza TimeoutError si no consigue el lugar en 'timeout' segundos (el flush en curso tarda demasiado).
+        """
+        with self._lock:
+            deferred = item_id in self._pending_data or item_id in self._inflight_data
+        if not deferred:
+            yield
+            return
+        if not self._flush_lock.acquire(timeout=-1 if timeout is None else max(0.0, timeout)):
+            raise TimeoutError(f"Flush de escrituras diferidas en curso (ID: {item_id}).")
+        try:
+            self.discard(item_id)
+            yield
+        finally:
+            self._flush_lock.release()
+
+    def flush(self):
+        """Baja a DynamoDB todo lo pendiente (en el hilo que llama). Devuelve True si no hubo errores."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending_audit and not self._pending_data:
+                return True
+            data, audits = self._pending_data, self._pending_audit
+            self._pending_data, self._pending_audit = {}, []
+            self._inflight_data = data
+            # Las escrituras que lleguen a partir de ahora van a un segmento nuevo
+            self._journal.close()
+            self._segments.append(self._segment_index)
+            self._segment_index += 1
+            self._journal = self._open_segment(self._segment_index)
+            covered = list(self._segments)
+
+        try:
+            rejected = self._write_all(self.table_log, audits)
+            rejected += self._write_all(self.table_data, list(data.values()))
+            self._dead_letter(rejected)
+        except Exception as e:
+            logger.error(f"WRITE-BEHIND: Error bajando {len(data)} items / {len(audits)} auditorías, se reintenta: {e}")
+            with self._lock:
+                self._metrics["flush_errors"] += 1
+                self._inflight_data = {}
+                for item_id, item in data.items():  # lo que llegó mientras tanto es más nuevo
+                    if item_id not in self._superseded:
+                        self._pending_data.setdefault(item_id, item)
+                self._superseded.clear()
+                self._pending_audit[:0] = audits
+            return False
+
+        with self._lock:
+            self._inflight_data = {}
+            self._superseded.clear()
+            self._metrics["flushed_items"] += len(data)
+            self._metrics["flushed_audits"] += len(audits)
+            self._metrics["dead_lettered"] += len(rejected)
+            for index in covered:
+                self._segments.remove(index)
+        for index in covered:
+            os.remove(self._segment_path(index))
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["pending_items"] = len(self._pending_data)
+            stats["pending_audits"] = len(self._pending_audit)
+        return stats
+
+    def close(self):
+        """Detiene el hilo y hace un último flush. Si falla, el journal queda para el próximo arranque."""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        with self._lock:
+            self._journal.close()
+            path = self._segment_path(self._segment_index)
+            if not self._pending_audit and os.path.getsize(path) == 0:  # segmento activo vacío
+                os.remove(path)
+
+    # --- Internos ---
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            if self._closed:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"WRITE-BEHIND: Error inesperado en el flush: {e}", exc_info=True)
+
+    @staticmethod
+    def _write_all(table, items):
+        """
+        Baja 'items' en lotes. Devuelve [(tabla, item, error)] de los que DynamoDB rechazó por datos inválidos;
+        cualquier otro error se lanza (el flush se reintenta).
+        """
+        client = table.meta.client
+        rejected = []
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = items[start:start + BATCH_SIZE]
+            try:
+                write_batch(client, table.name, batch)
+            except Exception as e:
+                if not is_rejection(e):
+                    raise
+                # Algún item del lote es inválido y DynamoDB rechaza el lote entero: se escriben de a uno
+                for item in batch:
+                    try:
+                        table.put_item(Item=item)
+                    except Exception as item_error:
+                        if not is_rejection(item_error):
+                            raise
+                        rejected.append((table.name, item, item_error))
+        return rejected
+
+    def _dead_letter(self, rejected):
+        """Guarda los items rechazados en 'dead-letter.jsonl' (fsync) antes de borrar los segmentos que los tenían."""
+        if not rejected:
+            return
+        with open(os.path.join(self.journal_dir, DEAD_LETTER_FILE), 'a', encoding='utf-8') as f:
+            for table_name, item, error in rejected:
+                logger.error(f"WRITE-BEHIND: {table_name} rechazó el item '{item.get('id')}', va a {DEAD_LETTER_FILE}: {error}")
+                f.write(json.dumps({"table": table_name, "item": item, "error": str(error)}, cls=BulkEncoder, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _segment_path(self, index):
+        return os.path.join(self.journal_dir, f"wal-{index:08d}.jsonl")
+
+    def _open_segment(self, index):
+        journal = open(self._segment_path(index), 'a', encoding='utf-8')
+        # El directorio también se sincroniza, sino el archivo nuevo puede no sobrevivir a un corte
+        dir_fd = os.open(self.journal_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        except OSError:  # ej: sistemas que no permiten fsync de directorios
+            pass
+        finally:
+            os.close(dir_fd)
+        return journal
+
+    def _existing_segments(self):
+        indexes = []
+        for name in os.listdir(self.journal_dir):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                indexes.append(int(match.group(1)))
+        return sorted(indexes)
+
+    def _replay(self):
+        """Carga como pendientes las escrituras de los segmentos que no llegaron a confirmarse."""
+        for index in self._segments:
+            with open(self._segment_path(index), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line, parse_float=Decimal)
+                    except json.JSONDecodeError:  # última línea cortada por la caída (no se llegó a confirmar)
+                        logger.warning(f"WRITE-BEHIND: Línea incompleta ignorada en {self._segment_path(index)}")
+                        continue
+                    if not isinstance(record, dict):
+                        logger.warning(f"WRITE-BEHIND: Registro inválido ignorado en {self._segment_path(index)}: {line.strip()[:200]}")
+                        continue
+                    if "discard" in record:
+                        self._pending_data.pop(record["discard"], None)
+                        continue
+                    item, audit = record.get("item"), record.get("audit")
+                    if not isinstance(item, dict) or item.get("id") is None or not isinstance(audit, dict):
+                        logger.warning(f"WRITE-BEHIND: Registro sin item, 'id' o auditoría ignorado en {self._segment_path(index)}: {line.strip()[:200]}")
+                        continue
+                    self._pending_data[item["id"]] = item
+                    self._pending_audit.append(audit)
+                    self._metrics["replayed"] += 1
+        if self._metrics["replayed"]:
+            logger.warning(f"WRITE-BEHIND: {self._metrics['replayed']} escrituras recuperadas del journal, se bajan en el próximo flush.")
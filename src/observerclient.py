@@ -4,6 +4,7 @@ import argparse
 import json
 import uuid
 import time
+from modules.framing import LineReader, MessageTooLarge
 
 def get_cpu_id():
     """Obtiene el ID de la CPU/MAC como string."""
@@ -18,6 +19,45 @@ def log_status(message, force_verbose=False):
     # Imprimimos logs, errores y mensajes de estado a stderr
     print(f"[Estado] {message}", file=sys.stderr)
 
+def read_ack(sock, reader):
+    """
+    Lee la confirmación de la suscripción: la primera línea del stream. Puede llegar en varios segmentos
+    o junto con las primeras notificaciones, que se devuelven aparte: (respuesta, líneas siguientes).
+    """
+    while True:
+        lines = reader.lines()
+        if lines:
+            return json.loads(lines[0]), lines[1:]
+        if reader.recv_from(sock) == 0:
+            raise ConnectionError("Servidor cerró la conexión.")
+
+def handle_line(sock, line, versions):
+    """Procesa una notificación: responde heartbeats, controla versiones e imprime la data."""
+    # 2 Imprime la data limpia a stdout (LineReader ya decodificó la línea)
+    try:
+        parsed = json.loads(line)
+    except json.JSONDecodeError:
+        # Si no es JSON, imprimir raw
+        print(line)
+        return
+
+    # 3 Los heartbeats se responden y no se imprimen
+    if parsed.get("EVENT") == "heartbeat":
+        log_status("Heartbeat recibido.", force_verbose=True)
+        sock.sendall(b'{"ACTION": "pong"}\n')
+        return
+
+    # 4 Control de versiones: un delta sin la versión anterior se completa pidiendo el item entero
+    item_id, version = parsed.get("ID"), parsed.get("VERSION")
+    if parsed.get("EVENT") == "delta" and versions.get(item_id) != version - 1:
+        log_status(f"Salto de versión en '{item_id}' (tenía {versions.get(item_id)}, llegó {version}). Pidiendo snapshot...")
+        sock.sendall(json.dumps({"ACTION": "snapshot", "ID": item_id}).encode('utf-8') + b"\n")
+    if version is not None and version >= versions.get(item_id, 0):
+        versions[item_id] = version
+
+    # 'ensure_ascii=False' para ñ y acentos
+    print(json.dumps(parsed, indent=4, ensure_ascii=False))
+
 def main():
     global G_VERBOSE # Variable global
     
@@ -29,6 +69,8 @@ def main():
     # 1 Argumento para el delay de reintento
     parser.add_argument('-r', '--retry', type=int, default=30, help='Segundos para reintentar conexión (default: 30)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Activa el modo verboso.')
+    parser.add_argument('--max-message-kb', type=int, default=16384, help='Tamaño máximo de una notificación en KB (default: 16384)')
+    parser.add_argument('-m', '--mode', choices=['full', 'delta'], default='full', help="'full' recibe el item completo, 'delta' solo los cambios (default: full)")
     
     args = parser.parse_args()
     G_VERBOSE = args.verbose
@@ -37,7 +79,8 @@ def main():
     # Preparamos el único mensaje que enviaremos
     subscribe_request = json.dumps({
         "ACTION": "subscribe", 
-        "UUID": client_uuid
+        "UUID": client_uuid,
+        "MODE": args.mode
     })
     
     log_status(f"Cliente Observador iniciado. UUID: {client_uuid}")
@@ -60,33 +103,34 @@ def main():
                 sock.sendall(subscribe_request.encode('utf-8'))
 
                 # Esperamos respuesta de confirmación del servidor
-                response_raw = sock.recv(1024).decode('utf-8')
-                response = json.loads(response_raw)
+                # Buffer preasignado con recv_into; se reusa para todas las notificaciones de esta conexión
+                reader = LineReader(max_size=args.max_message_kb * 1024)
+                response, pending = read_ack(sock, reader)
 
                 if response.get("status") != "OK":
                     # 4 Error de suscripción
                     log_status(f"Error al suscribirse: {response.get('message', 'Respuesta no OK')}")
                     raise ConnectionError("Fallo en la suscripción, reintentando...")
                 
-                log_status(f"Suscripción exitosa. Escuchando notificaciones...")
+                log_status(f"Suscripción exitosa (modo {args.mode}). Escuchando notificaciones...")
+                versions = {} # id -> última versión vista (se reinicia al reconectar)
+                for line in pending: # notificaciones que llegaron junto con la confirmación
+                    handle_line(sock, line, versions)
 
                 # - Bucle de Escucha
+                # Cada notificación es una línea JSON terminada en '\n'; un recv puede traer varias o una parcial.
+                # Cada línea se decodifica entera (un carácter UTF-8 partido entre dos recv no se rompe)
                 while True:
-                    notification_raw = sock.recv(4096)
-                    if not notification_raw:
-                        # Servidor cerró la conexión
-                        raise ConnectionError("Servidor cerró la conexión.")
-                    
-                    # 2 Imprime la data limpia a stdout
-                    try:
-                        parsed = json.loads(notification_raw.decode('utf-8'))
-                        # 'ensure_ascii=False' para ñ y acentos
-                        print(json.dumps(parsed, indent=4, ensure_ascii=False)) 
-                    except json.JSONDecodeError:
-                        # Si no es JSON, imprimir raw
-                        print(notification_raw.decode('utf-8'))
+                    lines = reader.lines()
+                    if not lines:
+                        if reader.recv_from(sock) == 0:
+                            # Servidor cerró la conexión
+                            raise ConnectionError("Servidor cerró la conexión.")
+                        continue
+                    for line in lines:
+                        handle_line(sock, line, versions)
 
-        except (socket.error, socket.timeout, ConnectionError, ConnectionResetError, json.JSONDecodeError) as e:
+        except (socket.error, socket.timeout, ConnectionError, ConnectionResetError, json.JSONDecodeError, MessageTooLarge) as e:
             log_status(f"Conexión perdida: {e}")
             log_status(f"Reintentando conexión en {args.retry} segundos...")
             time.sleep(args.retry) # Espera antes de que el while True reintente
@@ -3,6 +3,7 @@ import sys
 import argparse
 import json
 import uuid
+from modules.framing import recv_all, MessageTooLarge
 
 # El tiempo (seg) que el cliente va a esperar una respuesta
 CLIENT_TIMEOUT = 10.0 
@@ -13,13 +14,14 @@ def get_cpu_id():
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Cliente para enviar acciones 'get/set/list' al Servidor TPFI."
+        description="Cliente para enviar acciones 'get/set/list/query' al Servidor TPFI."
     )
     parser.add_argument('-i', '--input', required=True, help='Archivo JSON de entrada con la acción.')
     parser.add_argument('-o', '--output', help='(Opcional) Archivo de salida para la respuesta JSON.')
     parser.add_argument('-s', '--server', default='localhost', help='Host del servidor (default: localhost)')
     parser.add_argument('-p', '--port', type=int, default=8080, help='Puerto del servidor (default: 8080)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Activa el modo verboso para depuración.')
+    parser.add_argument('--max-response-mb', type=int, default=64, help='Tamaño máximo de la respuesta en MB (default: 64)')
     args = parser.parse_args()
 
     # 1 Definimos una función de log que sigue el -v
@@ -66,22 +68,17 @@ def main():
             
             sock.sendall(request_json_bytes)
             
-            # Bucle de recepcion, porque TCP es un stream y la respuesta puede llegar en muchas partes.
-            buffer = b""
-            while True:
-                # Se espera recibir hasta 1024 bytes a la vez
-                data_chunk = sock.recv(1024) 
-                if not data_chunk:
-                    # Si recibe 0 bytes, el servidor cerro la conexión
-                    break 
-                buffer += data_chunk
-            
-            response_data = buffer.decode('utf-8')
+            # Recepcion hasta que el servidor cierra, porque TCP es un stream y la respuesta puede llegar en muchas partes.
+            # recv_into sobre un buffer preasignado que crece duplicando (sin concatenar chunks) y se decodifica una vez
+            response_data = recv_all(sock, args.max_response_mb * 1024 * 1024)
             log_verbose(f"Respuesta recibida ({len(response_data)} bytes).")
 
     except socket.timeout:
         print(f"Error: El servidor no respondió en {CLIENT_TIMEOUT} segundos.", file=sys.stderr)
         sys.exit(1)
+    except MessageTooLarge as e:
+        print(f"Error: Respuesta demasiado grande. {e}", file=sys.stderr)
+        sys.exit(1)
     except socket.error as e:
         print(f"Error de conexión: No se pudo conectar a {args.server}:{args.port}.", file=sys.stderr)
         print("Detalle:", e, file=sys.stderr)
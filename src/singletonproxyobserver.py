@@ -5,15 +5,39 @@ import json # importar json para manejo de json
 import uuid # importar uuid para generar ids unicos
 import threading # importar threading para manejar hilos
 import logging # importar logging para logs
+import os # importar os para generar la clave del bus
+import signal # importar signal para cerrar los workers con SIGTERM
+import time # importar time para supervisar los workers
+import multiprocessing # importar multiprocessing para el modo multi-worker
+from multiprocessing.connection import wait as wait_processes # espera a que termine algun worker
 from decimal import Decimal # importar Decimal para manejar decimales de dynamoDB
 
 # 2 Importar los módulos
 from modules.db_singleton import DatabaseSingleton
 from modules.data_proxy import DataProxy
-from modules.observer import NotificationManager
+from modules.observer import NotificationManager, SUBSCRIPTION_MODES
+from modules.versions import ItemVersions
+from modules.idempotency import IdempotencyCache, request_fingerprint
+from modules.bus import NotificationBusHub, NotificationBusClient, BusIdempotencyCache
+from modules.rate_limiter import RateLimiter
+from modules.scheduler import PriorityScheduler, SchedulerFullError
+from modules.resilience import Deadline, ResilienceError
+from modules.tracing import Tracer, span
+from modules.profiler import SamplingProfiler
+from modules.log_config import setup_logging, REQUEST_LOG
+from modules.framing import recv_json, MessageTooLarge
+from modules.indexes import IndexCatalog
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 VERSION = "1.1-Refactor" # version del servidor
 
+# Prioridad de cada accion en el scheduler (menor = se atiende antes). Las lecturas puntuales pasan delante de los scans;
+# un 'query' lee solo su página, así que va con los 'set'.
+ACTION_PRIORITIES = {"get": 0, "set": 1, "query": 1, "list": 2, "list_logs": 2}
+
+# Los workers arrancan con 'spawn' (no fork): el padre ya tiene corriendo los hilos del hub
+WORKER_CONTEXT = multiprocessing.get_context("spawn")
+
 # Obtenemos un logger para este módulo
 logger = logging.getLogger(__name__) # __name__ es: singletonproxyobserver
 
@@ -29,108 +53,247 @@ class Server: # server para manejar los patrones
     Clase principal del Servidor.
     Orquesta los patrones Singleton, Proxy y Observer.
     """
-    def __init__(self, host, port): # constructor que recibe host y port    
+    def __init__(self, host, port, idempotency_ttl=300.0, idempotency_max=10000,
+                 reuse_port=False, bus_address=None, bus_authkey=None,
+                 rate_limits=None, db_workers=16, max_queue=1000,
+                 request_timeout=8.0, hedge_ms=None, slow_ms=500.0, profile_output=None,
+                 heartbeat_interval=30.0, write_behind_dir=None, write_behind_ms=200.0,
+                 tables=None, max_request_bytes=1024 * 1024, indexes=None): # constructor que recibe host y port    
         self.host = host # guarda el host 
-        self.port = port # guarda el port
+        self.port = port # guarda el port (0 = puerto libre elegido por el sistema, queda en self.port al arrancar)
+        self.ready = threading.Event() # se activa cuando el socket ya está escuchando
+        self._stopping = False # shutdown() pedido
+        self.reuse_port = reuse_port # SO_REUSEPORT para compartir el puerto entre workers
+        self.request_timeout = request_timeout # deadline por defecto de cada request (menor al timeout del cliente)
+        self.max_request_bytes = max_request_bytes # tamaño máximo de un request
         
         logger.info("Inicializando componentes del servidor...")
         # DataProxy internamente obtendrá el Singleton
-        self.data_proxy = DataProxy() # crea el proxy de datos
-        self.notifier = NotificationManager() # crea el manager de notificaciones (observer)
+        self.data_proxy = DataProxy(hedge_delay=hedge_ms / 1000.0 if hedge_ms else None,
+                                    write_behind_dir=write_behind_dir, write_behind_interval=write_behind_ms / 1000.0,
+                                    tables=tables, # crea el proxy de datos (tables: (data, log) inyectadas, sino las del Singleton)
+                                    indexes=IndexCatalog.from_file(indexes) if indexes else IndexCatalog()) # índices para 'query'
+        self.notifier = NotificationManager(DecimalEncoder, heartbeat_interval, snapshot_loader=self._load_snapshot) # crea el manager de notificaciones (observer)
+        self.idempotency = IdempotencyCache(idempotency_max, idempotency_ttl) # respuestas de escrituras por (UUID, idreq)
+        self.rate_limiter = RateLimiter.from_file(rate_limits) if rate_limits else RateLimiter() # limites por UUID y accion
+        self.scheduler = PriorityScheduler(db_workers, max_queue) # hilos que acceden a DynamoDB, por prioridad
+        self.tracer = Tracer(slow_ms / 1000.0 if slow_ms else None) # desglose de tiempos por request y log de requests lentos
+        self.profiler = SamplingProfiler(profile_output) # profiler por muestreo, se prende con SIGUSR2 o la accion 'profile'
+
+        # En modo multi-worker cada 'set' viaja por el bus para llegar a los observadores de todos los procesos
+        self.bus = None
+        if bus_address is not None:
+            self.bus = NotificationBusClient(bus_address, bus_authkey, self.notifier.deliver)
+            self.notifier.attach_bus(self.bus)
+            self.idempotency = BusIdempotencyCache(self.bus) # un reintento puede llegar a otro worker: las respuestas viven en el hub
+            self.bus.start()
         logger.info("--- Servidor listo para escuchar ---")
 
     def _send_response(self, conn, data, status_code=200): # funcion privada para enviar respuestas
         """Helper para enviar respuestas JSON al cliente."""
         try:
             # Usamos cls=DecimalEncoder para manejar los decimales de dynamo
-            msg = json.dumps(data, cls=DecimalEncoder, indent=4).encode('utf-8') # convierte la info a json
-            conn.sendall(msg) # envia la info al cliente
+            with span("encode_response"):
+                msg = json.dumps(data, cls=DecimalEncoder, indent=4).encode('utf-8') # convierte la info a json
+            with span("send_response"):
+                conn.sendall(msg) # envia la info al cliente
             logger.debug(f"Enviada respuesta (Status: {status_code})") 
         except socket.error as e: # error de socket 
             logger.warning(f"Error de socket al enviar respuesta: {e}")
 
+    def _discard_input(self, conn, max_seconds=1.0): # cierre "suave" cuando no se leyó todo el request
+        """Cierra el lado de escritura y descarta lo que el cliente siga enviando (acotado en tiempo)."""
+        try:
+            conn.shutdown(socket.SHUT_WR) # el cliente recibe EOF despues de la respuesta
+            conn.settimeout(max_seconds)
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline and conn.recv(65536):
+                pass
+        except OSError:
+            pass
+
+    def _execute_action(self, action, data, client_uuid, session_id, deadline, on_late_write=None): # corre en un hilo del scheduler
+        """Ejecuta la operación pedida contra DataProxy. 'on_late_write' recibe el resultado de un 'set' que venció con la escritura en curso."""
+        if deadline.expired(): # espero demasiado en la cola
+            return {"error": "Deadline vencido esperando en la cola."}, 504
+        if action == "get": # si la accion es get
+            return self.data_proxy.get_item(data.get("ID"), client_uuid, session_id, deadline) # llama al metodo get_item del proxy
+        if action == "set": # si la accion es set ('WRITE_BEHIND': true pide escritura diferida)
+            write_behind = bool(data.pop("WRITE_BEHIND", False)) # no se guarda como atributo del item
+            return self.data_proxy.set_item(data, client_uuid, session_id, deadline, write_behind, on_late_write) # llama al metodo set_item del proxy
+        if action == "query": # busqueda por atributos con un indice secundario, paginada
+            return self.data_proxy.query_items(data.get("WHERE"), data.get("LIMIT"), data.get("CURSOR"), client_uuid, session_id, deadline)
+        if action == "list": # si la accion es list
+            return self.data_proxy.list_items(client_uuid, session_id, deadline) # llama al list_items del proxy
+        return self.data_proxy.list_logs(client_uuid, session_id, deadline) # list_logs
+
+    def _load_snapshot(self, item_id, client_uuid): # lo usa el NotificationManager cuando un suscriptor pide un item que no tiene en memoria
+        """Lee el item completo con la prioridad de un 'get' (se audita como tal). Devuelve un Future con (resp_data, status)."""
+        deadline = Deadline(self.request_timeout)
+        return self.scheduler.submit(ACTION_PRIORITIES["get"], self._execute_action, "get", {"ID": item_id}, client_uuid, str(uuid.uuid4()), deadline)
+
+    def _run_scheduled(self, action, data, client_uuid, session_id, client_log_prefix, deadline):
+        """
+        Valida el request, aplica idempotencia a los 'set' y ejecuta la operación en el scheduler por prioridad.
+        Devuelve (resp_data, status).
+        """
+        if action == "get" and not data.get("ID"): # si no existe el id
+            return {"error": "Acción 'get' requiere un 'ID'"}, 400 # bad request
+        if action == "set" and "id" not in data: # sino existe el id en los datos
+            return {"error": "Acción 'set' requiere un 'id' en los datos"}, 400 # bad request
+
+        idem_key = None
+        if action == "set":
+            idem_key = self.idempotency.make_key(client_uuid, data.get("idreq")) # clave de idempotencia
+            cached = self.idempotency.begin(idem_key, request_fingerprint(data)) # la respuesta si es un reintento (422 si cambió el contenido)
+            if cached is not None and cached[1] == 422: # mismo idreq con otros datos: no es un reintento
+                return cached
+            if cached is not None: # request duplicado, no se toca DynamoDB
+                logger.info("%s - 'set' duplicado (idreq: %s). Respuesta desde cache.", client_log_prefix, data.get('idreq'), extra=REQUEST_LOG) # log info
+                return cached
+
+        def settle(late_data, late_status): # resultado real de un 'set' que se respondió 504 con la escritura en curso
+            self.idempotency.complete(idem_key, late_data, late_status) # un reintento con el mismo idreq recibe este resultado
+            if late_status in (200, 202):
+                logger.info("%s - 'set' aplicado después del deadline. Notificando observadores...", client_log_prefix, extra=REQUEST_LOG) # log info
+                self.notifier.notify(late_data) # notifica a los observadores
+
+        resp_data, status = {"error": "Error interno inesperado"}, 500 # por si la operacion lanza
+        try:
+            future = self.scheduler.submit(ACTION_PRIORITIES[action], self._execute_action, action, data, client_uuid, session_id, deadline, settle)
+            try:
+                resp_data, status = future.result(timeout=deadline.remaining()) # espera a que un hilo del scheduler lo ejecute
+            except FutureTimeoutError: # no termino antes del deadline
+                logger.warning(f"{client_log_prefix} - '{action}' superó el deadline.") # log warning
+                resp_data, status = {"error": "El servidor no pudo completar la operación a tiempo."}, 504 # gateway timeout
+                if not future.cancel() and action == "set": # ya se estaba ejecutando, la escritura puede aplicarse igual
+                    resp_data["outcome"] = "unknown"
+                    future.add_done_callback(lambda done: self._settle_late(done, settle))
+        except SchedulerFullError as e: # demasiados requests en cola
+            logger.warning(f"{client_log_prefix} - Scheduler saturado, '{action}' rechazado.") # log warning
+            resp_data, status = {"error": "Servidor saturado, reintente más tarde.", "retry_after": e.retry_after}, 503 # service unavailable
+        finally:
+            if not (status == 504 and resp_data.get("outcome") == "unknown"): # sino la clave queda tomada hasta que llame settle
+                self.idempotency.complete(idem_key, resp_data, status) # guarda la respuesta y libera duplicados
+
+        if action == "set" and status in (200, 202): # si esta bien (202 = escritura diferida aceptada)
+            logger.info("%s - 'set' exitoso. Notificando observadores...", client_log_prefix, extra=REQUEST_LOG) # log info
+            self.notifier.notify(resp_data) # notifica a los observadores
+        return resp_data, status
+
+    @staticmethod
+    def _settle_late(future, settle):
+        """Pasa a 'settle' el resultado de un 'set' que terminó de ejecutarse después de responder 504."""
+        try:
+            resp_data, status = future.result()
+        except Exception as e:
+            logger.error(f"Error en un 'set' abandonado por el deadline: {e}", exc_info=True)
+            resp_data, status = {"error": "Error interno inesperado"}, 500
+        if status == 504 and resp_data.get("outcome") == "unknown": # el put sigue en curso, lo informa DataProxy
+            return
+        settle(resp_data, status)
+
     def handle_client_connection(self, conn, addr): # funcion para manejar la conexion del cliente
         """
         Esta función se ejecuta en un hilo separado por cada cliente, maneja el ciclo de vida completo de una conexión.
         """
         # Formato de log para saber quien es el cliente
         client_log_prefix = f"Cliente [{addr[0]}:{addr[1]}]" # prejifo del log
-        logger.info(f"{client_log_prefix} - Conexión aceptada en hilo {threading.current_thread().name}") # log info
+        logger.info("%s - Conexión aceptada", client_log_prefix, extra=REQUEST_LOG) # log info (el hilo lo agrega el formato)
         
         is_subscriber = False # bandera para saber si es suscriptor
+        handed_off = False # el socket ya es del NotificationManager
         client_uuid = "UUID_DESCONOCIDO" # uuid del cliente desconocido
+        trace = self.tracer.begin("request", client=f"{addr[0]}:{addr[1]}") # traza con el desglose de tiempos
         
         try:
-            # Recibimos el request (máx 4096 bytes)
-            request_raw = conn.recv(4096) # recibe info del cliente
-            if not request_raw: # si no recibe nada
+            # Recibimos el request completo (hasta max_request_bytes), aunque llegue en varios segmentos
+            conn.settimeout(self.request_timeout) # un cliente que no termina de enviar no retiene el hilo
+            data = recv_json(conn, self.max_request_bytes) # recibe y decodifica la info (spans 'recv' y 'parse')
+            if data is None: # si no recibe nada
                 logger.warning(f"{client_log_prefix} - Cliente desconectado sin enviar datos.") # mensaje de warning
                 return
-
-            data = json.loads(request_raw.decode('utf-8')) # decodifica la info recibida
+            if not isinstance(data, dict): # ej: una lista JSON
+                raise json.JSONDecodeError("Se esperaba un objeto JSON", "", 0)
             action = data.get("ACTION") # obtiene la accion del json
             client_uuid = data.get("UUID", client_uuid) # obtiene el uuid de json o usa el desconocido
+            trace.name = action # la traza se nombra por la accion
+            trace.attributes["uuid"] = client_uuid
             session_id = str(uuid.uuid4()) # genera un id de sesion unico
+            deadline = Deadline.from_request(data, self.request_timeout) # tiempo disponible para todo el request
             
-            logger.info(f"{client_log_prefix} (UUID: {client_uuid}) -> Acción solicitada: {action}") # log info
+            logger.info("%s (UUID: %s) -> Acción solicitada: %s", client_log_prefix, client_uuid, action, extra=REQUEST_LOG) # log info
             
             #router de acciones
-            if action == "get": # si la accion es get
-                item_id = data.get("ID") # obtiene el id del json
-                if item_id: # si existe el id
-                    resp_data, status = self.data_proxy.get_item(item_id, client_uuid, session_id) # llama al metodo get_item del proxy
-                else: # si no existe el id
-                    resp_data, status = {"error": "Acción 'get' requiere un 'ID'"}, 400 # bad request
+            allowed, retry_after = self.rate_limiter.check(client_uuid, action) # token bucket por UUID y accion
+            if not allowed: # el cliente supero su limite, se rechaza sin ocupar el scheduler
+                logger.info("%s (UUID: %s) - '%s' limitado. Retry-After: %ss", client_log_prefix, client_uuid, action, retry_after, extra=REQUEST_LOG) # log info (muestreado)
+                resp_data, status = {"error": f"Límite de '{action}' excedido.", "retry_after": retry_after}, 429 # too many requests
             
-            elif action == "set": # si la accion es set
-                if "id" in data: # si existe el id en los datos
-                    resp_data, status = self.data_proxy.set_item(data, client_uuid, session_id) # llama al metodo set_item del proxy
-                    if status == 200: # si esta bien
-                        logger.info(f"{client_log_prefix} - 'set' exitoso. Notificando observadores...") # log info
-                        self.notifier.notify(resp_data, DecimalEncoder) # notifica a los observadores
-                else: # sino existe el id en los datos
-                    resp_data, status = {"error": "Acción 'set' requiere un 'id' en los datos"}, 400 # bad request
+            elif action in ACTION_PRIORITIES: # acciones que van a DynamoDB (get, set, query, list, list_logs)
+                resp_data, status = self._run_scheduled(action, data, client_uuid, session_id, client_log_prefix, deadline)
             
-            elif action == "list": # si la accion es list
-                resp_data, status = self.data_proxy.list_items(client_uuid, session_id) # llama al list_items del proxy
+            elif action == "stats": # metricas internas del servidor
+                resp_data, status = {
+                    "idempotency": self.idempotency.stats(),
+                    "rate_limiter": self.rate_limiter.stats(),
+                    "scheduler": self.scheduler.stats(),
+                    "dynamodb": self.data_proxy.guard.stats(),
+                    "tracing": self.tracer.stats(),
+                    "observer": self.notifier.stats(),
+                    "write_behind": self.data_proxy.write_behind.stats() if self.data_proxy.write_behind else None
+                }, 200
+            
+            elif action == "profile": # prende/apaga el profiler por muestreo (solo desde el mismo host)
+                if addr[0] not in ("127.0.0.1", "::1"):
+                    resp_data, status = {"error": "La acción 'profile' solo se acepta desde localhost."}, 403 # forbidden
+                elif data.get("ENABLE", not self.profiler.running):
+                    started = self.profiler.start() # False si ya estaba corriendo
+                    resp_data, status = {"status": "OK", "message": "Profiler iniciado" if started else "El profiler ya estaba corriendo",
+                                         "running": True}, 200
+                else:
+                    path = self.profiler.stop() # None si no estaba corriendo
+                    resp_data, status = {"status": "OK", "message": "Profiler detenido" if path else "El profiler no estaba corriendo",
+                                         "running": False, "output": path}, 200
             
-            elif action == "list_logs":
-                resp_data, status = self.data_proxy.list_logs(client_uuid, session_id)
+            elif action == "subscribe" and data.get("MODE", "full") not in SUBSCRIPTION_MODES: # modo de notificaciones invalido
+                resp_data, status = {"error": f"MODE debe ser uno de {list(SUBSCRIPTION_MODES)}"}, 400 # bad request
             
             elif action == "subscribe": # si la accion es subscribe
                 # 4 método del proxy para auditar esta acción.
-                if self.data_proxy._log_action(client_uuid, session_id, "subscribe"): # si la auditoria funciona
-                    self.notifier.subscribe(conn, client_uuid) # subscribe al cliente
-                    is_subscriber = True # marca como suscriptor
-                    resp_data, status = {"status": "OK", "message": "Suscrito exitosamente"}, 200 # bien
-                else:
-                    # Si la auditoría falla, no suscribimos al cliente
-                    resp_data, status = {"error": "Fallo interno al registrar suscripción (auditoría)"}, 500 # error
+                try:
+                    if self.data_proxy._log_action(client_uuid, session_id, "subscribe", deadline=deadline): # si la auditoria funciona
+                        is_subscriber = True # marca como suscriptor (se entrega al NotificationManager, que envía el OK)
+                        resp_data, status = {"status": "OK", "message": "Suscrito exitosamente"}, 200 # bien
+                    else:
+                        # Si la auditoría falla, no suscribimos al cliente
+                        resp_data, status = {"error": "Fallo interno al registrar suscripción (auditoría)"}, 500 # error
+                except ResilienceError as e: # DynamoDB no disponible (breaker abierto o deadline vencido)
+                    resp_data, status = e.to_response()
             
             else: # si la accion es desconocida 
                 resp_data, status = {"error": f"Acción '{action}' desconocida."}, 400 # bad request
 
-            # Enviamos la respuesta (menos si es un suscriptor que se queda escuchando)
-            if not is_subscriber: # si no es suscriptor
-                self._send_response(conn, resp_data, status) # envia la respuesta al cliente 
-            elif status != 200: # Si la suscripción fallo, enviamos error y cierra
-                self._send_response(conn, resp_data, status) # envia la respuesta al cliente
-                is_subscriber = False # desmarca como suscriptor
-            else: # Si la suscripción fue buena, se envia OK y nos quedamos
-                self._send_response(conn, resp_data, status) # envia respuesta
-
-            # Si es suscriptor, se mantiene la conexión abierta
+            # Si es suscriptor, el socket pasa al loop de I/O del NotificationManager y este hilo termina.
+            # La confirmación la envía el manager después de registrarlo, así no se pierde un 'set' entre el OK y el registro
             if is_subscriber:
-                logger.info(f"{client_log_prefix} - Hilo en modo 'escucha' (suscriptor).")
-                # Bucle para detectar desconexión
-                while conn.recv(1024): # para que siga vivo 
-                    pass # no hace nada, solo espera
-                logger.info(f"{client_log_prefix} - Suscriptor detectado como desconectado.")
+                with span("encode_response"):
+                    ack = json.dumps(resp_data, cls=DecimalEncoder).encode('utf-8') + b"\n" # una línea, como las notificaciones
+                self.notifier.subscribe(conn, client_uuid, data.get("MODE", "full"), ack=ack) # subscribe al cliente ('full' o 'delta')
+                handed_off = True
+                logger.info("%s - Conexión entregada al NotificationManager (suscriptor).", client_log_prefix, extra=REQUEST_LOG)
+            else:
+                self._send_response(conn, resp_data, status) # envia la respuesta al cliente
 
-        except json.JSONDecodeError: # error de json malformado
+        except (json.JSONDecodeError, UnicodeDecodeError): # error de json malformado
             logger.warning(f"{client_log_prefix} - Error: JSON malformado recibido.") # log warning
             self._send_response(conn, {"error": "JSON malformado o inválido"}, 400) # bad request
         
+        except MessageTooLarge as e: # request mas grande que max_request_bytes
+            logger.warning(f"{client_log_prefix} - {e}") # log warning
+            self._send_response(conn, {"error": str(e)}, 413) # payload too large
+            self._discard_input(conn) # sino el cierre con datos sin leer manda RST y el cliente pierde la respuesta
+        
         except (socket.error, ConnectionResetError) as e: # error de socket o conexion reseteada
             logger.warning(f"{client_log_prefix} - Error de socket: {e}") # log warning
             
@@ -139,12 +302,10 @@ class Server: # server para manejar los patrones
             self._send_response(conn, {"error": f"Error interno inesperado del servidor."}, 500) # error de servidor
             
         finally: # siempre se ejecuta
-            if is_subscriber: # si es suscriptor
-                #limpia al suscriptor de la lista
-                self.notifier.unsubscribe(conn)
-            
-            conn.close() # cierra la conexion
-            logger.info(f"{client_log_prefix} - Conexión cerrada. Finalizando hilo.")
+            self.tracer.end(trace) # cierra la traza del request
+            if not handed_off: # el socket de un suscriptor lo cierra el NotificationManager
+                conn.close() # cierra la conexion
+                logger.info("%s - Conexión cerrada. Finalizando hilo.", client_log_prefix, extra=REQUEST_LOG)
 
     def start(self): # start del servidor
         """Inicia el bucle principal del servidor."""
@@ -153,14 +314,28 @@ class Server: # server para manejar los patrones
             
             # 3 Opción de socket reusador
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # permite reusar la direccion
+            if self.reuse_port: # modo multi-worker: varios procesos escuchan en el mismo puerto y el kernel reparte las conexiones
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             
             self.server_socket.bind((self.host, self.port)) # bind (bind es asociar el socket a una direccion y puerto) a host y port
             self.server_socket.listen(5) # hasta 5 conexiones en cola
+            self.port = self.server_socket.getsockname()[1] # puerto real (si se pidió el 0)
+
+            # SIGUSR2 prende/apaga el profiler sin reiniciar (kill -USR2 <pid>): el handler solo avisa, el toggle lo hace un hilo
+            if hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+                self.profiler.start_control_thread()
+                signal.signal(signal.SIGUSR2, lambda signum, frame: self.profiler.request_toggle())
             logger.info(f"Servidor {VERSION} escuchando en http://{self.host}:{self.port}") # log info
+            self.ready.set()
             
             # Bucle principal para aceptar clientes
             while True:
-                conn, addr = self.server_socket.accept() # acepta la conexion del cliente
+                try:
+                    conn, addr = self.server_socket.accept() # acepta la conexion del cliente
+                except OSError:
+                    if self._stopping: # shutdown() cerró el socket
+                        break
+                    raise
                 
                 # Inicia un nuevo hilo para manejar al cliente
                 threading.Thread(
@@ -177,13 +352,135 @@ class Server: # server para manejar los patrones
         finally: # siempre se ejecuta
             if hasattr(self, 'server_socket') and self.server_socket: # si existe el server_socket
                 self.server_socket.close() # cierra el socket
+            self.data_proxy.close() # baja las escrituras diferidas pendientes
             logger.info("Servidor detenido.")
 
+    def shutdown(self): # detiene un servidor que corre en otro hilo (ej: tests)
+        """Deja de aceptar conexiones y cierra los suscriptores, el scheduler y el bus. start() vuelve solo."""
+        self._stopping = True
+        if hasattr(self, 'server_socket') and self.server_socket:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR) # despierta al accept() bloqueado
+            except OSError:
+                pass
+            self.server_socket.close()
+        self.notifier.close()
+        self.scheduler.shutdown(wait=False)
+        if self.bus is not None:
+            self.bus.close()
+
+def _worker_main(host, port, bus_address, bus_authkey, server_kwargs, log_options, tables_factory): # punto de entrada de cada proceso worker
+    """Arranca un Server dentro de un proceso worker que comparte el puerto con SO_REUSEPORT."""
+    setup_logging(**log_options) # el proceso hijo arranca de cero (spawn): configura su propio logging
+    if tables_factory is not None: # ej: backend local de los tests, cada worker crea sus tablas
+        server_kwargs = dict(server_kwargs, tables=tables_factory())
+    Server(host, port, reuse_port=True, bus_address=bus_address, bus_authkey=bus_authkey, **server_kwargs).start()
+
+def run_workers(host, port, workers, log_options=None, tables_factory=None, **server_kwargs): # modo multi-proceso
+    """
+    Levanta 'workers' procesos que escuchan en el mismo puerto (SO_REUSEPORT) y un hub de notificaciones en el padre.
+    Cada proceso tiene su propio GIL, así el parseo JSON y el ruteo no quedan limitados a un núcleo.
+    El padre supervisa a los workers y relanza los que se caen.
+    Los workers se crean con 'spawn': el padre ya tiene los hilos del hub corriendo y hacer fork de un proceso
+    con hilos puede copiar locks tomados. Por eso todo lo que recibe un worker tiene que poder serializarse
+    (en lugar de 'tables' se pasa 'tables_factory', una función de módulo que cada worker llama al arrancar).
+    """
+    if not hasattr(socket, "SO_REUSEPORT"): # ej: Windows
+        logger.error("SO_REUSEPORT no está disponible en esta plataforma. Se inicia un solo proceso.")
+        Server(host, port, **server_kwargs).start()
+        return
+
+    # Cada worker tendría su propio buffer pendiente: un 'set' diferido y un 'get' o 'set' posterior del mismo id
+    # pueden caer en workers distintos, y se pierde el orden y la lectura de lo recién escrito
+    if server_kwargs.get("write_behind_dir"):
+        logger.error("--write-behind-dir no se puede usar con más de un worker (-w). Use -w 1.")
+        sys.exit(1)
+
+    # Verificamos que el puerto esté libre antes de lanzar los workers (sino todos fallarían por separado)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            probe.bind((host, port))
+    except socket.error as e:
+        logger.error(f"Error de Socket (¿Puerto {port} ya en uso?): {e}")
+        sys.exit(1)
+
+    bus_authkey = os.urandom(16) # clave compartida solo con los workers
+    idempotency = IdempotencyCache(server_kwargs.get("idempotency_max", 10000), server_kwargs.get("idempotency_ttl", 300.0))
+    # El hub asigna las versiones (en el orden en que reenvía) y guarda las respuestas de idempotencia de todos los workers
+    hub = NotificationBusHub(bus_authkey, sequencer=ItemVersions().apply, idempotency=idempotency)
+    hub.start()
+
+    def spawn(index): # crea y arranca un worker
+        process = WORKER_CONTEXT.Process(
+            target=_worker_main,
+            args=(host, port, hub.address, bus_authkey, server_kwargs, log_options or {}, tables_factory),
+            name=f"worker-{index}"
+        )
+        process.start()
+        logger.info(f"Worker {index} iniciado (PID {process.pid}).")
+        return process
+
+    # SIGTERM en el padre cierra también a los workers (pasa por el finally)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    processes = {i: spawn(i) for i in range(workers)}
+    try:
+        while True:
+            wait_processes([p.sentinel for p in processes.values()]) # bloquea hasta que termine algun worker
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    logger.warning(f"Worker {index} terminó (código {process.exitcode}). Relanzando...")
+                    time.sleep(1) # evita relanzar en bucle si falla al arrancar
+                    processes[index] = spawn(index)
+    except KeyboardInterrupt:
+        logger.info("\nCerrando los workers por petición del usuario (Ctrl+C)...")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(3)
+        hub.close()
+        logger.info("Servidor multi-worker detenido.")
+
 if __name__ == "__main__": # si es el main
     parser = argparse.ArgumentParser(description="Servidor TPFI - Proxy/Singleton/Observer") # crea el parser (parser es para argumentos de linea de comando)
     parser.add_argument('-p', '--port', type=int, default=8080, help='Puerto en el que escuchar (default: 8080)') # agrega el argumento del puerto
+    parser.add_argument('--idem-ttl', type=float, default=300.0, help='Segundos que se recuerda la respuesta de un idreq (default: 300)')
+    parser.add_argument('--idem-max', type=int, default=10000, help='Máximo de respuestas guardadas para idempotencia (default: 10000)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Cantidad de procesos worker que comparten el puerto (default: 1)')
+    parser.add_argument('--rate-limits', help='(Opcional) Archivo JSON con los límites por UUID y acción')
+    parser.add_argument('--db-workers', type=int, default=16, help='Hilos que acceden a DynamoDB por proceso (default: 16)')
+    parser.add_argument('--max-queue', type=int, default=1000, help='Requests en espera como máximo antes de responder 503 (default: 1000)')
+    parser.add_argument('--request-timeout', type=float, default=8.0, help='Deadline por defecto de cada request en segundos (default: 8)')
+    parser.add_argument('--hedge-ms', type=float, help='(Opcional) Lanza un segundo get si el primero tarda más de estos ms')
+    parser.add_argument('--slow-ms', type=float, default=500.0, help='Umbral en ms para el log de requests lentos, 0 lo desactiva (default: 500)')
+    parser.add_argument('--profile-output', help='(Opcional) Archivo donde el profiler escribe las pilas (default: profile-<pid>.folded)')
+    parser.add_argument('--heartbeat', type=float, default=30.0, help='Segundos entre heartbeats a los suscriptores (default: 30)')
+    parser.add_argument('--write-behind-dir', help="(Opcional) Directorio del journal; habilita 'set' con WRITE_BEHIND (solo con -w 1)")
+    parser.add_argument('--write-behind-ms', type=float, default=200.0, help='Intervalo de flush de las escrituras diferidas en ms (default: 200)')
+    parser.add_argument('--indexes', help='(Opcional) Archivo JSON con los índices secundarios para query (default: ciudad, provincia+cp, cp)')
+    parser.add_argument('--max-request-kb', type=int, default=1024, help='Tamaño máximo de un request en KB (default: 1024)')
+    parser.add_argument('--log-format', choices=['json', 'text'], default='json', help='Formato de los logs (default: json)')
+    parser.add_argument('--log-level', default='INFO', help='Nivel de log (default: INFO)')
+    parser.add_argument('--log-sample', type=float, default=1.0, help='Fracción de los logs por request que se escriben, 0 a 1 (default: 1)')
     args = parser.parse_args() # parsea los argumentos
+
+    # Logging asincrono: los hilos encolan y un hilo en segundo plano formatea y escribe
+    log_options = {"level": args.log_level.upper(), "json_format": args.log_format == 'json', "request_sample_rate": args.log_sample}
+    setup_logging(**log_options)
     
     # Define en qué host va a escuchar '0.0.0.0'
     host = '0.0.0.0' 
-    Server(host, args.port).start()
\ No newline at end of file
+    server_kwargs = {
+        "idempotency_ttl": args.idem_ttl, "idempotency_max": args.idem_max,
+        "rate_limits": args.rate_limits, "db_workers": args.db_workers, "max_queue": args.max_queue,
+        "request_timeout": args.request_timeout, "hedge_ms": args.hedge_ms,
+        "slow_ms": args.slow_ms, "profile_output": args.profile_output, "heartbeat_interval": args.heartbeat,
+        "write_behind_dir": args.write_behind_dir, "write_behind_ms": args.write_behind_ms,
+        "max_request_bytes": args.max_request_kb * 1024, "indexes": args.indexes
+    }
+    if args.workers > 1: # modo multi-proceso
+        run_workers(host, args.port, args.workers, log_options=log_options, **server_kwargs)
+    else:
+        Server(host, args.port, **server_kwargs).start()
\ No newline at end of file
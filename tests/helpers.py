@@ -0,0 +1,58 @@
+# tests/helpers.py
+import time
+import zlib
+import socket
+from types import SimpleNamespace
+
+
+def wait_until(condition, timeout=5.0):
+    """Espera (sondeando) a que condition() sea verdadera; False si vence el timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def free_port():
+    """Un puerto en el que no escucha nadie (para simular un servidor caído o elegir uno libre)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class FakeTable:
+    """Tabla en memoria con el scan segmentado paginado y BatchWriteItem (con UnprocessedItems) de DynamoDB."""
+
+    def __init__(self, name, items=(), fail_scan_after=None):
+        self.name = name
+        self.items = {item['id']: item for item in items}
+        self.fail_scan_after = fail_scan_after  # cantidad de scans antes de simular un corte
+        self.scans = 0
+        self.batches = 0
+        self.meta = SimpleNamespace(client=self)
+
+    def scan(self, Segment, TotalSegments, Limit, ExclusiveStartKey=None):
+        self.scans += 1
+        if self.fail_scan_after is not None and self.scans > self.fail_scan_after:
+            raise ConnectionError("corte simulado")
+        keys = sorted(k for k in self.items if zlib.crc32(k.encode()) % TotalSegments == Segment)
+        if ExclusiveStartKey:
+            keys = [k for k in keys if k > ExclusiveStartKey['id']]
+        page = keys[:Limit]
+        response = {"Items": [self.items[k] for k in page]}
+        if len(keys) > Limit:
+            response["LastEvaluatedKey"] = {"id": page[-1]}
+        return response
+
+    def batch_write_item(self, RequestItems):
+        self.batches += 1
+        requests = RequestItems[self.name]
+        # Cada tercer lote deja la mitad sin procesar, como cuando DynamoDB limita
+        processed = requests if self.batches % 3 else requests[:len(requests) // 2]
+        for request in processed:
+            item = request["PutRequest"]["Item"]
+            self.items[item['id']] = item
+        unprocessed = requests[len(processed):]
+        return {"UnprocessedItems": {self.name: unprocessed} if unprocessed else {}}
@@ -0,0 +1,388 @@
+# tests/local_dynamo.py
+import copy
+import time
+import zlib
+import bisect
+import random
+import threading
+import logging
+from decimal import Decimal
+from types import SimpleNamespace
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)  # __name__ = 'tests.local_dynamo'
+
+class FaultInjector:
+    """
+    Fallas configurables para el backend local: latencia fija más un 'jitter' aleatorio y una fracción
+    de llamadas que responden con throttling (ProvisionedThroughputExceededException), como DynamoDB.
+    'operations' limita las fallas a ciertas operaciones (ej: {"get_item"}); None = todas.
+    Los atributos se pueden cambiar en caliente desde un test.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, throttle_rate=0.0, operations=None, seed=None):
+        self.latency = latency  # segundos que tarda cada llamada
+        self.jitter = jitter  # segundos extra, al azar entre 0 y jitter
+        self.throttle_rate = throttle_rate  # fracción de llamadas limitadas (0 a 1)
+        self.operations = operations
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "throttled": 0}
+
+    def before(self, operation):
+        """Se llama antes de cada operación: espera la latencia y puede lanzar el error de throttling."""
+        if self.operations is not None and operation not in self.operations:
+            return
+        with self._lock:
+            self._metrics["calls"] += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            throttled = self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+            if throttled:
+                self._metrics["throttled"] += 1
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            raise ClientError(
+                {"Error": {"Code": "ProvisionedThroughputExceededException",
+                           "Message": "The level of configured provisioned throughput for the table was exceeded."}},
+                operation
+            )
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
+
+
+def _validation_error(operation, message):
+    return ClientError({"Error": {"Code": "ValidationException", "Message": message}}, operation)
+
+
+def _dynamo_type(value):
+    """Tipo de DynamoDB de un valor escalar ('S', 'N' u otro)."""
+    if isinstance(value, str):
+        return "S"
+    if isinstance(value, (int, Decimal)) and not isinstance(value, bool):
+        return "N"
+    return type(value).__name__
+
+
+# Operadores de boto3.dynamodb.conditions sobre la clave de orden -> (incluye el límite inferior, incluye el superior)
+_RANGE_BOUNDS = {"=": (True, True), "<": (None, False), "<=": (None, True), ">": (False, None), ">=": (True, None)}
+
+
+class _LocalIndex:
+    """
+    GSI en memoria (proyección ALL): por cada valor de la clave de partición, una lista ordenada de
+    (clave de orden, clave de la tabla). Un query hace bisect hasta el inicio del rango y recorre solo
+    las entradas que devuelve. Los items sin los atributos del índice no se indexan (índice disperso).
+    """
+
+    def __init__(self, name, key_schema, types, table_key):
+        self.name = name
+        self.key_schema = key_schema
+        self.partition_key = next(k["AttributeName"] for k in key_schema if k["KeyType"] == "HASH")
+        self.sort_key = next((k["AttributeName"] for k in key_schema if k["KeyType"] == "RANGE"), None)
+        self.types = types  # atributo -> 'S' | 'N'
+        self.table_key = table_key
+        self.partitions = {}  # valor de la clave de partición -> lista ordenada de entradas
+
+    def check(self, operation, item):
+        """Como DynamoDB: un item con un atributo del índice de otro tipo (o un string vacío) se rechaza."""
+        for attribute in filter(None, (self.partition_key, self.sort_key)):
+            if attribute in item and _dynamo_type(item[attribute]) != self.types[attribute]:
+                raise _validation_error(operation, (
+                    f"One or more parameter values were invalid: Type mismatch for Index Key {attribute} "
+                    f"Expected: {self.types[attribute]} Actual: {_dynamo_type(item[attribute])} IndexName: {self.name}"))
+            if attribute in item and item[attribute] == "":
+                raise _validation_error(operation, (
+                    f"One or more parameter values are not valid. A value specified for a secondary index key is not "
+                    f"supported. The AttributeValue for a key attribute cannot contain an empty string value. "
+                    f"IndexName: {self.name}, IndexKey: {attribute}"))
+
+    def entry(self, item):
+        """(valor de partición, entrada ordenable) o None si el item no tiene los atributos del índice."""
+        if any(attribute not in item for attribute in filter(None, (self.table_key, self.partition_key, self.sort_key))):
+            return None
+        key = item[self.table_key]
+        return item[self.partition_key], ((item[self.sort_key], key) if self.sort_key else (key,))
+
+    def add(self, item):
+        found = self.entry(item)
+        if found is not None:
+            bisect.insort(self.partitions.setdefault(found[0], []), found[1])
+
+    def remove(self, item):
+        found = self.entry(item)
+        if found is None:
+            return
+        entries = self.partitions[found[0]]
+        del entries[bisect.bisect_left(entries, found[1])]
+        if not entries:
+            del self.partitions[found[0]]
+
+    def describe(self):
+        return {"IndexName": self.name, "KeySchema": copy.deepcopy(self.key_schema),
+                "Projection": {"ProjectionType": "ALL"}, "IndexStatus": "ACTIVE"}
+
+    def bounds(self, condition):
+        """
+        Traduce la KeyConditionExpression de boto3 a (valor de partición, límite inferior, límite superior, prefijo).
+        Cada límite es (valor, incluido) o None.
+        """
+        expression = condition.get_expression()
+        parts = expression["values"] if expression["operator"] == "AND" else (condition,)
+        partition_value, lower, upper, prefix = None, None, None, None
+        for part in parts:
+            expression = part.get_expression()
+            operator, (attribute, *values) = expression["operator"], expression["values"]
+            if attribute.name == self.partition_key and operator == "=":
+                partition_value = values[0]
+            elif attribute.name == self.sort_key and operator == "BETWEEN":
+                lower, upper = (values[0], True), (values[1], True)
+            elif attribute.name == self.sort_key and operator == "begins_with":
+                lower, prefix = (values[0], True), values[0]
+            elif attribute.name == self.sort_key and operator in _RANGE_BOUNDS:
+                include_lower, include_upper = _RANGE_BOUNDS[operator]
+                lower = (values[0], include_lower) if include_lower is not None else None
+                upper = (values[0], include_upper) if include_upper is not None else None
+            else:
+                raise _validation_error("query", f"Query key condition not supported: {attribute.name} {operator}")
+        if partition_value is None:
+            raise _validation_error("query", f"Query condition missed key schema element: {self.partition_key}")
+        return partition_value, lower, upper, prefix
+
+    def matching(self, condition, exclusive_start_key=None):
+        """Recorre, en orden, las entradas que cumplen la condición (a partir de ExclusiveStartKey si viene)."""
+        partition_value, lower, upper, prefix = self.bounds(condition)
+        entries = self.partitions.get(partition_value, [])
+        start = bisect.bisect_left(entries, (lower[0],)) if lower else 0
+        if exclusive_start_key:
+            found = self.entry(exclusive_start_key)
+            if found is None:
+                raise _validation_error("query", "The provided starting key is invalid")
+            start = max(start, bisect.bisect_right(entries, found[1]))
+        for index in range(start, len(entries)):
+            entry = entries[index]
+            if not self.sort_key:
+                yield entry
+                continue
+            value = entry[0]
+            if lower and not lower[1] and value == lower[0]:
+                continue
+            if upper and (value > upper[0] or (value == upper[0] and not upper[1])):
+                return
+            if prefix is not None and not value.startswith(prefix):
+                return
+            yield entry
+
+
+class LocalTable:
+    """
+    Tabla en memoria con la parte de la API de boto3 (Table) que usa el servidor:
+    put_item, get_item, delete_item, scan (paginado y segmentado), query sobre índices secundarios y,
+    a través de 'meta.client', batch_write_item y update_table (crear o borrar GSI).
+    Los items se copian al entrar y al salir, como si pasaran por la red; los float se rechazan igual que en boto3.
+    """
+
+    def __init__(self, name, client, key_name='id', faults=None):
+        self.name = name
+        self.key_name = key_name  # clave de partición
+        self.meta = SimpleNamespace(client=client)
+        self._faults = faults
+        self._items = {}
+        self._indexes = {}  # nombre -> _LocalIndex
+        self._lock = threading.Lock()
+        self.table_status = "ACTIVE"
+        self.billing_mode_summary = {"BillingMode": "PAY_PER_REQUEST"}
+
+    def load(self):
+        """En boto3 verifica que la tabla exista; la tabla local siempre existe."""
+
+    reload = load  # en boto3 vuelve a leer la descripción (ej: estado de los índices); la local siempre está al día
+
+    @property
+    def global_secondary_indexes(self):
+        with self._lock:
+            return [index.describe() for index in self._indexes.values()] or None
+
+    def _before(self, operation):
+        if self._faults is not None:
+            self._faults.before(operation)
+
+    def _key_of(self, operation, item):
+        if self.key_name not in item:
+            raise _validation_error(operation, f"One of the required keys was not given a value: {self.key_name}")
+        return item[self.key_name]
+
+    @staticmethod
+    def _check_types(value):
+        if isinstance(value, float):
+            raise TypeError("Float types are not supported. Use Decimal types instead.")
+        if isinstance(value, dict):
+            for nested in value.values():
+                LocalTable._check_types(nested)
+        elif isinstance(value, (list, set, tuple)):
+            for nested in value:
+                LocalTable._check_types(nested)
+
+    def _store(self, operation, item):
+        """Guarda una copia del item y actualiza los índices (con el lock tomado)."""
+        key = self._key_of(operation, item)
+        for index in self._indexes.values():
+            index.check(operation, item)
+        self._remove(key)
+        item = self._items[key] = copy.deepcopy(item)
+        for index in self._indexes.values():
+            index.add(item)
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            for index in self._indexes.values():
+                index.remove(item)
+
+    def put_item(self, Item):
+        self._check_types(Item)
+        self._before("put_item")
+        with self._lock:
+            self._store("put_item", Item)
+        return {}
+
+    def get_item(self, Key):
+        self._before("get_item")
+        key = self._key_of("get_item", Key)
+        with self._lock:
+            item = self._items.get(key)
+        return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key):
+        self._before("delete_item")
+        with self._lock:
+            self._remove(self._key_of("delete_item", Key))
+        return {}
+
+    def scan(self, Segment=None, TotalSegments=None, Limit=None, ExclusiveStartKey=None):
+        """Scan en orden de clave. Con 'Limit' devuelve LastEvaluatedKey; con segmentos reparte las claves por hash."""
+        self._before("scan")
+        with self._lock:
+            keys = sorted(self._items, key=str)
+            if TotalSegments:
+                keys = [k for k in keys if zlib.crc32(str(k).encode('utf-8')) % TotalSegments == Segment]
+            if ExclusiveStartKey:
+                start = str(ExclusiveStartKey[self.key_name])
+                keys = [k for k in keys if str(k) > start]
+            page = keys[:Limit] if Limit else keys
+            items = [copy.deepcopy(self._items[k]) for k in page]
+        response = {"Items": items, "Count": len(items), "ScannedCount": len(items)}
+        if Limit and len(keys) > Limit:
+            response["LastEvaluatedKey"] = {self.key_name: page[-1]}
+        return response
+
+    def query(self, IndexName, KeyConditionExpression, Limit=None, ExclusiveStartKey=None):
+        """
+        Query sobre un GSI: igualdad en la clave de partición y condición opcional sobre la de orden, en orden
+        ascendente. El costo depende de la cantidad de items devueltos, no del tamaño de la tabla.
+        """
+        self._before("query")
+        with self._lock:
+            index = self._indexes.get(IndexName)
+            if index is None:
+                raise _validation_error("query", f"The table does not have the specified index: {IndexName}")
+            page, more = [], False
+            for entry in index.matching(KeyConditionExpression, ExclusiveStartKey):
+                if Limit and len(page) == Limit:
+                    more = True
+                    break
+                page.append(entry)
+            items = [copy.deepcopy(self._items[entry[-1]]) for entry in page]
+        response = {"Items": items, "Count": len(items), "ScannedCount": len(items)}
+        if more:
+            last = items[-1]
+            response["LastEvaluatedKey"] = {attribute: last[attribute] for attribute in
+                                            filter(None, (self.key_name, index.partition_key, index.sort_key))}
+        return response
+
+    def _update_indexes(self, attribute_definitions, updates):
+        """GlobalSecondaryIndexUpdates de UpdateTable. El backfill es inmediato: el índice queda ACTIVE."""
+        types = {definition["AttributeName"]: definition["AttributeType"] for definition in attribute_definitions}
+        with self._lock:
+            for update in updates:
+                if "Delete" in update:
+                    if self._indexes.pop(update["Delete"]["IndexName"], None) is None:
+                        raise _validation_error("update_table", "Requested resource not found")
+                    continue
+                create = update["Create"]
+                if create["IndexName"] in self._indexes:
+                    raise _validation_error("update_table", "Attempting to create an index which already exists")
+                index = _LocalIndex(create["IndexName"], create["KeySchema"], types, self.key_name)
+                for item in self._items.values():
+                    try:
+                        index.check("update_table", item)
+                    except ClientError:  # DynamoDB no indexa los items con otro tipo (violaciones del backfill)
+                        continue
+                    index.add(item)
+                self._indexes[index.name] = index
+
+    def _apply_batch(self, requests):
+        for request in requests:
+            if "PutRequest" in request:
+                item = request["PutRequest"]["Item"]
+                self._check_types(item)
+                with self._lock:
+                    self._store("batch_write_item", item)
+            else:
+                with self._lock:
+                    self._remove(self._key_of("batch_write_item", request["DeleteRequest"]["Key"]))
+
+
+class LocalClient:
+    """'meta.client' de las tablas locales: batch_write_item (que puede abarcar varias tablas) y update_table."""
+
+    def __init__(self, resource, faults=None):
+        self._resource = resource
+        self._faults = faults
+
+    def batch_write_item(self, RequestItems):
+        if self._faults is not None:
+            self._faults.before("batch_write_item")
+        for name, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise _validation_error("batch_write_item", "Too many items requested for the BatchWriteItem call")
+            self._resource.table_by_name(name)._apply_batch(requests)
+        return {"UnprocessedItems": {}}
+
+    def update_table(self, TableName, AttributeDefinitions=(), GlobalSecondaryIndexUpdates=()):
+        """Solo crea o borra GSI (operación de control: no pasa por el FaultInjector)."""
+        self._resource.table_by_name(TableName)._update_indexes(AttributeDefinitions, GlobalSecondaryIndexUpdates)
+        return {}
+
+
+class LocalDynamoResource:
+    """
+    Reemplazo en memoria de boto3.resource('dynamodb') para tests y desarrollo sin AWS.
+    Cada recurso tiene su espacio de nombres ('namespace' se antepone al nombre de la tabla),
+    así varios servidores en el mismo proceso no comparten datos.
+    """
+
+    def __init__(self, namespace="", faults=None):
+        self.namespace = namespace
+        self.faults = faults  # FaultInjector compartido por todas las tablas (o None)
+        self.meta = SimpleNamespace(client=LocalClient(self, faults))
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        """Devuelve la tabla 'name' (dentro del namespace), creándola la primera vez."""
+        return self.table_by_name(self.namespace + name)
+
+    def table_by_name(self, full_name):
+        with self._lock:
+            if full_name not in self._tables:
+                self._tables[full_name] = LocalTable(full_name, self.meta.client, faults=self.faults)
+            return self._tables[full_name]
+
+
+def local_tables():
+    """(CorporateData, CorporateLog) de un recurso local nuevo. Sirve de 'tables_factory' para run_workers."""
+    db = LocalDynamoResource()
+    return db.Table('CorporateData'), db.Table('CorporateLog')
@@ -0,0 +1,63 @@
+import unittest, os, sys, json, shutil, tempfile
+from decimal import Decimal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # paquete 'tests' (backend local y helpers) también al correr el archivo directo
+
+from modules.bulk import export_table, import_files
+from tests.helpers import FakeTable
+
+class TestBulk(unittest.TestCase):
+    """Export segmentado, import por lotes y retomar desde el checkpoint"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.items = [{"id": f"id-{i:04d}", "cp": "3260", "monto": Decimal("10.25"), "n": Decimal(i)} for i in range(230)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_export_import_gzip(self):
+        source = FakeTable("CorporateData", self.items)
+        out = os.path.join(self.tmp, 'export')
+        self.assertEqual(export_table(source, out, segments=3, compress=True, page_size=40), 230)
+
+        target = FakeTable("CorporateDataCopia")
+        paths = sorted(os.path.join(out, p) for p in os.listdir(out))
+        self.assertEqual(import_files(target, paths, workers=4), 230)
+        self.assertEqual(target.items, source.items)
+
+    def test_export_retoma_sin_duplicados(self):
+        out = os.path.join(self.tmp, 'export')
+        checkpoint = os.path.join(self.tmp, 'export.ckpt')
+        with self.assertRaises(ConnectionError):
+            export_table(FakeTable("CorporateData", self.items, fail_scan_after=4), out, segments=2,
+                         checkpoint_path=checkpoint, page_size=30)
+
+        source = FakeTable("CorporateData", self.items)
+        self.assertEqual(export_table(source, out, segments=2, checkpoint_path=checkpoint, page_size=30), 230)
+        ids = []
+        for name in sorted(os.listdir(out)):
+            with open(os.path.join(out, name)) as f:
+                ids.extend(json.loads(line)["id"] for line in f)
+        self.assertEqual(sorted(ids), sorted(source.items))
+
+    def test_import_retoma_desde_checkpoint(self):
+        path = os.path.join(self.tmp, 'items.jsonl')
+        with open(path, 'w') as f:
+            for item in self.items:
+                f.write(json.dumps({**item, "monto": 10.25, "n": int(item["n"])}) + "\n")
+        checkpoint = os.path.join(self.tmp, 'import.ckpt')
+        with open(checkpoint, 'w') as f:
+            json.dump({path: {"line": 200, "done": False}}, f)
+
+        target = FakeTable("CorporateData")
+        self.assertEqual(import_files(target, [path], workers=2, checkpoint_path=checkpoint), 30)
+        self.assertEqual(target.items["id-0229"]["monto"], Decimal("10.25"))
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)[path], {"line": 230, "done": True})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
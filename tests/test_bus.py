@@ -0,0 +1,126 @@
+import unittest, os, sys, json, time, socket, threading, multiprocessing
+from multiprocessing.connection import Client
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # paquete 'tests' (backend local y helpers) también al correr el archivo directo
+
+from modules.bus import NotificationBusHub, NotificationBusClient, BusIdempotencyCache
+from modules.idempotency import IdempotencyCache
+from tests.local_dynamo import local_tables
+from singletonproxyobserver import run_workers
+from tests.helpers import wait_until, free_port
+
+KEY = b"clave"
+
+class TestNotificationBus(unittest.TestCase):
+    """Hub del bus: reenvío sin bloquearse por un worker lento e idempotencia compartida entre workers"""
+
+    def setUp(self):
+        self.hub = NotificationBusHub(KEY, idempotency=IdempotencyCache(wait_timeout=2.0))
+        self.hub.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.hub.close()
+
+    def connect(self, on_event=lambda event: None):
+        client = NotificationBusClient(self.hub.address, KEY, on_event)
+        client.start()
+        self.clients.append(client)
+        self.assertTrue(wait_until(lambda: len(self.hub._workers) >= len(self.clients)))
+        return client
+
+    def test_worker_lento_no_frena_al_resto(self):
+        stuck = Client(self.hub.address, authkey=KEY)  # se conecta y nunca lee
+        self.addCleanup(stuck.close)
+        received = []
+        client = self.connect(received.append)
+        self.assertTrue(wait_until(lambda: len(self.hub._workers) == 2))
+        payload = "x" * 256 * 1024  # 40 x 256 KB llenan los buffers del socket del worker trabado
+        for n in range(40):
+            client.publish({"id": str(n), "payload": payload})
+        self.assertTrue(wait_until(lambda: len(received) == 40), f"solo llegaron {len(received)}")
+
+    def test_idempotencia_compartida_entre_workers(self):
+        first, second = BusIdempotencyCache(self.connect()), BusIdempotencyCache(self.connect())
+        key = first.make_key("cliente", "idreq-1")
+        self.assertIsNone(first.begin(key))  # el primer worker queda a cargo
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(second.begin(key)))
+        waiter.start()  # el reintento llega al otro worker y espera al original
+        time.sleep(0.1)
+        self.assertEqual(result, [])
+        first.complete(key, {"id": "a"}, 200)
+        waiter.join(5)
+        self.assertEqual(result, [({"id": "a"}, 200)])
+        self.assertEqual(second.begin(key), ({"id": "a"}, 200))
+
+    def test_idreq_reutilizado_en_otro_worker_responde_422(self):
+        first, second = BusIdempotencyCache(self.connect()), BusIdempotencyCache(self.connect())
+        key = first.make_key("cliente", "idreq-3")
+        self.assertIsNone(first.begin(key, "huella-a"))
+        self.assertEqual(second.begin(key, "huella-b")[1], 422)  # no espera al original: es otra operación
+        first.complete(key, {"id": "a"}, 200)
+        self.assertEqual(second.begin(key, "huella-b")[1], 422)
+        self.assertEqual(second.begin(key, "huella-a"), ({"id": "a"}, 200))
+
+    def test_worker_caido_libera_sus_claves(self):
+        crashed, other = self.connect(), BusIdempotencyCache(self.connect())
+        key = ("cliente", "idreq-2")
+        self.assertIsNone(BusIdempotencyCache(crashed).begin(key))
+        crashed.close()  # el worker se cae sin completar el request
+        self.assertIsNone(other.begin(key))  # el reintento queda a cargo en lugar de esperar para siempre
+
+
+class TestRunWorkers(unittest.TestCase):
+    """Modo multi-worker completo: un reintento en otra conexión (probablemente otro worker) no vuelve a escribir"""
+
+    def test_write_behind_con_varios_workers_no_arranca(self):
+        with self.assertRaises(SystemExit):  # sale antes de crear el hub o lanzar workers
+            run_workers('127.0.0.1', free_port(), 2, write_behind_dir=os.path.join(ROOT, 'data', 'wb-no-usado'))
+        self.assertFalse(os.path.exists(os.path.join(ROOT, 'data', 'wb-no-usado')))
+
+    def test_reintento_en_otro_worker(self):
+        port = free_port()
+        # spawn (como los workers): este proceso ya tiene hilos. Cada worker crea sus propias tablas locales
+        parent = multiprocessing.get_context("spawn").Process(
+            target=run_workers, args=('127.0.0.1', port, 2),
+            kwargs={"tables_factory": local_tables, "log_options": {"level": "WARNING"}})
+        parent.start()
+        self.addCleanup(parent.join, 5)
+        self.addCleanup(parent.terminate)
+
+        def request(data):
+            with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+                sock.sendall(json.dumps(data).encode('utf-8'))
+                sock.shutdown(socket.SHUT_WR)
+                return json.loads(sock.makefile('rb').read())
+
+        def listening():
+            try:
+                return request({"ACTION": "stats"})["idempotency"]["shared"]
+            except OSError:
+                return False
+        self.assertTrue(wait_until(listening, 10))
+
+        subscriber = socket.create_connection(('127.0.0.1', port), timeout=5)
+        self.addCleanup(subscriber.close)
+        subscriber.sendall(json.dumps({"ACTION": "subscribe", "UUID": "obs"}).encode('utf-8'))
+        lines = subscriber.makefile('rb')
+        self.assertEqual(json.loads(lines.readline())["status"], "OK")  # la confirmación es la primera línea
+
+        for _ in range(12):  # cada reintento es una conexión nueva, el kernel la reparte entre los workers
+            resp = request({"ACTION": "set", "id": "a", "valor": 1, "idreq": "r-1", "UUID": "c"})
+            self.assertEqual(resp["id"], "a")
+        request({"ACTION": "set", "id": "b", "UUID": "c"})  # marca el final
+
+        events = [json.loads(lines.readline()) for _ in range(2)]
+        events = [event for event in events if event.get("EVENT") != "heartbeat"]
+        self.assertEqual([event["ID"] for event in events], ["a", "b"])  # una sola notificación de 'a'
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
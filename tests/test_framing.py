@@ -0,0 +1,111 @@
+import unittest, os, sys, json, socket, threading, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from modules.framing import RecvBuffer, LineReader, recv_json, recv_all, MessageTooLarge
+
+def send_in_pieces(sock, data, size, close=True, delay=0.0):
+    """Envía 'data' en pedazos de 'size' bytes desde otro hilo."""
+    def run():
+        try:
+            for start in range(0, len(data), size):
+                sock.sendall(data[start:start + size])
+                if delay:
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):  # el lector cortó antes (ej: mensaje demasiado largo)
+            return
+        if close:
+            sock.close()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+class TestFraming(unittest.TestCase):
+    """Buffers con recv_into, límites de tamaño y decodificación incremental"""
+
+    def setUp(self):
+        self.reader_side, self.writer_side = socket.socketpair()
+        self.reader_side.settimeout(2)
+
+    def tearDown(self):
+        self.reader_side.close()
+        self.writer_side.close()
+
+    def test_request_en_varios_segmentos_sin_cerrar(self):
+        payload = json.dumps({"ACTION": "set", "id": "a", "texto": "}" * 5000 + "ñ" * 3000}).encode('utf-8')
+        send_in_pieces(self.writer_side, payload, 997, close=False)
+        self.assertEqual(recv_json(self.reader_side)["texto"], "}" * 5000 + "ñ" * 3000)
+
+    def test_string_cortado_despues_de_una_llave(self):
+        send_in_pieces(self.writer_side, b'{"a": "x}', 100, close=False)
+        time.sleep(0.05)
+        send_in_pieces(self.writer_side, b'y"}', 100, close=False)
+        self.assertEqual(recv_json(self.reader_side), {"a": "x}y"})
+
+    def test_json_invalido_falla_sin_esperar_al_cierre(self):
+        self.writer_side.sendall(b'{"a": }')
+        with self.assertRaises(json.JSONDecodeError):
+            recv_json(self.reader_side)
+
+    def test_cierre_sin_datos_y_tope(self):
+        self.writer_side.close()
+        self.assertIsNone(recv_json(self.reader_side))
+        reader_side, writer_side = socket.socketpair()
+        send_in_pieces(writer_side, b'{"a": "' + b"x" * 100000, 4096)
+        with self.assertRaises(MessageTooLarge):
+            recv_json(reader_side, max_size=50000)
+        reader_side.close()
+
+    def test_recv_all_respuesta_grande(self):
+        payload = json.dumps([{"id": str(i), "v": "x" * 100} for i in range(30000)]).encode('utf-8')
+        send_in_pieces(self.writer_side, payload, 65536)
+        self.assertEqual(recv_all(self.reader_side).encode('utf-8'), payload)
+
+    def test_line_reader_utf8_partido_y_compactacion(self):
+        lines = [json.dumps({"n": i, "texto": "ñandú"}, ensure_ascii=False).encode('utf-8') for i in range(500)]
+        send_in_pieces(self.writer_side, b"\n".join(lines) + b"\n", 7)
+        reader = LineReader(initial_size=64)
+        received = []
+        while reader.recv_from(self.reader_side, min_free=16):
+            received.extend(reader.lines())
+        self.assertEqual(received, [line.decode('utf-8') for line in lines])
+        self.assertEqual(len(reader), 0)
+
+    def test_line_reader_linea_grande_sin_agrandar_el_buffer(self):
+        big = json.dumps({"texto": "ñandú " * 50000}, ensure_ascii=False).encode('utf-8')
+        send_in_pieces(self.writer_side, big + b"\n" + b'{"n": 1}\n', 65536)
+        reader = LineReader(initial_size=1024)
+        received = []
+        while len(received) < 2 and reader.recv_from(self.reader_side):
+            received.extend(reader.lines())
+        self.assertEqual(received, [big.decode('utf-8'), '{"n": 1}'])
+        self.assertEqual(len(reader._buf), 1024)  # la línea de ~400 KB se decodificó por partes
+
+    def test_recv_all_utf8_partido_entre_chunks(self):
+        payload = ("ñandú " * 5000).encode('utf-8')
+        send_in_pieces(self.writer_side, payload, 333)
+        self.assertEqual(recv_all(self.reader_side, chunk_size=101), "ñandú " * 5000)
+        reader_side, writer_side = socket.socketpair()
+        send_in_pieces(writer_side, b"x" * 5000, 500)
+        with self.assertRaises(MessageTooLarge):
+            recv_all(reader_side, max_size=1000)
+        reader_side.close()
+
+    def test_line_reader_tope_de_linea(self):
+        reader = LineReader(initial_size=64, max_size=1000)
+        send_in_pieces(self.writer_side, b"x" * 5000, 500)
+        with self.assertRaises(MessageTooLarge):
+            while reader.recv_from(self.reader_side, min_free=16):
+                reader.lines()
+
+    def test_consume_y_texto(self):
+        buffer = RecvBuffer(initial_size=8)
+        self.writer_side.sendall('{"a": 1} ñ'.encode('utf-8'))
+        buffer.recv_from(self.reader_side, min_free=64)
+        buffer.consume(len(b'{"a": 1} '))
+        self.assertEqual(buffer.text(), "ñ")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
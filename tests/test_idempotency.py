@@ -0,0 +1,80 @@
+import unittest, os, sys, time, threading
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from modules.idempotency import IdempotencyCache, request_fingerprint
+
+class TestIdempotencyCache(unittest.TestCase):
+    """Duplicados, errores 5xx, TTL, límite de tamaño y duplicados concurrentes"""
+
+    def test_duplicado_devuelve_respuesta_guardada(self):
+        cache = IdempotencyCache()
+        key = cache.make_key("uuid-1", 10101)
+        self.assertIsNone(cache.begin(key))
+        cache.complete(key, {"id": "444111222"}, 200)
+
+        self.assertEqual(cache.begin(key), ({"id": "444111222"}, 200))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_sin_idreq_no_se_cachea(self):
+        cache = IdempotencyCache()
+        self.assertIsNone(cache.make_key("uuid-1", None))
+        self.assertIsNone(cache.begin(None))
+        cache.complete(None, {}, 200)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_error_de_servidor_permite_reintento(self):
+        cache = IdempotencyCache()
+        key = cache.make_key("uuid-1", "9001")
+        cache.begin(key)
+        cache.complete(key, {"error": "Fallo interno de auditoría"}, 500)
+        self.assertIsNone(cache.begin(key))
+
+    def test_ttl_y_limite(self):
+        cache = IdempotencyCache(max_entries=2, ttl_seconds=0.05)
+        for i in range(3):
+            key = cache.make_key("uuid-1", i)
+            cache.begin(key)
+            cache.complete(key, {"n": i}, 200)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertIsNone(cache.begin(cache.make_key("uuid-1", 0)))
+
+        time.sleep(0.1)
+        self.assertIsNone(cache.begin(cache.make_key("uuid-1", 2)))
+        self.assertGreaterEqual(cache.stats()["expirations"], 1)
+
+    def test_duplicado_concurrente_espera_al_original(self):
+        cache = IdempotencyCache()
+        key = cache.make_key("uuid-1", "9001")
+        self.assertIsNone(cache.begin(key))
+
+        results = []
+        t = threading.Thread(target=lambda: results.append(cache.begin(key)))
+        t.start()
+        time.sleep(0.05)
+        cache.complete(key, {"ok": True}, 200)
+        t.join(2)
+
+        self.assertEqual(results, [({"ok": True}, 200)])
+        self.assertEqual(cache.stats()["in_flight_hits"], 1)
+
+    def test_mismo_idreq_con_otro_contenido_responde_422(self):
+        cache = IdempotencyCache()
+        key = cache.make_key("uuid-1", 10101)
+        original = {"ACTION": "set", "id": "444111222", "cp": "3260", "idreq": 10101, "UUID": "uuid-1"}
+        changed = dict(original, cp="3100")
+        self.assertIsNone(cache.begin(key, request_fingerprint(original)))
+        self.assertEqual(cache.begin(key, request_fingerprint(changed))[1], 422)  # el original sigue en curso
+        cache.complete(key, {"id": "444111222"}, 200)
+
+        self.assertEqual(cache.begin(key, request_fingerprint(changed))[1], 422)
+        retry = dict(original, DEADLINE_MS=500)  # ACTION/UUID/DEADLINE_MS no cambian la huella
+        self.assertEqual(cache.begin(key, request_fingerprint(retry)), ({"id": "444111222"}, 200))
+        self.assertEqual(cache.stats()["conflicts"], 2)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
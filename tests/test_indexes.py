@@ -0,0 +1,100 @@
+import unittest, os, sys
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # paquete 'tests' (backend local y helpers) también al correr el archivo directo
+
+from modules.indexes import IndexCatalog, ensure_indexes
+from tests.local_dynamo import LocalDynamoResource
+
+CIUDADES = [("Parana", "Entre Rios", "3100"), ("Concepcion del Uruguay", "Entre Rios", "3260"),
+            ("Gualeguaychu", "Entre Rios", "2820"), ("Colon", "Entre Rios", "3280"), ("Rosario", "Santa Fe", "2000")]
+
+class TestIndexes(unittest.TestCase):
+    """Índices secundarios: plan del WHERE, GSI del backend local y paginación con cursor"""
+
+    def setUp(self):
+        self.catalog = IndexCatalog()
+        self.table = LocalDynamoResource().Table('CorporateData')
+        for n in range(500):
+            ciudad, provincia, cp = CIUDADES[n % len(CIUDADES)]
+            self.table.put_item(Item={"id": f"{n:04d}", "ciudad": ciudad, "provincia": provincia, "cp": cp})
+        self.table.put_item(Item={"id": "sin-cp", "ciudad": "Parana", "provincia": "Entre Rios"})
+        self.assertEqual(ensure_indexes(self.table, self.catalog), self.catalog.names())  # backfill
+
+    def query(self, where, limit=1000, cursor=None):
+        plan = self.catalog.plan(where, limit, cursor)
+        response = self.table.query(**plan)
+        return response, self.catalog.encode_cursor(plan["IndexName"], response.get("LastEvaluatedKey"))
+
+    def test_igualdad_y_rango_leen_solo_el_resultado(self):
+        response, cursor = self.query({"ciudad": "Colon"})
+        self.assertEqual(response["Count"], 100)
+        self.assertEqual(response["ScannedCount"], 100)  # no recorre las otras 400 filas
+        self.assertIsNone(cursor)
+
+        response, _ = self.query({"provincia": "Entre Rios", "cp": {"between": ["3200", "3299"]}})
+        self.assertEqual({item["cp"] for item in response["Items"]}, {"3260", "3280"})
+        self.assertEqual(response["ScannedCount"], 200)
+        response, _ = self.query({"provincia": "Entre Rios", "cp": {"begins_with": "31"}})
+        self.assertEqual(response["Count"], 100)
+        response, _ = self.query({"provincia": "Entre Rios", "cp": {"gt": "3260"}})
+        self.assertEqual({item["cp"] for item in response["Items"]}, {"3280"})
+        response, _ = self.query({"provincia": "Entre Rios"})  # el item sin 'cp' no está en este índice
+        self.assertEqual(response["Count"], 400)
+        response, _ = self.query({"cp": "2000"})
+        self.assertEqual({item["ciudad"] for item in response["Items"]}, {"Rosario"})
+
+    def test_paginacion_con_cursor(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            response, cursor = self.query({"provincia": "Entre Rios", "cp": {"gte": "3000"}}, limit=70, cursor=cursor)
+            seen.extend(item["id"] for item in response["Items"])
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 5)  # 300 items en páginas de 70
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 300)
+        with self.assertRaises(ValueError):  # cursor de otro índice
+            self.catalog.plan({"ciudad": "Colon"}, cursor=self.query({"cp": "3100"}, limit=1)[1])
+
+    def test_indices_se_actualizan_con_cada_escritura(self):
+        self.table.put_item(Item={"id": "0000", "ciudad": "Victoria", "provincia": "Entre Rios", "cp": "3153"})
+        self.table.delete_item(Key={"id": "0001"})
+        self.assertEqual([i["id"] for i in self.query({"ciudad": "Victoria"})[0]["Items"]], ["0000"])
+        self.assertEqual(self.query({"ciudad": "Parana"})[0]["Count"], 100)  # 100 - "0000" + "sin-cp"
+        self.assertEqual(self.query({"ciudad": "Concepcion del Uruguay"})[0]["Count"], 99)
+        with self.assertRaises(ClientError):  # tipo distinto al del índice, como en DynamoDB
+            self.table.put_item(Item={"id": "x", "cp": Decimal(3260)})
+        self.assertEqual(ensure_indexes(self.table, self.catalog), [])  # ya existen
+
+    def test_tipos_de_las_claves_de_indice(self):
+        self.catalog.check_item({"id": "a", "ciudad": "Colon", "cp": "3280", "domicilio": 3260})  # 'domicilio' no es de un índice
+        self.catalog.check_item({"id": "b"})  # sin atributos de índice
+        for item, index in [({"id": "x", "cp": 3260}, "provincia-cp-index"), ({"id": "x", "ciudad": None}, "ciudad-index"),
+                            ({"id": "x", "provincia": ""}, "provincia-cp-index"), ({"id": "x", "ciudad": ["Colon"]}, "ciudad-index")]:
+            with self.subTest(item=item), self.assertRaisesRegex(ValueError, index):
+                self.catalog.check_item(item)
+        numeric = IndexCatalog([{"name": "edad-index", "partition_key": "edad", "types": {"edad": "N"}}])
+        numeric.check_item({"id": "a", "edad": 30.5})
+        with self.assertRaisesRegex(ValueError, "edad-index"):
+            numeric.check_item({"id": "a", "edad": "30"})
+        with self.assertRaises(ClientError):  # el backend local rechaza lo mismo que DynamoDB
+            self.table.put_item(Item={"id": "x", "ciudad": ""})
+
+    def test_where_invalido(self):
+        for where, limit in [({}, None), ({"domicilio": "Av Del Oeste 123"}, None), ({"cp": {"gt": "3000"}}, None),
+                             ({"provincia": "Entre Rios", "cp": {"like": "3"}}, None),
+                             ({"provincia": "Entre Rios", "cp": {"between": ["1"]}}, None),
+                             ({"ciudad": 3260}, None), ({"ciudad": "Colon"}, 0), ({"ciudad": "Colon"}, 5000)]:
+            with self.subTest(where=where, limit=limit), self.assertRaises(ValueError):
+                self.catalog.plan(where, limit)
+        with self.assertRaises(ValueError):
+            self.catalog.plan({"ciudad": "Colon"}, cursor="no-es-un-cursor")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
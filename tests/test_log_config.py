@@ -0,0 +1,130 @@
+import unittest, os, sys, io, json, atexit, random, logging, threading
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from modules import log_config
+from modules.log_config import setup_logging, RequestLogSampler, DeferredQueueHandler, REQUEST_LOG
+
+def make_record(level, per_request=False, msg="mensaje"):
+    record = logging.LogRecord("test", level, __file__, 1, msg, None, None)
+    if per_request:
+        record.__dict__.update(REQUEST_LOG)
+    return record
+
+class TestLogConfig(unittest.TestCase):
+    """Formato JSON/texto, muestreo de logs por request y formateo en el hilo escritor"""
+
+    def setUp(self):
+        root = logging.getLogger()
+        self.saved = (list(root.handlers), root.level)
+        self.stream = io.StringIO()
+        self.listener = None
+
+    def tearDown(self):
+        self.stop_listener()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in self.saved[0]:
+            root.addHandler(handler)
+        root.setLevel(self.saved[1])
+
+    def stop_listener(self):
+        """Detiene el listener (vacía la cola). Se saca del atexit, QueueListener.stop() falla si se llama dos veces."""
+        if self.listener is not None:
+            self.listener.stop()
+            atexit.unregister(self.listener.stop)
+            self.listener = None
+
+    def log_lines(self, **options):
+        """Configura el logging con 'options', loguea dos líneas y devuelve lo que escribió el listener."""
+        self.listener = setup_logging(stream=self.stream, **options)
+        logger = logging.getLogger("modules.prueba")
+        logger.info("Cliente %s conectado", "127.0.0.1:5000")
+        try:
+            raise ValueError("falla")
+        except ValueError:
+            logger.error("Error inesperado", exc_info=True)
+        self.stop_listener()
+        return self.stream.getvalue()
+
+    @unittest.skipIf(log_config.jsonlogger is None, "python-json-logger no instalado")
+    def test_formato_json(self):
+        lines = self.log_lines(json_format=True).splitlines()
+        info, error = json.loads(lines[0]), json.loads(lines[1])
+        self.assertEqual((info["name"], info["levelname"], info["message"]), ("modules.prueba", "INFO", "Cliente 127.0.0.1:5000 conectado"))
+        self.assertEqual(info["threadName"], threading.current_thread().name)  # el del hilo que logueó, no el del listener
+        self.assertIn("ValueError: falla", error["exc_info"])
+
+    def test_formato_texto(self):
+        output = self.log_lines(json_format=False)
+        self.assertRegex(output.splitlines()[0], r"^\S+ \S+ - modules\.prueba - INFO - Cliente 127\.0\.0\.1:5000 conectado$")
+        self.assertIn("modules.prueba - ERROR - Error inesperado", output)
+        self.assertIn("ValueError: falla", output)  # traceback resuelto antes de encolar
+
+    def test_nivel_filtra(self):
+        output = self.log_lines(level=logging.WARNING, json_format=False)
+        self.assertNotIn("INFO", output)
+        self.assertIn("ERROR", output)
+
+    def test_muestreo_solo_de_info_por_request(self):
+        sampler = RequestLogSampler(0.2)
+        random.seed(7)
+        kept = sum(sampler.filter(make_record(logging.INFO, per_request=True)) for _ in range(5000))
+        self.assertTrue(800 < kept < 1200, kept)  # ~20%
+        for level in (logging.WARNING, logging.ERROR):  # pasan siempre, aunque estén marcados
+            self.assertTrue(all(sampler.filter(make_record(level, per_request=True)) for _ in range(200)))
+        self.assertTrue(all(sampler.filter(make_record(logging.INFO)) for _ in range(200)))  # INFO sin marcar
+        self.assertTrue(all(RequestLogSampler(1.0).filter(make_record(logging.INFO, per_request=True)) for _ in range(200)))
+
+    def test_muestreo_en_setup_logging(self):
+        self.listener = setup_logging(stream=self.stream, json_format=False, request_sample_rate=0.0)
+        logger = logging.getLogger("modules.prueba")
+        logger.info("por request", extra=REQUEST_LOG)
+        logger.warning("lento", extra=REQUEST_LOG)
+        logger.info("arranque")
+        self.stop_listener()
+        output = self.stream.getvalue()
+        self.assertNotIn("por request", output)
+        self.assertIn("lento", output)
+        self.assertIn("arranque", output)
+
+    def test_formateo_en_el_hilo_escritor(self):
+        formatted_in = []
+
+        class RecordingFormatter(logging.Formatter):
+            def format(self, record):
+                formatted_in.append(threading.current_thread())
+                return super().format(record)
+
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(RecordingFormatter("%(levelname)s %(message)s"))
+        queue = log_config.SimpleQueue()
+        listener = log_config.QueueListener(queue, handler)
+        listener.start()
+        logger = logging.getLogger("modules.prueba.diferido")
+        logger.propagate = False
+        queue_handler = DeferredQueueHandler(queue)
+        logger.addHandler(queue_handler)
+        try:
+            logger.warning("item %s de %d", "abc", 3)
+            try:
+                raise KeyError("id")
+            except KeyError:
+                logger.error("falla", exc_info=True)
+        finally:
+            logger.removeHandler(queue_handler)
+            logger.propagate = True
+            listener.stop()
+
+        self.assertEqual(len(formatted_in), 2)
+        self.assertNotIn(threading.current_thread(), formatted_in)  # nunca en el hilo que loguea
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(lines[0], "WARNING item abc de 3")
+        self.assertEqual(lines[1], "ERROR falla")
+        self.assertIn("KeyError: 'id'", self.stream.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
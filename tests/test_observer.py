@@ -0,0 +1,163 @@
+import unittest, os, sys, socket, json, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # paquete 'tests' (backend local y helpers) también al correr el archivo directo
+
+from modules.observer import NotificationManager
+from modules.versions import ItemVersions
+from modules.bus import NotificationBusHub, NotificationBusClient
+from tests.helpers import wait_until
+
+_readers = {}
+
+def read_line(sock, timeout=2):
+    """Lee una línea del socket (se guarda un archivo por socket para no perder lo que llegó de más)."""
+    sock.settimeout(timeout)
+    if sock not in _readers:
+        _readers[sock] = sock.makefile('rb')
+    return _readers[sock].readline()
+
+class TestNotificationManager(unittest.TestCase):
+    """Loop de I/O con selectors: notificaciones, desconexiones y heartbeats"""
+
+    def setUp(self):
+        self.manager = NotificationManager(heartbeat_interval=3600)
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_notifica_como_lineas_json(self):
+        server_side, client_side = socket.socketpair()
+        self.manager.subscribe(server_side, "uuid-1")
+        self.assertTrue(wait_until(lambda: self.manager.stats()["subscribers"] == 1))
+        self.manager.notify({"id": "a", "v": 1})
+        message = json.loads(read_line(client_side))
+        self.assertEqual(message, {"EVENT": "update", "ID": "a", "VERSION": 1, "DATA": {"id": "a", "v": 1}})
+        client_side.close()
+
+    def test_modo_delta_y_snapshot(self):
+        full_server, full_client = socket.socketpair()
+        delta_server, delta_client = socket.socketpair()
+        self.manager.subscribe(full_server, "uuid-1")
+        self.manager.subscribe(delta_server, "uuid-2", mode="delta")
+        self.assertTrue(wait_until(lambda: self.manager.stats()["delta_subscribers"] == 1))
+        self.manager.notify({"id": "a", "v": 1, "big": "x" * 100})
+        self.manager.notify({"id": "a", "v": 2, "big": "x" * 100})
+        # Sin valor anterior el primer evento va completo también en modo delta
+        self.assertEqual(json.loads(read_line(delta_client))["EVENT"], "update")
+        self.assertEqual(json.loads(read_line(delta_client)),
+                         {"EVENT": "delta", "ID": "a", "VERSION": 2, "CHANGES": {"v": 2}, "REMOVED": []})
+        read_line(full_client)
+        self.assertEqual(json.loads(read_line(full_client))["DATA"]["v"], 2)
+
+        delta_client.sendall(b'{"ACTION": "snapshot", "ID": "a"}\n')
+        snapshot = json.loads(read_line(delta_client))
+        self.assertEqual((snapshot["EVENT"], snapshot["VERSION"], snapshot["DATA"]["v"]), ("snapshot", 2, 2))
+        full_client.close()
+        delta_client.close()
+
+    def test_desconexion_libera_al_suscriptor(self):
+        server_side, client_side = socket.socketpair()
+        self.manager.subscribe(server_side, "uuid-1")
+        self.assertTrue(wait_until(lambda: self.manager.stats()["subscribers"] == 1))
+        client_side.close()
+        # Sin que nadie notifique, el loop detecta el cierre y suelta el socket
+        self.assertTrue(wait_until(lambda: self.manager.stats()["subscribers"] == 0))
+
+    def test_descarta_peers_que_dejan_de_responder_heartbeats(self):
+        manager = NotificationManager(heartbeat_interval=0.05, heartbeat_timeout=0.2)
+        try:
+            server_side, client_side = socket.socketpair()
+            manager.subscribe(server_side, "uuid-1")
+            self.assertEqual(json.loads(read_line(client_side)), {"EVENT": "heartbeat"})
+            client_side.sendall(b'{"ACTION": "pong"}\n')
+            # Después del pong el cliente queda mudo: se descarta al pasar el timeout
+            self.assertTrue(wait_until(lambda: manager.stats()["dropped_dead"] == 1))
+            self.assertEqual(manager.stats()["subscribers"], 0)
+            client_side.close()
+        finally:
+            manager.close()
+
+    def test_confirmacion_despues_del_registro(self):
+        server_side, client_side = socket.socketpair()
+        self.manager.subscribe(server_side, "uuid-1", ack=b'{"status": "OK"}\n')
+        self.manager.notify({"id": "a", "v": 1})  # sin esperar: la notificación no se pierde ni se adelanta al OK
+        self.assertEqual(read_line(client_side), b'{"status": "OK"}\n')
+        self.assertEqual(read_line(client_side), b'{"EVENT": "update", "ID": "a", "VERSION": 1, "DATA": {"id": "a", "v": 1}}\n')
+        client_side.close()
+
+    def test_descarta_peers_mudos_desde_la_suscripcion(self):
+        manager = NotificationManager(heartbeat_interval=0.05, max_silent_heartbeats=3)
+        try:
+            silent_server, silent_client = socket.socketpair()  # peer medio abierto: recibe pero nunca manda nada
+            active_server, active_client = socket.socketpair()
+            manager.subscribe(silent_server, "uuid-1")
+            manager.subscribe(active_server, "uuid-2")
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:  # el otro responde cada heartbeat
+                if json.loads(read_line(active_client)) == {"EVENT": "heartbeat"}:
+                    active_client.sendall(b'{"ACTION": "pong"}\n')
+            self.assertEqual(manager.stats()["dropped_dead"], 1)
+            self.assertEqual(manager.stats()["subscribers"], 1)
+            silent_client.close()
+            active_client.close()
+        finally:
+            manager.close()
+
+
+class TestItemVersions(unittest.TestCase):
+    """Versiones por id, diff de atributos y secuenciado en el hub del bus"""
+
+    def test_diff_y_versiones(self):
+        versions = ItemVersions(max_items=1)
+        self.assertNotIn("changes", versions.apply({"id": "a", "v": 1, "x": 1}))
+        event = versions.apply({"id": "a", "v": 2})
+        self.assertEqual((event["version"], event["changes"], event["removed"]), (2, {"v": 2}, ["x"]))
+        # 'b' desaloja a 'a' del LRU: la versión sigue creciendo pero el evento va sin diff
+        versions.apply({"id": "b"})
+        event = versions.apply({"id": "a", "v": 3})
+        self.assertEqual(event["version"], 3)
+        self.assertNotIn("changes", event)
+
+    def test_versiones_acotadas_y_monotonicas(self):
+        versions = ItemVersions(max_items=2, max_versions=3)
+        for n in range(10):
+            versions.apply({"id": f"item-{n}"})
+        versions.apply({"id": "a"})
+        last = versions.apply({"id": "a"})["version"]
+        for n in range(10, 15):
+            versions.apply({"id": f"item-{n}"})  # 'a' se olvida
+        self.assertEqual(len(versions._versions), 3)
+        self.assertEqual(versions.latest("a"), (0, None))
+        event = versions.apply({"id": "a"})
+        self.assertGreater(event["version"], last)  # no retrocede aunque se haya olvidado
+        self.assertNotIn("changes", event)
+
+    def test_remember_no_retrocede(self):
+        versions = ItemVersions()
+        versions.remember({"id": "a", "version": 5, "item": {"id": "a", "v": 5}})
+        versions.remember({"id": "a", "version": 4, "item": {"id": "a", "v": 4}})
+        self.assertEqual(versions.latest("a"), (5, {"id": "a", "v": 5}))
+        self.assertEqual(versions.latest("zz"), (0, None))
+
+    def test_hub_asigna_versiones(self):
+        hub = NotificationBusHub(b"clave", sequencer=ItemVersions().apply)
+        hub.start()
+        received = []
+        client = NotificationBusClient(hub.address, b"clave", received.append)
+        client.start()
+        try:
+            self.assertTrue(wait_until(lambda: len(hub._workers) == 1))
+            client.publish({"id": "a", "v": 1})
+            client.publish({"id": "a", "v": 2})
+            self.assertTrue(wait_until(lambda: len(received) == 2))
+            self.assertEqual([event["version"] for event in received], [1, 2])
+            self.assertEqual(received[1]["changes"], {"v": 2})
+        finally:
+            client.close()
+            hub.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
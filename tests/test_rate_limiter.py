@@ -0,0 +1,69 @@
+import unittest, os, sys, threading, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from modules.rate_limiter import RateLimiter
+from modules.scheduler import PriorityScheduler, SchedulerFullError
+
+class TestRateLimiter(unittest.TestCase):
+    """Token buckets por UUID/acción y configuración desde archivo"""
+
+    def test_burst_y_retry_after(self):
+        limiter = RateLimiter({"default": {"list": {"rate": 1, "burst": 2}}})
+        self.assertTrue(limiter.check("uuid-1", "list")[0])
+        self.assertTrue(limiter.check("uuid-1", "list")[0])
+        allowed, retry_after = limiter.check("uuid-1", "list")
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        # Otro cliente tiene su propio bucket y las acciones sin limite no se limitan
+        self.assertTrue(limiter.check("uuid-2", "list")[0])
+        self.assertTrue(limiter.check("uuid-1", "get")[0])
+        self.assertEqual(limiter.stats()["throttled_by_action"], {"list": 1})
+
+    def test_limite_especifico_por_cliente(self):
+        limiter = RateLimiter({
+            "default": {"list": {"rate": 1, "burst": 1}},
+            "clients": {"vip": {"list": {"rate": 1, "burst": 3}}}
+        })
+        self.assertEqual([limiter.check("vip", "list")[0] for _ in range(4)], [True, True, True, False])
+
+    def test_config_de_ejemplo(self):
+        limiter = RateLimiter.from_file(os.path.join(ROOT, 'config', 'rate_limits.json'))
+        self.assertTrue(limiter.check("uuid-1", "list")[0])
+        # el override usa el UUID que mandan los clientes: str(uuid.getnode()) de la MAC 02:42:ac:11:00:02
+        self.assertEqual([limiter.check(0x0242ac110002, "list")[0] for _ in range(6)], [True] * 5 + [False])
+
+
+class TestPriorityScheduler(unittest.TestCase):
+    """Los 'get' pasan delante de los scans en cola y la cola es acotada"""
+
+    def test_prioridad_y_cola_llena(self):
+        scheduler = PriorityScheduler(workers=1, max_queue=3)
+        gate = threading.Event()
+        order = []
+        scheduler.submit(0, gate.wait)  # ocupa el unico hilo
+        time.sleep(0.05)
+        futures = [
+            scheduler.submit(2, order.append, "list"),
+            scheduler.submit(2, order.append, "list_logs"),
+            scheduler.submit(0, order.append, "get"),
+        ]
+        with self.assertRaises(SchedulerFullError):
+            scheduler.submit(0, order.append, "get-2")
+        gate.set()
+        for f in futures:
+            f.result(2)
+        self.assertEqual(order, ["get", "list", "list_logs"])
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+        scheduler.shutdown()
+
+    def test_excepcion_se_propaga(self):
+        scheduler = PriorityScheduler(workers=1)
+        with self.assertRaises(ZeroDivisionError):
+            scheduler.submit(0, lambda: 1 / 0).result(2)
+        scheduler.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
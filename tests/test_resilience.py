@@ -0,0 +1,83 @@
+import unittest, os, sys, time, threading
+from botocore.exceptions import ClientError
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from modules.resilience import (DynamoGuard, CircuitBreaker, AdaptiveLimiter, Deadline,
+                                DeadlineExceeded, CircuitOpenError)
+
+def throttling_error():
+    return ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"},
+                        "ResponseMetadata": {"HTTPStatusCode": 400}}, "GetItem")
+
+class TestResilience(unittest.TestCase):
+    """Deadlines, circuit breaker, concurrencia adaptativa y lecturas hedged"""
+
+    def test_deadline_desde_request(self):
+        self.assertLessEqual(Deadline.from_request({"DEADLINE_MS": 500}, 8.0).remaining(), 0.5)
+        self.assertGreater(Deadline.from_request({"DEADLINE_MS": 60000}, 8.0).remaining(), 7.0)
+        self.assertGreater(Deadline.from_request({"DEADLINE_MS": "x"}, 8.0).remaining(), 7.0)
+
+    def test_deadline_corta_llamada_lenta(self):
+        guard = DynamoGuard()
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            guard.call("get_item", lambda: time.sleep(1), Deadline(0.1))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(guard.stats()["timeouts"], 1)
+
+    def test_breaker_abre_y_se_recupera(self):
+        guard = DynamoGuard(breaker=CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, open_seconds=0.1))
+        def fail():
+            raise throttling_error()
+        for _ in range(4):
+            with self.assertRaises(ClientError):
+                guard.call("put_item", fail)
+        with self.assertRaises(CircuitOpenError):
+            guard.call("put_item", lambda: "ok")
+        time.sleep(0.15)
+        self.assertEqual(guard.call("put_item", lambda: "ok"), "ok")  # prueba half_open
+        self.assertEqual(guard.breaker.state, "closed")
+
+    def test_deadline_del_cliente_no_abre_el_breaker(self):
+        guard = DynamoGuard(operation_timeouts={"get_item": 0.05},
+                            breaker=CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, open_seconds=5))
+        for _ in range(4):  # un cliente con DEADLINE_MS=10: vence su deadline, no el tope de la operación
+            with self.assertRaises(DeadlineExceeded):
+                guard.call("get_item", lambda: time.sleep(0.2), Deadline(0.01))
+        self.assertEqual(guard.breaker.state, "closed")
+
+        for _ in range(4):  # ahora vence el tope de 'get_item': DynamoDB no responde
+            with self.assertRaises(DeadlineExceeded):
+                guard.call("get_item", lambda: time.sleep(0.2), Deadline(5))
+        self.assertEqual(guard.breaker.state, "open")
+
+    def test_throttling_reduce_concurrencia(self):
+        limiter = AdaptiveLimiter(initial=16, minimum=2)
+        guard = DynamoGuard(limiter=limiter)
+        def fail():
+            raise throttling_error()
+        with self.assertRaises(ClientError):
+            guard.call("scan", fail)
+        time.sleep(0.05)  # el lugar se libera en el callback del future
+        self.assertEqual(limiter.stats(), {"limit": 8, "in_flight": 0})
+
+    def test_get_hedged(self):
+        guard = DynamoGuard(hedge_delay=0.05)
+        calls = []
+        lock = threading.Lock()
+        def slow_first():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            time.sleep(1 if first else 0)
+            return "primero" if first else "hedge"
+        started = time.monotonic()
+        self.assertEqual(guard.call("get_item", slow_first, Deadline(2), hedge=True), "hedge")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(guard.stats()["hedge_wins"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,72 @@
+import unittest, os, sys, time, signal, threading
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # paquete 'tests' (backend local y helpers) también al correr el archivo directo
+
+from modules.tracing import Tracer, span, current_trace
+from modules.scheduler import PriorityScheduler
+from modules.profiler import SamplingProfiler
+from tests.helpers import wait_until
+
+class TestTracing(unittest.TestCase):
+    """Spans entre hilos, log de requests lentos y profiler por muestreo"""
+
+    def test_spans_cruzan_el_scheduler(self):
+        tracer = Tracer(slow_threshold=0.01)
+        scheduler = PriorityScheduler(workers=1)
+        def work():
+            with span("data.put_item"):
+                time.sleep(0.02)
+        with self.assertLogs('modules.tracing', level='WARNING') as logs:
+            with tracer.request("set", uuid="u") as trace:
+                scheduler.submit(1, work).result(2)
+        self.assertIsNone(current_trace())
+        self.assertEqual(list(trace.breakdown()), ["queue_wait", "data.put_item"])
+        self.assertIn("SLOW REQUEST: 'set'", logs.output[0])
+        self.assertEqual(tracer.stats(), {"requests": 1, "slow_requests": 1})
+        scheduler.shutdown()
+
+    def test_span_sin_traza_no_falla(self):
+        with span("suelto"):
+            pass
+
+    def test_profiler_escribe_pilas(self):
+        path = os.path.join(ROOT, 'data', 'profile_test.folded')
+        profiler = SamplingProfiler(path, interval=0.001)
+        try:
+            profiler.toggle()
+            time.sleep(0.05)
+            profiler.toggle()
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertTrue(lines)
+            self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+        finally:
+            os.remove(path)
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR2"), "sin SIGUSR2 (Windows)")
+    def test_profiler_toggle_desde_signal_handler(self):
+        """El handler de SIGUSR2 solo marca un evento, el hilo de control hace el toggle"""
+        path = os.path.join(ROOT, 'data', 'profile_signal_test.folded')
+        profiler = SamplingProfiler(path, interval=0.001)
+        toggled_in = []
+        toggle = profiler.toggle
+        profiler.toggle = lambda: (toggled_in.append(threading.current_thread().name), toggle())
+        profiler.start_control_thread()
+        previous = signal.signal(signal.SIGUSR2, lambda signum, frame: profiler.request_toggle())
+        try:
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(wait_until(lambda: profiler.running))
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(wait_until(lambda: not profiler.running))
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(toggled_in, ["profiler-control", "profiler-control"])  # nunca dentro del handler
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,205 @@
+import unittest, os, sys, json, time, shutil, tempfile, threading
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)  # paquete 'tests' (backend local y helpers) también al correr el archivo directo
+
+from modules.write_behind import WriteBehindBuffer, WriteBehindFullError, DEAD_LETTER_FILE
+from modules.data_proxy import DataProxy
+from tests.helpers import FakeTable
+
+def audit(n):
+    return {"id": f"audit-{n}", "action": "set"}
+
+class StrictTable(FakeTable):
+    """FakeTable con put_item que, como DynamoDB, rechaza con ValidationException los items con un string vacío."""
+
+    def put_item(self, Item):
+        self._check(Item)
+        self.items[Item['id']] = Item
+
+    def batch_write_item(self, RequestItems):
+        for request in RequestItems[self.name]:  # un item inválido hace fallar el lote entero
+            self._check(request["PutRequest"]["Item"])
+        return super().batch_write_item(RequestItems)
+
+    @staticmethod
+    def _check(item):
+        if any(value == "" for value in item.values()):
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "An AttributeValue may not contain an empty string"},
+                               "ResponseMetadata": {"HTTPStatusCode": 400}}, "PutItem")
+
+class TestWriteBehind(unittest.TestCase):
+    """Coalescencia por clave, auditoría por request y journal que sobrevive a una caída"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data = StrictTable("CorporateData")
+        self.log = StrictTable("CorporateLog")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def buffer(self, **kwargs):
+        # Intervalo largo: los flushes los hace el test
+        return WriteBehindBuffer(self.data, self.log, self.tmp, flush_interval=3600, **kwargs)
+
+    def test_coalescencia_y_auditoria_por_request(self):
+        buffer = self.buffer()
+        for n in range(40):
+            buffer.submit({"id": "estado", "n": n, "temp": 20.5}, audit(n))
+        buffer.submit({"id": "otro"}, audit(40))
+        self.assertEqual(buffer.pending("estado")["n"], 39)
+        self.assertTrue(buffer.flush())
+
+        self.assertEqual(len(self.data.items), 2)
+        self.assertEqual(self.data.items["estado"]["temp"], Decimal("20.5"))
+        self.assertEqual(len(self.log.items), 41)
+        self.assertEqual(buffer.stats()["coalesced"], 39)
+        self.assertIsNone(buffer.pending("estado"))
+        buffer.close()
+        self.assertEqual(os.listdir(self.tmp), [])  # todo confirmado, no queda journal
+
+    def test_relee_el_journal_despues_de_una_caida(self):
+        crashed = self.buffer()
+        crashed.submit({"id": "a", "n": 1}, audit(1))
+        crashed.submit({"id": "a", "n": 2}, audit(2))
+        crashed.submit({"id": "b", "n": 1}, audit(3))
+        crashed.discard("b")  # un 'set' síncrono posterior
+        # Simula una caída: la última línea quedó a medio escribir y no hay close()
+        crashed._journal.write('{"item": {"id": "a", "n"')
+        crashed._journal.flush()
+
+        recovered = self.buffer()
+        self.assertEqual(recovered.stats()["replayed"], 3)
+        self.assertTrue(recovered.flush())
+        self.assertEqual(self.data.items, {"a": {"id": "a", "n": 2}})
+        self.assertEqual(len(self.log.items), 3)
+        recovered.close()
+
+    def test_flush_fallido_se_reintenta(self):
+        buffer = self.buffer()
+        buffer.submit({"id": "a", "n": 1}, audit(1))
+        original = self.data.batch_write_item
+        self.data.batch_write_item = lambda RequestItems: (_ for _ in ()).throw(ConnectionError("sin red"))
+        self.assertFalse(buffer.flush())
+        buffer.submit({"id": "a", "n": 2}, audit(2))  # más nuevo que el lote que falló
+        self.data.batch_write_item = original
+        self.assertTrue(buffer.flush())
+        self.assertEqual(self.data.items["a"]["n"], 2)
+        self.assertEqual(buffer.stats()["flush_errors"], 1)
+        buffer.close()
+
+    def test_limite_de_pendientes(self):
+        buffer = self.buffer(max_pending=2)
+        buffer.submit({"id": "a"}, audit(1))
+        buffer.submit({"id": "a"}, audit(2))
+        with self.assertRaises(WriteBehindFullError):
+            buffer.submit({"id": "a"}, audit(3))
+        buffer.close()
+
+    def test_item_sin_id_no_toca_el_journal(self):
+        buffer = self.buffer()
+        for item in ({"n": 1}, {"id": None}, ["id"]):
+            with self.assertRaises(ValueError):
+                buffer.submit(item, audit(1))
+        self.assertEqual(os.path.getsize(buffer._segment_path(buffer._segment_index)), 0)
+        self.assertEqual(buffer.stats()["submitted"], 0)
+        buffer.close()
+
+    def test_replay_ignora_registros_invalidos(self):
+        with open(os.path.join(self.tmp, "wal-00000001.jsonl"), 'w', encoding='utf-8') as f:
+            for record in [{"item": {"n": 1}, "audit": audit(1)}, [1, 2], "texto", {"item": {"id": "a"}},
+                           {"item": {"id": None}, "audit": audit(2)}, {"item": {"id": "a", "n": 1}, "audit": audit(3)}]:
+                f.write(json.dumps(record) + "\n")
+        with self.assertLogs('modules.write_behind', level='WARNING') as logs:
+            buffer = self.buffer()  # antes terminaba el proceso con KeyError
+        self.assertEqual(buffer.stats()["replayed"], 1)
+        self.assertEqual(sum("ignorado" in line for line in logs.output), 5)
+        self.assertTrue(buffer.flush())
+        self.assertEqual(self.data.items, {"a": {"id": "a", "n": 1}})
+        buffer.close()
+
+    def test_items_rechazados_van_a_dead_letter(self):
+        buffer = self.buffer()
+        buffer.submit({"id": "a", "n": 1}, audit(1))
+        buffer.submit({"id": "malo", "nombre": ""}, audit(2))  # DynamoDB no acepta strings vacíos
+        buffer.submit({"id": "b", "n": 2.5}, audit(3))
+        with self.assertLogs('modules.write_behind', level='ERROR') as logs:
+            self.assertTrue(buffer.flush())  # el resto del lote se escribe
+        self.assertEqual(sorted(self.data.items), ["a", "b"])
+        self.assertEqual(len(self.log.items), 3)
+        self.assertTrue(any("'malo'" in line for line in logs.output))
+        with open(os.path.join(self.tmp, DEAD_LETTER_FILE), encoding='utf-8') as f:
+            letters = [json.loads(line) for line in f]
+        self.assertEqual([(letter["table"], letter["item"]) for letter in letters], [("CorporateData", {"id": "malo", "nombre": ""})])
+        self.assertIn("empty string", letters[0]["error"])
+        self.assertEqual(buffer.stats()["dead_lettered"], 1)
+        self.assertTrue(buffer.flush())  # no se reintenta
+        self.assertEqual(buffer.stats()["flush_errors"], 0)
+        buffer.close()
+        self.assertEqual(os.listdir(self.tmp), [DEAD_LETTER_FILE])  # los segmentos se borraron
+
+    def block_data_batches(self):
+        """Hace que el próximo BatchWriteItem de CorporateData espere. Devuelve (entró, liberar)."""
+        entered, release = threading.Event(), threading.Event()
+        original = self.data.batch_write_item
+        def blocked(RequestItems):
+            entered.set()
+            release.wait(5)
+            return original(RequestItems)
+        self.data.batch_write_item = blocked
+        return entered, release
+
+    def test_set_sincrono_durante_un_flush(self):
+        proxy = DataProxy(write_behind_dir=self.tmp, write_behind_interval=3600, tables=(self.data, self.log))
+        buffer = proxy.write_behind
+        buffer.submit({"id": "a", "n": "diferido"}, audit(1))
+        entered, release = self.block_data_batches()
+        flusher = threading.Thread(target=buffer.flush)
+        flusher.start()
+        self.assertTrue(entered.wait(5))  # el valor diferido está en vuelo
+
+        result = []
+        setter = threading.Thread(target=lambda: result.append(proxy.set_item({"id": "a", "n": "sincrono"}, "u", "s")))
+        setter.start()
+        time.sleep(0.1)
+        self.assertEqual(result, [])  # el put síncrono espera a que termine el flush en vuelo
+        release.set()
+        flusher.join(5)
+        setter.join(5)
+        self.assertEqual(result[0][1], 200)
+        self.assertEqual(self.data.items["a"]["n"], "sincrono")  # el valor viejo no pisó al síncrono
+        self.assertIsNone(buffer.pending("a"))
+        self.assertTrue(buffer.flush())
+        self.assertEqual(self.data.items["a"]["n"], "sincrono")
+        buffer.close()
+
+    def test_set_sincrono_descarta_el_pendiente(self):
+        proxy = DataProxy(write_behind_dir=self.tmp, write_behind_interval=3600, tables=(self.data, self.log))
+        proxy.write_behind.submit({"id": "a", "n": "diferido"}, audit(1))
+        self.assertEqual(proxy.set_item({"id": "a", "n": "sincrono"}, "u", "s")[1], 200)
+        self.assertIsNone(proxy.write_behind.pending("a"))
+        self.assertTrue(proxy.write_behind.flush())
+        self.assertEqual(self.data.items["a"]["n"], "sincrono")
+        proxy.write_behind.close()
+
+    def test_pending_ignora_valores_reemplazados_en_vuelo(self):
+        buffer = self.buffer()
+        buffer.submit({"id": "a", "n": 1}, audit(1))
+        entered, release = self.block_data_batches()
+        flusher = threading.Thread(target=buffer.flush)
+        flusher.start()
+        self.assertTrue(entered.wait(5))
+        self.assertEqual(buffer.pending("a"), {"id": "a", "n": 1})  # en vuelo
+        buffer.discard("a")
+        self.assertIsNone(buffer.pending("a"))  # ya no se devuelve el valor reemplazado
+        release.set()
+        flusher.join(5)
+        buffer.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)